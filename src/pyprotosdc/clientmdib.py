@@ -10,9 +10,12 @@ from sdc11073.xml_types import msg_types
 from pyprotosdc.mapping.basic_mappers import enum_attr_from_p
 from pyprotosdc.mapping.mapping_helpers import get_p_attr
 from pyprotosdc.actions import ReportAction
+from pyprotosdc.rtbuffer import NumpyRtBuffer
 
 if TYPE_CHECKING:
     from pyprotosdc.consumer.serviceclients.mdibreportingservice import EpisodicReportData
+    from sdc11073.mdib.statecontainers import AbstractStateContainer
+    import numpy as np
     from pyprotosdc.consumer.consumer import GSdcConsumer
 
 LOG_WF_AGE_INTERVAL = 30  # how often a log message is written with mean and standard-deviation of waveforms age
@@ -24,13 +27,36 @@ A_STILL_OUT_OF_RANGE = 2
 A_BACK_IN_RANGE = 3
 
 
+_property_names: dict[type, tuple[str, ...]] = {}
+
+
+def _take_over_values(state: AbstractStateContainer, new_state: AbstractStateContainer):
+    """Same as state.update_from_other_container(new_state), but without copying the values."""
+    cls = state.__class__
+    names = _property_names.get(cls)
+    if names is None:
+        names = tuple(name for name, _ in state.sorted_container_properties())
+        _property_names[cls] = names
+    for name in names:
+        setattr(state, name, getattr(new_state, name))
+    state.node = new_state.node
+
+
 class GClientMdibContainer(consumermdib.ConsumerMdib):
+    # class of the realtime buffers in rt_buffers, NumpyRtBuffer avoids one object per sample (needs numpy)
+    rt_buffer_cls: type[consumermdib.ConsumerRtBuffer | NumpyRtBuffer] = consumermdib.ConsumerRtBuffer
+    # set to True for a provider with priority lanes, see _on_any_report
+    accept_reordered_reports = False
 
     def __init__(self,
                  sdc_consumer: GSdcConsumer,
                  extras_cls: type | None = None,
                  max_realtime_samples: int = 100):
         super().__init__(sdc_consumer, extras_cls, max_realtime_samples)
+        self._is_initialized = False
+        self._initial_mdib_version = 0
+        # mdib version of the last accepted report per action
+        self._last_report_mdib_versions: dict[ReportAction, int] = {}
 
     def init_mdib(self):
         if self._is_initialized:
@@ -38,7 +64,32 @@ class GClientMdibContainer(consumermdib.ConsumerMdib):
         # first start receiving notifications, then call getMdib.
         # Otherwise we might miss notifications.
         self._bind_to_observables()
+        self._load_mdib()
+        self._is_initialized = True
+        self._logger.info('initializing mdib done')
 
+    def reload_all(self):
+        """Delete all data and read the mdib again."""
+        self._logger.info('reload_all called')
+        with self.mdib_lock:
+            self.clear_states()
+            self.rt_buffers.clear()
+            self._load_mdib()
+
+    def get_window(self, handle: str, seconds: float | None = None) -> tuple[np.ndarray, np.ndarray] | None:
+        """Return time stamps and values of the last seconds of waveform handle.
+
+        Only available if rt_buffer_cls is NumpyRtBuffer, see NumpyRtBuffer.get_window.
+        Returns None if no samples of handle were received yet.
+        """
+        if not issubclass(self.rt_buffer_cls, NumpyRtBuffer):
+            raise TypeError(f'get_window needs rt_buffer_cls NumpyRtBuffer, not {self.rt_buffer_cls.__name__}')
+        rt_buffer = self.rt_buffers.get(handle)
+        if rt_buffer is None:
+            return None
+        return rt_buffer.get_window(seconds)
+
+    def _load_mdib(self):
         cl_get_service = self._sdc_client.get_service
         self._logger.info('initializing mdib...')
         response = cl_get_service.get_mdib()
@@ -56,6 +107,8 @@ class GClientMdibContainer(consumermdib.ConsumerMdib):
         else:
             self._logger.warning('found no mdib version in GetMdib response, assuming "0"')
             self.mdib_version = 0
+        self._initial_mdib_version = self.mdib_version
+        self._last_report_mdib_versions.clear()
         self.sequence_id = mdib_version_group.sequence_id
         self._logger.info('setting initial sequence id to {}', mdib_version_group.sequence_id)  # noqa: PLE1205
         if mdib_version_group.instance_id != self.instance_id:
@@ -67,12 +120,16 @@ class GClientMdibContainer(consumermdib.ConsumerMdib):
             for buffered_report in self._buffered_notifications:
                 buffered_report.handler(buffered_report.report, is_buffered_report=True)
             del self._buffered_notifications[:]
-            self._is_initialized = True
-        self._logger.info('initializing mdib done')
+
+    def _on_episodic_report_resumed(self, resumed: bool):
+        if not resumed:
+            self._logger.warning('reports were lost while the EpisodicReport stream was broken, reloading mdib')
+            self.reload_all()
 
     def _bind_to_observables(self):
         # observe properties of sdcClient
         properties.bind(self._sdc_client, any_report=self._on_any_report)
+        properties.bind(self._sdc_client, episodic_report_resumed=self._on_episodic_report_resumed)
 
     def _on_any_report(self, report: EpisodicReportData, is_buffered_report=False):
         handler_lookup = {ReportAction.Waveform: self._on_waveform_report,
@@ -86,62 +143,99 @@ class GClientMdibContainer(consumermdib.ConsumerMdib):
         self.logger.debug('received report %s', report.action)
         handler = handler_lookup[report.action]
 
-        if not self._can_accept_mdib_version('_on_any_report', report.mdib_version_group.mdib_version):
-            self._logger.warn('ignoring %s, mdib version too old (got %d, expect %d)',
-                              report.action, report.mdib_version_group.mdib_version, self.mdib_version + 1)
+        mdib_version = report.mdib_version_group.mdib_version
+        if self.accept_reordered_reports:
+            # A provider with priority lanes sends e.g. an alert report before an older waveform report.
+            # Therefore a report is only too old if it is older than the last report of the same action;
+            # outdated states are still detected by their state version.
+            min_mdib_version = self._last_report_mdib_versions.get(report.action, self._initial_mdib_version)
+            if not self.MDIB_VERSION_CHECK_DISABLED and mdib_version < min_mdib_version:
+                self._logger.warning('ignoring {}, mdib version too old (got {}, expect >= {})',  # noqa: PLE1205
+                                     report.action, mdib_version, min_mdib_version)
+                return
+        elif not self._can_accept_mdib_version(mdib_version, '_on_any_report'):
             return
+        self._last_report_mdib_versions[report.action] = mdib_version
+        current_mdib_version = self.mdib_version
         try:
             return handler(report, is_buffered_report)
-        except Exception as ex:
-            raise
+        finally:
+            self.mdib_version = max(self.mdib_version, current_mdib_version)  # never go back
+
+    def _report_states(self, report_data: EpisodicReportData) -> list[AbstractStateContainer]:
+        """The states of the report, with the descriptor containers of this mdib."""
+        states = list(report_data.states)  # decodes the states that the pipeline of the consumer did not decode
+        for state in states:
+            state.descriptor_container = self.descriptions.handle.get_one(state.DescriptorHandle)
+        return states
+
+    def apply_states(self, state_containers: list[AbstractStateContainer], report_name: str,
+                     is_context_state: bool = False) -> dict[str, AbstractStateContainer]:
+        """Apply the states of one report in one pass. The caller holds the mdib_lock.
+
+        Returns the added or updated states of the mdib by descriptor handle (by handle for context states).
+        A state whose descriptor version does not match gets no descriptor container, all mismatches of the report
+        are logged in one message.
+        The index keys of a state (handle, descriptor handle, NODETYPE) are not changed by an update,
+        therefore updated states are not re-indexed, and the new states are indexed with one call.
+        The states of the report are decoded for this update only, therefore their values are not copied.
+        """
+        if is_context_state:
+            multikey = self.context_states
+            lookup = multikey.handle
+        else:
+            multikey = self.states
+            lookup = multikey.descriptor_handle
+        changed = {}
+        new_states = []
+        updated_count = 0
+        version_mismatches = []
+        for sc in state_containers:
+            descriptor_container = sc.descriptor_container
+            if descriptor_container is not None and descriptor_container.DescriptorVersion != sc.DescriptorVersion:
+                version_mismatches.append(f'{sc.DescriptorHandle}({sc.DescriptorVersion}!='
+                                          f'{descriptor_container.DescriptorVersion})')
+                sc.descriptor_container = None
+            key = sc.Handle if is_context_state else sc.DescriptorHandle
+            try:
+                old_state_container = lookup.get_one(key, allow_none=True)
+            except (RuntimeError, ValueError) as ex:
+                self._logger.error('{}, get_one on states: {}', report_name, ex)  # noqa: PLE1205
+                continue
+            if old_state_container is None:
+                new_states.append(sc)
+                changed[key] = sc
+            elif self._has_new_state_usable_state_version(old_state_container, sc, report_name):
+                _take_over_values(old_state_container, sc)
+                updated_count += 1
+                changed[key] = old_state_container
+        multikey.add_objects(new_states)
+        if version_mismatches:
+            self._logger.warning('{}: descriptor version mismatch of {} states: {}',  # noqa: PLE1205
+                                 report_name, len(version_mismatches), ', '.join(version_mismatches))
+        self._logger.debug('{}: {} new, {} updated states', report_name, len(new_states),  # noqa: PLE1205
+                           updated_count)
+        return changed
+
+    def _set_report_mdib_version(self, report_data: EpisodicReportData):
+        # caller holds the mdib_lock
+        self.mdib_version = report_data.mdib_version_group.mdib_version
+        if report_data.mdib_version_group.sequence_id != self.sequence_id:
+            self.sequence_id = report_data.mdib_version_group.sequence_id
 
     def _on_episodic_metric_report(self, report_data: EpisodicReportData, is_buffered_report):
-        now = time.time()
         metrics_by_handle = {}
-        max_age = 0
-        min_age = 0
-        state_containers = []
-        report = report_data.p_response.report.metric
-        for report_part in report.abstract_metric_report.report_part:
-            state_containers.extend(report_data.msg_reader.read_states(report_part.metric_state, self))
         try:
+            state_containers = self._report_states(report_data)
             with self.mdib_lock:
-                self.mdib_version = report_data.mdib_version_group.mdib_version
-                if report_data.mdib_version_group.sequence_id != self.sequence_id:
-                    self.sequence_id = report_data.mdib_version_group.sequence_id
-                for sc in state_containers:
-                    if sc.descriptor_container is not None and \
-                            sc.descriptor_container.DescriptorVersion != sc.DescriptorVersion:
-                        self._logger.warn(
-                            '_onEpisodicMetricReport: metric "{}": descriptor version expect "{}", found "{}"',
-                            sc.descriptorHandle, sc.DescriptorVersion, sc.descriptor_container.DescriptorVersion)
-                        sc.descriptor_container = None
-                    try:
-                        old_state_container = self.states.descriptor_handle.get_one(sc.DescriptorHandle,
-                                                                                    allow_none=True)
-                    except RuntimeError as ex:
-                        self._logger.error('_onEpisodicMetricReport, get_one on states: {}', ex)
-                        continue
-                    desc_h = sc.DescriptorHandle
-                    metrics_by_handle[desc_h] = sc  # metric
-                    if old_state_container is not None:
-                        if self._has_new_state_usable_state_version(old_state_container, sc, 'EpisodicMetricReport',
-                                                                    is_buffered_report):
-                            old_state_container.update_from_other_container(sc)
-                            self.states.update_object(old_state_container)
-                    else:
-                        self.states.add_object(sc)
-
-                    if sc.MetricValue is not None:
-                        observation_time = sc.MetricValue.DeterminationTime
-                        if observation_time is None:
-                            self._logger.warn(
-                                '_onEpisodicMetricReport: metric {} version {} has no DeterminationTime',
-                                desc_h, sc.StateVersion)
-                        else:
-                            age = now - observation_time
-                            min_age = min(min_age, age)
-                            max_age = max(max_age, age)
+                self._set_report_mdib_version(report_data)
+                self.apply_states(state_containers, 'EpisodicMetricReport')
+            metrics_by_handle = {sc.DescriptorHandle: sc for sc in state_containers}
+            now = time.time()
+            ages = [now - sc.MetricValue.DeterminationTime for sc in state_containers
+                    if sc.MetricValue is not None and sc.MetricValue.DeterminationTime is not None]
+            max_age = max(ages, default=0)
+            min_age = min(ages, default=0)
             # shall_log = self.metric_time_warner.getOutOfDeterminationTimeLogState(
             #     min_age, max_age, self.DETERMINATIONTIME_WARN_LIMIT)
             # if shall_log == A_OUT_OF_RANGE:
@@ -164,82 +258,42 @@ class GClientMdibContainer(consumermdib.ConsumerMdib):
 
     def _on_episodic_alert_report(self, report_data: EpisodicReportData, is_buffered_report):
         alert_by_handle = {}
-        report = report_data.p_response.report
         try:
-            state_containers = []
-            for report_part in report.alert.abstract_alert_report.report_part:
-                state_containers.extend(report_data.msg_reader.read_states(report_part.alert_state, self))
+            state_containers = self._report_states(report_data)
             with self.mdib_lock:
-                self.mdib_version = report_data.mdib_version_group.mdib_version
-                if report_data.mdib_version_group.sequence_id != self.sequence_id:
-                    self.sequence_id = report_data.mdib_version_group.sequence_id
-                for sc in state_containers:
-                    if sc.descriptor_container is not None and \
-                            sc.descriptor_container.DescriptorVersion != sc.DescriptorVersion:
-                        self._logger.warn(
-                            '_on_episodic_alert_report: alert "{}": descriptor version expect "{}", found "{}"',
-                            sc.descriptorHandle, sc.DescriptorVersion, sc.descriptor_container.DescriptorVersion)
-                        sc.descriptor_container = None
-                    try:
-                        old_state_container = self.states.descriptor_handle.get_one(sc.DescriptorHandle,
-                                                                                    allow_none=True)
-                    except RuntimeError as ex:
-                        self._logger.error('_onEpisodicAlertReport, get_one on states: {}', ex)
-                        continue
-                    if old_state_container is not None:
-                        if self._has_new_state_usable_state_version(old_state_container, sc, 'EpisodicAlertReport',
-                                                                    is_buffered_report):
-                            old_state_container.update_from_other_container(sc)
-                            self.states.update_object(old_state_container)
-                            alert_by_handle[old_state_container.DescriptorHandle] = old_state_container
-                    else:
-                        self.states.add_object(sc)
-                        alert_by_handle[sc.DescriptorHandle] = sc
+                self._set_report_mdib_version(report_data)
+                alert_by_handle = self.apply_states(state_containers, 'EpisodicAlertReport')
         finally:
             self.alert_by_handle = alert_by_handle  # update observable
 
     def _on_waveform_report(self, report_data: EpisodicReportData, is_buffered_report):
-        report = report_data.p_response.report
         waveform_by_handle = {}
         waveform_age = {}  # collect age of all waveforms in this report,
         # and make one report if age is above warn limit (instead of multiple)
         try:
-            all_states = report_data.msg_reader.read_states(report.waveform.state, self)
-
+            all_states = self._report_states(report_data)
             with self.mdib_lock:
-                self.mdib_version = report_data.mdib_version_group.mdib_version
-                if report_data.mdib_version_group.sequence_id != self.sequence_id:
-                    self.sequence_id = report_data.mdib_version_group.sequence_id
+                self._set_report_mdib_version(report_data)
+                self.apply_states(all_states, 'WaveformReport')
                 for new_sac in all_states:
                     d_handle = new_sac.DescriptorHandle
-                    descriptor_container = new_sac.descriptor_container
-                    if descriptor_container is None:
-                        self._logger.warn('_onWaveformReport: No Descriptor found for handle "{}"', d_handle)
-
-                    old_state_container = self.states.descriptor_handle.get_one(d_handle, allow_none=True)
-                    if old_state_container is None:
-                        self.states.add_object(new_sac)
-                        current_sc = new_sac
-                    else:
-                        if self._has_new_state_usable_state_version(old_state_container, new_sac,
-                                                                    'WaveformReport', is_buffered_report):
-                            # update old state container from new one
-                            old_state_container.update_from_other_container(new_sac)
-                            self.states.update_object(old_state_container)
-                        current_sc = old_state_container  # we will need it later
+                    current_sc = self.states.descriptor_handle.get_one(d_handle)
                     waveform_by_handle[d_handle] = current_sc
                     # add to Waveform Buffer
                     rt_buffer = self.rt_buffers.get(d_handle)
                     if rt_buffer is None:
-                        if descriptor_container is not None:
-                            # read sample period
-                            try:
-                                sample_period = descriptor_container.SamplePeriod or 0
-                            except AttributeError:
-                                sample_period = 0  # default
-                        rt_buffer = consumermdib.ConsumerRtBuffer(sample_period=sample_period,
-                                                                  max_samples=self._max_realtime_samples)
+                        descriptor_container = self.descriptions.handle.get_one(d_handle)
+                        # read sample period
+                        try:
+                            sample_period = descriptor_container.SamplePeriod or 0
+                        except AttributeError:
+                            sample_period = 0  # default
+                        rt_buffer = self.rt_buffer_cls(sample_period=sample_period,
+                                                       max_samples=self._max_realtime_samples)
                         self.rt_buffers[d_handle] = rt_buffer
+                    if isinstance(rt_buffer, NumpyRtBuffer):
+                        rt_buffer.add_realtime_sample_array(new_sac)
+                        continue
                     # last_sc = rt_buffer.last_sc
                     rt_sample_containers = rt_buffer.mk_rt_sample_containers(new_sac)
                     rt_buffer.add_rt_sample_containers(rt_sample_containers)
@@ -248,11 +302,6 @@ class GClientMdibContainer(consumermdib.ConsumerMdib):
                     if len(rt_sample_containers) > 0:
                         waveform_age[d_handle] = rt_sample_containers[-1].age
 
-                    # check descriptor version
-                    if descriptor_container.DescriptorVersion != new_sac.DescriptorVersion:
-                        self._logger.error('_onWaveformReport: descriptor {}: expect version "{}", found "{}"',
-                                           d_handle, new_sac.DescriptorVersion, descriptor_container.DescriptorVersion)
-
             # if len(waveform_age) > 0:
             #     min_age = min(waveform_age.values())
             #     max_age = max(waveform_age.values())
@@ -284,113 +333,33 @@ class GClientMdibContainer(consumermdib.ConsumerMdib):
             self.waveform_by_handle = waveform_by_handle
 
     def _on_episodic_component_report(self, report_data: EpisodicReportData, is_buffered_report):
-        report = report_data.p_response.report
         component_by_handle = {}
-        state_containers = []
-        for report_part in report.component.abstract_component_report.report_part:
-            state_containers.extend(report_data.msg_reader.read_states(report_part.component_state, self))
+        state_containers = self._report_states(report_data)
         try:
             with self.mdib_lock:
-                self.mdib_version = report_data.mdib_version_group.mdib_version
-                if report_data.mdib_version_group.sequence_id != self.sequence_id:
-                    self.sequence_id = report_data.mdib_version_group.sequence_id
-                for sc in state_containers:
-                    desc_h = sc.DescriptorHandle
-                    try:
-                        old_state_container = self.states.descriptor_handle.get_one(desc_h, allow_none=True)
-                    except RuntimeError as ex:
-                        self._logger.error('_on_episodic_component_report, get_one on states: {}', ex)
-                        continue
-
-                    if old_state_container is None:
-                        self.states.add_object(sc)
-                        self._logger.info(
-                            '_onEpisodicComponentReport: new component state handle = {} DescriptorVersion={}',
-                            desc_h, sc.DescriptorVersion)
-                        component_by_handle[sc.descriptorHandle] = sc
-                    else:
-                        if self._has_new_state_usable_state_version(old_state_container, sc, 'EpisodicComponentReport',
-                                                                    is_buffered_report):
-                            self._logger.info(
-                                '_onEpisodicComponentReport: updated component state, handle="{}" DescriptorVersion={}',
-                                desc_h, sc.DescriptorVersion)
-                            old_state_container.update_from_other_container(sc)
-                            self.states.update_object(old_state_container)
-                            component_by_handle[old_state_container.DescriptorHandle] = old_state_container
+                self._set_report_mdib_version(report_data)
+                component_by_handle = self.apply_states(state_containers, 'EpisodicComponentReport')
         finally:
             self.component_by_handle = component_by_handle
 
     def _on_episodic_operational_state_report(self, report_data: EpisodicReportData, is_buffered_report):
-        report = report_data.p_response.report
         operation_by_handle = {}
-        state_containers = []
-        for report_part in report.operational_state.abstract_operational_state_report.report_part:
-            state_containers.extend(report_data.msg_reader.read_states(report_part.operation_state, self))
+        state_containers = self._report_states(report_data)
         try:
             with self.mdib_lock:
-                self.mdib_version = report_data.mdib_version_group.mdib_version
-                if report_data.mdib_version_group.sequence_id != self.sequence_id:
-                    self.sequence_id = report_data.mdib_version_group.sequence_id
-                for sc in state_containers:
-                    desc_h = sc.DescriptorHandle
-                    try:
-                        old_state_container = self.states.descriptor_handle.get_one(desc_h, allow_none=True)
-                    except RuntimeError as ex:
-                        self._logger.error('_on_episodic_operational_state_report, get_one on states: {}', ex)
-                        continue
-
-                    if old_state_container is None:
-                        self.states.add_object(sc)
-                        self._logger.info(
-                            '_on_episodic_operational_state_report: new operational state handle = {} DescriptorVersion={}',
-                            desc_h, sc.DescriptorVersion)
-                        operation_by_handle[sc.descriptorHandle] = sc
-                    else:
-                        if self._has_new_state_usable_state_version(old_state_container, sc,
-                                                                    'EpisodicOperationalStateReport',
-                                                                    is_buffered_report):
-                            self._logger.info(
-                                '_on_episodic_operational_state_report: updated component state, handle="{}" DescriptorVersion={}',
-                                desc_h, sc.DescriptorVersion)
-                            old_state_container.update_from_other_container(sc)
-                            self.states.update_object(old_state_container)
-                            operation_by_handle[old_state_container.DescriptorHandle] = old_state_container
+                self._set_report_mdib_version(report_data)
+                operation_by_handle = self.apply_states(state_containers, 'EpisodicOperationalStateReport')
         finally:
             self.operation_by_handle = operation_by_handle
 
     def _on_episodic_context_report(self, report_data: EpisodicReportData, is_buffered_report):
-        report = report_data.p_response.report
         context_by_handle = {}
-        state_containers = []
-        for report_part in report.context.abstract_context_report.report_part:
-            state_containers.extend(report_data.msg_reader.read_states(report_part.context_state, self))
+        state_containers = self._report_states(report_data)
         try:
             with self.mdib_lock:
-                self.mdib_version = report_data.mdib_version_group.mdib_version
-                if report_data.mdib_version_group.sequence_id != self.sequence_id:
-                    self.sequence_id = report_data.mdib_version_group.sequence_id
-                for sc in state_containers:
-                    try:
-                        old_state_container = self.context_states.handle.get_one(sc.Handle, allow_none=True)
-                    except RuntimeError as ex:
-                        self._logger.error('_onEpisodicContextReport, get_one on contextStates: {}', ex)
-                        continue
-
-                    if old_state_container is None:
-                        self.context_states.add_object(sc)
-                        self._logger.info(
-                            '_on_episodic_context_report: new context state handle = {} Descriptor Handle={} Assoc={}, Validators={}',
-                            sc.Handle, sc.DescriptorHandle, sc.ContextAssociation, sc.Validator)
-                        context_by_handle[sc.Handle] = sc
-                    else:
-                        if self._has_new_state_usable_state_version(old_state_container, sc, 'EpisodicContextReport',
-                                                                    is_buffered_report):
-                            self._logger.info(
-                                '_on_episodic_context_report: updated context state handle = {} Descriptor Handle={} Assoc={}, Validators={}',
-                                sc.Handle, sc.DescriptorHandle, sc.ContextAssociation, sc.Validator)
-                            old_state_container.update_from_other_container(sc)
-                            self.context_states.update_object(old_state_container)
-                            context_by_handle[old_state_container.Handle] = old_state_container
+                self._set_report_mdib_version(report_data)
+                context_by_handle = self.apply_states(state_containers, 'EpisodicContextReport',
+                                                      is_context_state=True)
         finally:
             self.context_by_handle = context_by_handle
 
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+import grpc
+from sdc11073.definitions_sdc import SdcV1Definitions
+
+from pyprotosdc.consumer.serviceclients.getservice import AioGetServiceWrapper
+from pyprotosdc.consumer.serviceclients.setservice import AioSetServiceWrapper
+from pyprotosdc.consumer.serviceclients.metadataservice import AioMetadataServiceWrapper
+from pyprotosdc.consumer.serviceclients.mdibreportingservice import AioMdibReportingServiceWrapper
+from .operations import GOperationsManager
+from ..msgreader import MessageReader
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterable
+    from decimal import Decimal
+    from sdc11073.certloader import SSLContextContainer
+    from pyprotosdc.actions import ReportAction
+    from pyprotosdc.discovery.service import Service
+    from pyprotosdc.consumer.serviceclients.getservice import GetMdibResponseData
+    from pyprotosdc.consumer.serviceclients.mdibreportingservice import EpisodicReportData
+    from .operations import OperationResult
+
+
+class AsyncGSdcConsumer:
+    """GSdcConsumer for asyncio applications.
+
+    It uses a grpc.aio channel, all streams are read by the event loop. No thread is started,
+    therefore one event loop can drive the consumers of many providers.
+    Create and use it in the event loop, and close it when done (or use it as async context manager):
+
+        async with AsyncGSdcConsumer(address) as consumer:
+            mdib = await consumer.get_mdib()
+            async for report in consumer.episodic_reports(filter=[ReportAction.EpisodicMetricReport]):
+                ...
+    """
+
+    def __init__(self, ip: str, ssl_context_container: SSLContextContainer | None = None):
+        self._ssl_context_container = ssl_context_container
+        if ip.startswith('http'):
+            netloc = urlparse(ip).netloc
+        else:
+            netloc = ip
+        if ssl_context_container is None:
+            self.channel = grpc.aio.insecure_channel(netloc)
+        else:
+            self.channel = grpc.aio.secure_channel(netloc, self._ssl_context_container.client_context)
+        self.sdc_definitions = SdcV1Definitions
+        self.log_prefix = ''
+        self._logger = logging.getLogger('sdc.client')
+        self.msg_reader = MessageReader(self._logger)
+        self.metadata_service = AioMetadataServiceWrapper(self.channel)
+        self.get_service = AioGetServiceWrapper(self.channel, self.msg_reader)
+        self.set_service = AioSetServiceWrapper(self.channel, self.msg_reader)
+        self._event_service = AioMdibReportingServiceWrapper(self.channel, self.msg_reader)
+        self._operations_manager = GOperationsManager(self.log_prefix)
+        self.set_service.set_operations_manager(self._operations_manager)
+
+    async def get_mdib(self) -> GetMdibResponseData:
+        return await self.get_service.get_mdib()
+
+    def episodic_reports(self, filter: Iterable[ReportAction | str] | None = None
+                         ) -> AsyncIterator[EpisodicReportData]:
+        """Async iterator over the reports of a new EpisodicReport stream.
+
+        :param filter: the actions of the reports, None means all
+        """
+        return self._event_service.episodic_reports(filter)
+
+    async def subscribe_operation_invoked_reports(self):
+        """Subscribe OperationInvokedReports. The set methods do this with the first operation."""
+        await self.set_service.OperationInvokedReport()
+
+    async def set_value(self, operation_handle: str, value: Decimal) -> OperationResult:
+        return await self.set_service.set_value(operation_handle, value)
+
+    async def set_string(self, operation_handle: str, value: str) -> OperationResult:
+        return await self.set_service.set_string(operation_handle, value)
+
+    async def activate(self, operation_handle: str, values: list) -> OperationResult:
+        return await self.set_service.activate(operation_handle, values)
+
+    async def close(self):
+        await self.set_service.close()
+        await self.channel.close()
+
+    async def __aenter__(self) -> AsyncGSdcConsumer:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @classmethod
+    def from_service(cls,
+                     service: Service,
+                     ssl_context_container: SSLContextContainer | None = None):
+        """Construct an AsyncGSdcConsumer from a Service.
+
+        :param service: a Service instance
+        :param ssl_context_container: a ssl context or None
+        :return:
+        """
+        device_locations = service.x_addrs
+        if not device_locations:
+            raise RuntimeError(f'discovered Service has no address! {service}')
+        return cls(device_locations[0], ssl_context_container)
@@ -18,6 +18,7 @@ from ..msgreader import MessageReader
 if TYPE_CHECKING:
     from sdc11073.certloader import SSLContextContainer
     from pyprotosdc.discovery.service import Service
+    from pyprotosdc.consumer.reportpipeline import ReportPipelineStats
     from org.somda.protosdc.proto.model.sdc_messages_pb2 import OperationInvokedReportStream
 
 
@@ -37,6 +38,8 @@ class GSdcConsumer:
     system_error_report: properties.ObservableProperty()
 
     any_report = properties.ObservableProperty()  # all reports can be observed here
+    # True if a broken EpisodicReport stream was resumed without losing reports, False if reports were lost
+    episodic_report_resumed = properties.ObservableProperty(fire_only_on_changed_value=False)
 
     def __init__(self, ip: str, ssl_context_container: SSLContextContainer | None = None):
         self._ssl_context_container = ssl_context_container
@@ -62,6 +65,7 @@ class GSdcConsumer:
         self._operations_manager = GOperationsManager(self.log_prefix)
 
         properties.bind(self._event_service, episodic_report=self._on_episodic_report)
+        properties.bind(self._event_service, episodic_report_resumed=self._on_episodic_report_resumed)
         properties.bind(self.set_service, operation_invoked_report=self._on_operation_invoked_report)
         self.all_subscribed = False
 
@@ -80,6 +84,10 @@ class GSdcConsumer:
         # Todo: How does this work?
         return True
 
+    def get_report_pipeline_stats(self) -> ReportPipelineStats | None:
+        """See MdibReportingServiceWrapper.decode_workers."""
+        return self._event_service.get_pipeline_stats()
+
     def _on_episodic_report(self, episodic_report_data: EpisodicReportData):
         """provide data via the usual observables."""
         self.any_report = episodic_report_data
@@ -100,6 +108,9 @@ class GSdcConsumer:
         else:
             raise ValueError(f'_on_episodic_report: dont know how to handle {episodic_report_data.action}')
 
+    def _on_episodic_report_resumed(self, resumed: bool):
+        self.episodic_report_resumed = resumed
+
     def _on_operation_invoked_report(self, op_invoked_report_stream: OperationInvokedReportStream):
         """provide data via the usual observables."""
         op_invoked = op_invoked_report_stream.operation_invoked
@@ -51,7 +51,9 @@ class GOperationsManager(object):
         self._logger = loghelper.get_logger_adapter('sdc.client.op_mgr', log_prefix)
         self._transactions: dict[int, _OperationData] = {}
         self._transactions_lock = Lock()
-        self._last_operation_invoked_reports: deque[OperationInvokedReportMsg.ReportPartMsg] = deque(maxlen=50)
+        # report parts of unknown transactions. The OperationInvokedReport can arrive before the set response.
+        self._last_operation_invoked_reports: deque[tuple[OperationInvokedReportMsg,
+                                                          OperationInvokedReportMsg.ReportPartMsg]] = deque(maxlen=50)
 
     def watch_operation(self, response: AnySetServiceResponse) -> Future:
         """Wait for a final operation result and fill response with data.
@@ -78,6 +80,11 @@ class GOperationsManager(object):
                               transaction_id, invocation_state, short_action)
             with self._transactions_lock:
                 self._transactions[int(transaction_id)] = _OperationData(weakref.ref(fut), response, [])
+                early_reports = [(operation_invoked, report_part)
+                                 for operation_invoked, report_part in self._last_operation_invoked_reports
+                                 if report_part.invocation_info.transaction_id.unsigned_int == transaction_id]
+            for operation_invoked, report_part in early_reports:
+                self._on_report_part(operation_invoked, report_part)
         return fut
 
     def on_operation_invoked_report(self, operation_invoked: OperationInvokedReportMsg):
@@ -88,49 +95,51 @@ class GOperationsManager(object):
         corresponding _OperationData. That makes invocation result available to the caller of an operation."""
         for report_part in operation_invoked.report_part:
             transaction_id = report_part.invocation_info.transaction_id.unsigned_int
-            invocation_state = enum_from_p(report_part.invocation_info,
-                                           'invocation_state',
-                                           msg_types.InvocationState)
-            if transaction_id in self._transactions:
-                # keep report part so that it can later be added to OperationResult
-                self._transactions[transaction_id].report_parts.append(report_part)
-            else:
-                continue  # this is not one of our operations
-
-            if invocation_state in self.nonFinalOperationStates:
-                self._logger.info('transaction id %d: state = %s, still waiting for a final state...',
-                                   transaction_id, invocation_state)
-                continue
-
             with self._transactions_lock:
-                operation_data = self._transactions.pop(int(transaction_id), None)
+                if transaction_id not in self._transactions:
+                    # not one of our operations, or watch_operation is not yet called for it
+                    self._last_operation_invoked_reports.append((operation_invoked, report_part))
+                    continue
+            self._on_report_part(operation_invoked, report_part)
+
+    def _on_report_part(self, operation_invoked: OperationInvokedReportMsg,
+                        report_part: OperationInvokedReportMsg.ReportPartMsg):
+        transaction_id = report_part.invocation_info.transaction_id.unsigned_int
+        invocation_state = enum_from_p(report_part.invocation_info,
+                                       'invocation_state',
+                                       msg_types.InvocationState)
+        with self._transactions_lock:
+            operation_data = self._transactions.get(transaction_id)
             if operation_data is None:
-                # this was not my transaction
-                self._logger.debug('transactionId {} is not registered!', transaction_id)
-                continue
-
-            future_obj = operation_data.future_ref()
-            if future_obj is None:
-                # client gave up.
-                self._logger.info('transactionId {} given up', transaction_id)
-                continue
-            else:
-                self._logger.info('final state %s detected for transaction %d', invocation_state, transaction_id)
-                info = msg_types.InvocationInfo()
-                generic_from_p(report_part.invocation_info, info)
-                src = generic_from_p(report_part.invocation_source)
-                op_handle = get_p_attr(report_part, 'OperationHandleRef').string
-                op_target_handle = get_p_attr(report_part, 'OperationTarget').string
-
-                op_result = OperationResult(info, src,
-                                            op_handle,
-                                            op_target_handle,
-                                            operation_invoked,
-                                            operation_data.report_parts)
-
-                if info.InvocationState == msg_types.InvocationState.FAILED:
-                    self._logger.warn('transaction Id {} finished with error: error={}, error-message={}',
-                                      transaction_id, info.InvocationError, info.InvocationErrorMessage)
-                else:
-                    self._logger.info('transaction Id {} ok', transaction_id)
-                future_obj.set_result(op_result)
+                return
+            # keep report part so that it can later be added to OperationResult
+            operation_data.report_parts.append(report_part)
+            if invocation_state in self.nonFinalOperationStates:
+                self._logger.info('transaction id %d: state = %s, still waiting for a final state...',
+                                  transaction_id, invocation_state)
+                return
+            del self._transactions[transaction_id]
+        future_obj = operation_data.future_ref()
+        if future_obj is None:
+            # client gave up.
+            self._logger.info('transactionId {} given up', transaction_id)
+            return
+        self._logger.info('final state %s detected for transaction %d', invocation_state, transaction_id)
+        info = msg_types.InvocationInfo()
+        generic_from_p(report_part.invocation_info, info)
+        src = generic_from_p(report_part.invocation_source)
+        op_handle = get_p_attr(report_part, 'OperationHandleRef').string
+        op_target_handle = get_p_attr(report_part, 'OperationTarget').string
+
+        op_result = OperationResult(info, src,
+                                    op_handle,
+                                    op_target_handle,
+                                    operation_invoked,
+                                    operation_data.report_parts)
+
+        if info.InvocationState == msg_types.InvocationState.FAILED:
+            self._logger.warn('transaction Id {} finished with error: error={}, error-message={}',
+                              transaction_id, info.InvocationError, info.InvocationErrorMessage)
+        else:
+            self._logger.info('transaction Id {} ok', transaction_id)
+        future_obj.set_result(op_result)
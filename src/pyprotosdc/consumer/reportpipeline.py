@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from concurrent.futures import Future
+
+
+@dataclass
+class StageLatency:
+    """Latency of the last reports in a stage, in seconds."""
+    count: int
+    min: float | None
+    max: float | None
+    avg: float | None
+
+    @classmethod
+    def from_values(cls, values) -> StageLatency:
+        if not values:
+            return cls(0, None, None, None)
+        return cls(len(values), min(values), max(values), sum(values) / len(values))
+
+
+@dataclass
+class ReportPipelineStats:
+    received_reports: int
+    applied_reports: int
+    decode_queue_depth: int  # received, not yet decoded
+    apply_queue_depth: int  # received, not yet applied (includes decode_queue_depth)
+    apply_queue_high_water_mark: int
+    decode_wait: StageLatency  # receive until a decode worker starts
+    decode: StageLatency
+    apply_wait: StageLatency  # decoded until the apply stage takes it (waits for older reports)
+    apply: StageLatency  # time of the observers
+    total: StageLatency  # receive until applied
+
+
+class _PipelineEntry:
+    __slots__ = ('future', 'received', 'decode_started', 'decoded')
+
+    def __init__(self, received: float):
+        self.future: Future | None = None
+        self.received = received
+        self.decode_started: float | None = None
+        self.decoded: float | None = None
+
+
+class ReportPipeline:
+    """Decodes received reports in worker threads and applies them in the order of the stream.
+
+    The reader thread only calls put with the raw message. decode runs in decode_workers threads, apply runs in one
+    thread, in the order of put. The order of put is the order of the provider, this is the mdib version order
+    (or the order of its priority lanes), therefore the apply stage does not need to know mdib versions.
+    put blocks if max_pending reports are not applied yet, so a slow apply stage still slows down the stream.
+    """
+    latency_samples = 1000  # number of values per stage for the statistics
+
+    def __init__(self, decode: Callable[[Any], Any], apply: Callable[[Any], None],
+                 decode_workers: int, max_pending: int = 1000, name: str = 'report_pipeline'):
+        self._decode = decode
+        self._apply = apply
+        self._logger = logging.getLogger('sdc.grpc.cl.pipeline')
+        self._executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix=f'{name}_decode')
+        self._pending: queue.Queue[_PipelineEntry | None] = queue.Queue(maxsize=max_pending)
+        self._not_decoded = 0
+        self._counter_lock = threading.Lock()
+        self.received_reports = 0
+        self.applied_reports = 0
+        self.high_water_mark = 0
+        self._decode_wait = deque(maxlen=self.latency_samples)
+        self._decode_times = deque(maxlen=self.latency_samples)
+        self._apply_wait = deque(maxlen=self.latency_samples)
+        self._apply_times = deque(maxlen=self.latency_samples)
+        self._total_times = deque(maxlen=self.latency_samples)
+        self._apply_thread = threading.Thread(target=self._run_apply, name=f'{name}_apply', daemon=True)
+        self._apply_thread.start()
+
+    def put(self, message: Any):
+        entry = _PipelineEntry(time.monotonic())
+        with self._counter_lock:
+            self._not_decoded += 1
+            self.received_reports += 1
+        entry.future = self._executor.submit(self._run_decode, entry, message)
+        self._pending.put(entry)
+        self.high_water_mark = max(self.high_water_mark, self._pending.qsize())
+
+    def _run_decode(self, entry: _PipelineEntry, message: Any) -> Any:
+        entry.decode_started = time.monotonic()
+        try:
+            return self._decode(message)
+        finally:
+            entry.decoded = time.monotonic()
+            with self._counter_lock:
+                self._not_decoded -= 1
+
+    def _run_apply(self):
+        while True:
+            entry = self._pending.get()
+            try:
+                if entry is None:
+                    return
+                try:
+                    data = entry.future.result()
+                    start = time.monotonic()
+                    self._apply(data)
+                except:
+                    self._logger.error(traceback.format_exc())
+                    continue
+                now = time.monotonic()
+                self.applied_reports += 1
+                self._decode_wait.append(entry.decode_started - entry.received)
+                self._decode_times.append(entry.decoded - entry.decode_started)
+                self._apply_wait.append(start - entry.decoded)
+                self._apply_times.append(now - start)
+                self._total_times.append(now - entry.received)
+            finally:
+                self._pending.task_done()
+
+    def join(self):
+        """Wait until all received reports are applied."""
+        self._pending.join()
+
+    def stop(self):
+        """Apply the received reports and end the threads."""
+        self._pending.put(None)
+        self._apply_thread.join()
+        self._executor.shutdown()
+
+    def get_stats(self) -> ReportPipelineStats:
+        return ReportPipelineStats(received_reports=self.received_reports,
+                                   applied_reports=self.applied_reports,
+                                   decode_queue_depth=self._not_decoded,
+                                   apply_queue_depth=self._pending.qsize(),
+                                   apply_queue_high_water_mark=self.high_water_mark,
+                                   decode_wait=StageLatency.from_values(self._decode_wait.copy()),
+                                   decode=StageLatency.from_values(self._decode_times.copy()),
+                                   apply_wait=StageLatency.from_values(self._apply_wait.copy()),
+                                   apply=StageLatency.from_values(self._apply_times.copy()),
+                                   total=StageLatency.from_values(self._total_times.copy()))
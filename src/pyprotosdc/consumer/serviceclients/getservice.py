@@ -54,6 +54,23 @@ class GetServiceWrapper():
         self._msg_reader = msg_reader
 
     def get_mdib(self) -> GetMdibResponseData:
+        response = self._stub.GetMdib(self._mk_get_mdib_request())
+        return self._read_get_mdib_response(response)
+
+    def get_md_description(self, handles: list[str] | None = None) -> GetMdDescriptionResponseData:
+        response = self._stub.GetMdDescription(self._mk_get_md_description_request(handles))
+        return self._read_get_md_description_response(response)
+
+    def get_md_state(self, handles: list[str] | None = None) -> GetMdStateResponseData:
+        response = self._stub.GetMdState(self._mk_get_md_state_request(handles))
+        return self._read_get_md_state_response(response)
+
+    def get_context_states(self, handles: list[str] | None = None) -> GetContextStatesResponseData:
+        response = self._stub.GetContextStates(self._mk_get_context_states_request(handles))
+        return self._read_get_context_states_response(response)
+
+    @staticmethod
+    def _mk_get_mdib_request() -> sdc_messages_pb2.GetMdibRequest:
         request = sdc_messages_pb2.GetMdibRequest()
         request.addressing.message_id = uuid.uuid4().urn
         request.addressing.action = GetAction.GetMdibRequest
@@ -62,14 +79,16 @@ class GetServiceWrapper():
         abstract_get = AbstractGetMsg()
         payload.abstract_get.MergeFrom(abstract_get)
         request.payload.MergeFrom(payload)
-        response = self._stub.GetMdib(request)
+        return request
 
+    def _read_get_mdib_response(self, response: sdc_messages_pb2.GetMdibResponse) -> GetMdibResponseData:
         mdib_version_group_msg = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
         mdib_version_group = get_mdib_version_group(mdib_version_group_msg)
         descriptors, states = self._msg_reader.read_get_mdib_response(response)
         return GetMdibResponseData(mdib_version_group, response, descriptors, states)
 
-    def get_md_description(self, handles: list[str] | None = None) -> GetMdDescriptionResponseData:
+    @staticmethod
+    def _mk_get_md_description_request(handles: list[str] | None) -> sdc_messages_pb2.GetMdDescriptionRequest:
         request = sdc_messages_pb2.GetMdDescriptionRequest()
         request.addressing.message_id = uuid.uuid4().urn
         request.addressing.action = GetAction.GetMdDescriptionRequest
@@ -82,15 +101,17 @@ class GetServiceWrapper():
         abstract_get = AbstractGetMsg()
         payload.abstract_get.MergeFrom(abstract_get)
         request.payload.MergeFrom(payload)
+        return request
 
-        response = self._stub.GetMdDescription(request)
-
+    def _read_get_md_description_response(self, response: sdc_messages_pb2.GetMdDescriptionResponse
+                                          ) -> GetMdDescriptionResponseData:
         mdib_version_group_msg = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
         mdib_version_group = get_mdib_version_group(mdib_version_group_msg)
         descriptors = self._msg_reader.read_md_description(response.payload.md_description)
         return GetMdDescriptionResponseData(mdib_version_group, response, descriptors)
 
-    def get_md_state(self, handles: list[str] | None = None) -> GetMdStateResponseData:
+    @staticmethod
+    def _mk_get_md_state_request(handles: list[str] | None) -> sdc_messages_pb2.GetMdStateRequest:
         request = sdc_messages_pb2.GetMdStateRequest()
         request.addressing.message_id = uuid.uuid4().urn
         request.addressing.action = GetAction.GetMdStateRequest
@@ -105,8 +126,9 @@ class GetServiceWrapper():
 
         payload.abstract_get.MergeFrom(abstract_get)
         request.payload.MergeFrom(payload)
+        return request
 
-        response = self._stub.GetMdState(request)
+    def _read_get_md_state_response(self, response: sdc_messages_pb2.GetMdStateResponse) -> GetMdStateResponseData:
         response.addressing.message_id = uuid.uuid4().urn
         response.addressing.action = 'GetMdib'
         mdib_version_group_msg = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
@@ -115,7 +137,8 @@ class GetServiceWrapper():
         states = self._msg_reader.read_states(response.payload.md_state.state, mdib)
         return GetMdStateResponseData(mdib_version_group, response, states)
 
-    def get_context_states(self, handles: list[str] | None = None) -> GetContextStatesResponseData:
+    @staticmethod
+    def _mk_get_context_states_request(handles: list[str] | None) -> sdc_messages_pb2.GetContextStatesRequest:
         request = sdc_messages_pb2.GetContextStatesRequest()
         request.addressing.message_id = uuid.uuid4().urn
         request.addressing.action = GetAction.GetContextStateRequest
@@ -129,10 +152,32 @@ class GetServiceWrapper():
         abstract_get = AbstractGetMsg()
         payload.abstract_get.MergeFrom(abstract_get)
         request.payload.MergeFrom(payload)
+        return request
 
-        response = self._stub.GetContextStates(request)
+    def _read_get_context_states_response(self, response: sdc_messages_pb2.GetContextStatesResponse
+                                          ) -> GetContextStatesResponseData:
         mdib_version_group_msg = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
         mdib_version_group = get_mdib_version_group(mdib_version_group_msg)
         mdib = None
         descriptors = self._msg_reader.read_states(response.payload.context_state, mdib)
         return GetContextStatesResponseData(mdib_version_group, response, descriptors)
+
+
+class AioGetServiceWrapper(GetServiceWrapper):
+    """GetServiceWrapper for a grpc.aio channel, the get methods are coroutines."""
+
+    async def get_mdib(self) -> GetMdibResponseData:
+        response = await self._stub.GetMdib(self._mk_get_mdib_request())
+        return self._read_get_mdib_response(response)
+
+    async def get_md_description(self, handles: list[str] | None = None) -> GetMdDescriptionResponseData:
+        response = await self._stub.GetMdDescription(self._mk_get_md_description_request(handles))
+        return self._read_get_md_description_response(response)
+
+    async def get_md_state(self, handles: list[str] | None = None) -> GetMdStateResponseData:
+        response = await self._stub.GetMdState(self._mk_get_md_state_request(handles))
+        return self._read_get_md_state_response(response)
+
+    async def get_context_states(self, handles: list[str] | None = None) -> GetContextStatesResponseData:
+        response = await self._stub.GetContextStates(self._mk_get_context_states_request(handles))
+        return self._read_get_context_states_response(response)
@@ -1,10 +1,13 @@
 from __future__ import annotations
 import logging
 import threading
+import time
 import uuid
 import traceback
-from dataclasses import dataclass
+from collections.abc import Sequence
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
+import grpc
 from org.somda.protosdc.proto.model import sdc_services_pb2_grpc, sdc_messages_pb2
 from sdc11073 import  observableproperties
 from sdc11073.mdib.mdibbase import MdibVersionGroup
@@ -12,10 +15,64 @@ from sdc11073.mdib.mdibbase import MdibVersionGroup
 from pyprotosdc.mapping.mapping_helpers import get_p_attr
 from pyprotosdc.mapping.msgtypes_mappers import get_mdib_version_group
 from pyprotosdc.actions import ReportAction, EpisodicReportAction
+from pyprotosdc.msgreader import read_descriptor_handle
+from pyprotosdc.consumer.reportpipeline import ReportPipeline, ReportPipelineStats
 
 if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterable
+    from sdc11073.mdib.statecontainers import AbstractStateContainer
     from pyprotosdc.msgreader import MessageReader
 
+# grpc metadata keys, see provider/services/mdibreportingservice.py
+RESUME_SEQUENCE_ID_KEY = 'resume-sequence-id'
+RESUME_MDIB_VERSION_KEY = 'resume-mdib-version'
+RESUME_ACTION_MDIB_VERSION_KEY = 'resume-action-mdib-version'
+RESUMED_KEY = 'resumed'
+
+
+class ReportStates(Sequence):
+    """The states of a report, each one is decoded when it is accessed the first time.
+
+    The states have no descriptor container, the mdib sets it when it applies the report.
+    Observers that are only interested in some handles use get or descriptor_handles,
+    then only the states of these handles are decoded.
+    """
+
+    def __init__(self, p_states: list, msg_reader: MessageReader):
+        self._p_states = p_states
+        self._msg_reader = msg_reader
+        self._states: list[AbstractStateContainer | None] = [None] * len(p_states)
+        self._descriptor_handles: list[str] | None = None
+        self._lock = threading.Lock()  # the decode stage of the consumer and the observers can access the states
+
+    def __len__(self) -> int:
+        return len(self._p_states)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        state = self._states[index]
+        if state is None:
+            with self._lock:
+                state = self._states[index]
+                if state is None:
+                    state = self._msg_reader.read_state(self._p_states[index], None)
+                    self._states[index] = state
+        return state
+
+    def descriptor_handles(self) -> list[str]:
+        if self._descriptor_handles is None:
+            self._descriptor_handles = [read_descriptor_handle(p) for p in self._p_states]
+        return self._descriptor_handles
+
+    def get(self, descriptor_handle: str) -> list[AbstractStateContainer]:
+        """The states of the descriptor (context descriptors can have several states)."""
+        return [self[i] for i, handle in enumerate(self.descriptor_handles()) if handle == descriptor_handle]
+
+    @property
+    def decoded_count(self) -> int:
+        return sum(1 for state in self._states if state is not None)
+
 
 @dataclass
 class EpisodicReportData:
@@ -23,24 +80,109 @@ class EpisodicReportData:
     action: ReportAction
     p_response: sdc_messages_pb2.EpisodicReportStream
     msg_reader: MessageReader
+    _states: ReportStates | None = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def states(self) -> ReportStates:
+        """The states of a state report (not of a DescriptionModificationReport), decoded on demand."""
+        if self._states is None:
+            self._states = ReportStates(self._p_states(), self.msg_reader)
+        return self._states
+
+    def decode_states(self):
+        """Decode all states now, e.g. in the decode stage of the consumer."""
+        for _ in self.states:
+            pass
+
+    def _p_states(self) -> list:
+        report = self.p_response.report
+        if self.action == ReportAction.Waveform:
+            return list(report.waveform.state)
+        if self.action == ReportAction.EpisodicMetricReport:
+            return [p for part in report.metric.abstract_metric_report.report_part for p in part.metric_state]
+        if self.action == ReportAction.EpisodicAlertReport:
+            return [p for part in report.alert.abstract_alert_report.report_part for p in part.alert_state]
+        if self.action == ReportAction.EpisodicComponentReport:
+            return [p for part in report.component.abstract_component_report.report_part
+                    for p in part.component_state]
+        if self.action == ReportAction.EpisodicContextReport:
+            return [p for part in report.context.abstract_context_report.report_part for p in part.context_state]
+        if self.action == ReportAction.EpisodicOperationalStateReport:
+            return [p for part in report.operational_state.abstract_operational_state_report.report_part
+                    for p in part.operation_state]
+        raise ValueError(f'{self.action} is not a state report')
 
 
 class MdibReportingServiceWrapper:
+    """Reads the EpisodicReport stream in a thread.
+
+    If the stream breaks and the provider has a report history, a new stream is requested that resumes
+    the old one. The resume point is the mdib version of the last received report per action, because a provider
+    with priority lanes sends reports of different actions out of mdib version order.
+    episodic_report_resumed is True if the provider sent the missed reports, and False if it could not.
+    In that case the reports are lost, and the mdib has to be reloaded.
+    """
     episodic_report = observableproperties.ObservableProperty()
+    episodic_report_resumed = observableproperties.ObservableProperty(fire_only_on_changed_value=False)
+    # decode_workers > 0: the reader thread only receives, the reports are decoded in a ReportPipeline with
+    # decode_workers threads and handed to the observers in one thread in the order of the stream.
+    decode_workers = 0
+    max_pending_reports = 1000  # received, but not yet handed to the observers (only with decode_workers)
+    auto_resume = True
+    reconnect_delay = 1.0  # seconds between attempts to resume
+    max_reconnect_attempts = 10  # consecutive attempts without a received report
+
     def __init__(self, channel, msg_reader: MessageReader):
         self._stub = sdc_services_pb2_grpc.MdibReportingServiceStub(channel)
         self._logger = logging.getLogger('sdc.grpc.cl.rep_srv')
         self._report_reader_thread: threading.Thread | None = None
+        self._pipeline: ReportPipeline | None = None
         self._msg_reader = msg_reader
+        self._received_reports = 0
+        # resume point, the provider sends sequence id and base mdib version in the initial metadata
+        self._resume_sequence_id: str | None = None
+        self._resume_mdib_version: int | None = None
+        self._resume_action_mdib_versions: dict[str, int] = {}
 
     def EpisodicReport(self):
         self._logger.info('EpisodicReport')
+        if self.decode_workers > 0:
+            self._pipeline = ReportPipeline(self._decode_report, self._apply_report, self.decode_workers,
+                                            self.max_pending_reports, name='episodic_reports')
         self._report_reader_thread = threading.Thread(target=self._read_episodic_reports, name='read_episodic_reports')
         self._report_reader_thread.daemon = True
         self._report_reader_thread.start()
 
     def _read_episodic_reports(self):
         """Method is executed in a thread."""
+        failed_attempts = 0
+        while True:
+            received_reports = self._received_reports
+            try:
+                self._read_episodic_report_stream()
+                break  # the provider ended the stream
+            except grpc.RpcError as ex:
+                if self._pipeline is not None:
+                    self._pipeline.join()  # the resume point is updated when the reports are applied
+                if self._received_reports != received_reports:
+                    failed_attempts = 0  # the stream worked for a while
+                if ex.code() == grpc.StatusCode.CANCELLED or not self.auto_resume:
+                    self._logger.info('EpisodicReport ended: %s', ex.code())
+                    break
+                failed_attempts += 1
+                if failed_attempts > self.max_reconnect_attempts:
+                    self._logger.error('EpisodicReport ended, %d attempts to resume failed: %s',
+                                       self.max_reconnect_attempts, ex.code())
+                    break
+                self._logger.warning('EpisodicReport broke (%s), resuming in %.1f seconds',
+                                     ex.code(), self.reconnect_delay)
+                time.sleep(self.reconnect_delay)
+        if self._pipeline is not None:
+            self._pipeline.stop()
+        self._logger.info('end of EpisodicReports')
+
+    def _read_episodic_report_stream(self):
+        """Read one stream until it ends."""
         request = sdc_messages_pb2.EpisodicReportRequest()
         request.addressing.message_id = uuid.uuid4().urn
         request.addressing.action = EpisodicReportAction
@@ -56,47 +198,134 @@ class MdibReportingServiceWrapper:
         #            ReportAction.EpisodicComponentReport,
         #            ReportAction.EpisodicOperationalStateReport]
         # f.extend(actions)
-        for response in self._stub.EpisodicReport(request):
+        metadata = self._resume_metadata() if self.auto_resume else None
+        stream = self._stub.EpisodicReport(request, metadata=metadata)
+        if self.auto_resume:
+            self._on_initial_metadata(dict(stream.initial_metadata() or ()), metadata is not None)
+        for response in stream:
+            if self._pipeline is not None:
+                self._pipeline.put(response)
+                continue
             try:
-                self.episodic_report = self._map_report(response)
+                self._apply_report(self._map_report(response))
             except:
                 self._logger.error(traceback.format_exc())
-        print(f'end of EpisodicReports')
+
+    def _decode_report(self, response: sdc_messages_pb2.EpisodicReportStream) -> EpisodicReportData:
+        """Decode stage of the pipeline, runs in a worker thread."""
+        report_data = self._map_report(response)
+        if report_data.action != ReportAction.DescriptionModificationReport:
+            report_data.decode_states()
+        return report_data
+
+    def _apply_report(self, report_data: EpisodicReportData):
+        self._on_report_received(report_data)
+        self.episodic_report = report_data
+
+    def get_pipeline_stats(self) -> ReportPipelineStats | None:
+        """Queue depths and stage latencies, None if reports are not decoded in a pipeline."""
+        return None if self._pipeline is None else self._pipeline.get_stats()
+
+    def _resume_metadata(self) -> tuple[tuple[str, str], ...] | None:
+        if self._resume_sequence_id is None or self._resume_mdib_version is None:
+            return None  # nothing to resume, or the provider has no report history
+        metadata = [(RESUME_SEQUENCE_ID_KEY, self._resume_sequence_id),
+                    (RESUME_MDIB_VERSION_KEY, str(self._resume_mdib_version))]
+        metadata.extend((RESUME_ACTION_MDIB_VERSION_KEY, f'{action}={mdib_version}')
+                        for action, mdib_version in self._resume_action_mdib_versions.items())
+        return tuple(metadata)
+
+    def _on_initial_metadata(self, values: dict[str, str], resume_requested: bool):
+        resumed = values.get(RESUMED_KEY) == '1'
+        if not resumed:
+            # a new subscription, the resume point of the old one is no longer valid
+            mdib_version = values.get(RESUME_MDIB_VERSION_KEY)
+            self._resume_mdib_version = None if mdib_version is None else int(mdib_version)
+            self._resume_sequence_id = values.get(RESUME_SEQUENCE_ID_KEY)
+            self._resume_action_mdib_versions = {}
+        if resume_requested and RESUMED_KEY in values:
+            self._logger.info('EpisodicReport resumed: %s', resumed)
+            self.episodic_report_resumed = resumed
+
+    def _on_report_received(self, report_data: EpisodicReportData):
+        self._received_reports += 1
+        if self._resume_mdib_version is None:
+            return  # the provider has no report history
+        mdib_version_group = report_data.mdib_version_group
+        if mdib_version_group.sequence_id != self._resume_sequence_id:
+            # the provider's report history restarts with the new sequence id
+            self._resume_sequence_id = mdib_version_group.sequence_id
+            self._resume_mdib_version = -1
+            self._resume_action_mdib_versions = {}
+        self._resume_action_mdib_versions[report_data.action.value] = mdib_version_group.mdib_version
 
     def _map_report(self, report_stream: sdc_messages_pb2.EpisodicReportStream) -> EpisodicReportData:
-        report = report_stream.report
-        which = report.WhichOneof(report.DESCRIPTOR.oneofs[0].name)
-        actual_report = getattr(report, which)
-
-        if which == 'waveform':
-            action = ReportAction.Waveform
-            mdib_version_group_msg = get_p_attr(actual_report.abstract_report,
-                                                'MdibVersionGroup')
-        elif which == 'metric':
-            action = ReportAction.EpisodicMetricReport
-            mdib_version_group_msg = get_p_attr(actual_report.abstract_metric_report.abstract_report,
-                                                'MdibVersionGroup')
-        elif which == 'alert':
-            action = ReportAction.EpisodicAlertReport
-            mdib_version_group_msg = get_p_attr(actual_report.abstract_alert_report.abstract_report,
-                                                'MdibVersionGroup')
-        elif which == 'component':
-            action = ReportAction.EpisodicComponentReport
-            mdib_version_group_msg = get_p_attr(actual_report.abstract_component_report.abstract_report,
-                                                'MdibVersionGroup')
-        elif which == 'context':
-            action = ReportAction.EpisodicContextReport
-            mdib_version_group_msg = get_p_attr(actual_report.abstract_context_report.abstract_report,
-                                                'MdibVersionGroup')
-        elif which == 'description':
-            action = ReportAction.DescriptionModificationReport
-            mdib_version_group_msg = get_p_attr(actual_report.abstract_report,
-                                                'MdibVersionGroup')
-        elif which == 'operational_state':
-            action = ReportAction.EpisodicOperationalStateReport
-            mdib_version_group_msg = get_p_attr(actual_report.abstract_operational_state_report.abstract_report,
-                                                'MdibVersionGroup')
-        else:
-            raise ValueError(' do not know how to handle report')
-        mdib_version_group = get_mdib_version_group(mdib_version_group_msg)
-        return EpisodicReportData(mdib_version_group, action, report_stream, self._msg_reader)
+        return map_episodic_report(report_stream, self._msg_reader)
+
+
+class AioMdibReportingServiceWrapper:
+    """MdibReportingServiceWrapper for a grpc.aio channel.
+
+    Every call of episodic_reports opens an own EpisodicReport stream. It ends when the async iteration ends.
+    """
+
+    def __init__(self, channel, msg_reader: MessageReader):
+        self._stub = sdc_services_pb2_grpc.MdibReportingServiceStub(channel)
+        self._logger = logging.getLogger('sdc.grpc.cl.rep_srv')
+        self._msg_reader = msg_reader
+
+    async def episodic_reports(self, actions: Iterable[ReportAction | str] | None = None
+                               ) -> AsyncIterator[EpisodicReportData]:
+        """Yield the reports of a new EpisodicReport stream. No actions means all actions."""
+        request = sdc_messages_pb2.EpisodicReportRequest()
+        request.addressing.message_id = uuid.uuid4().urn
+        request.addressing.action = EpisodicReportAction
+        for action in actions or ():
+            request.filter.action_filter.action.append(ReportAction(action).value)
+        call = self._stub.EpisodicReport(request)
+        try:
+            async for response in call:
+                yield map_episodic_report(response, self._msg_reader)
+        finally:
+            call.cancel()
+            self._logger.info('end of EpisodicReports')
+
+
+def map_episodic_report(report_stream: sdc_messages_pb2.EpisodicReportStream,
+                        msg_reader: MessageReader) -> EpisodicReportData:
+    report = report_stream.report
+    which = report.WhichOneof(report.DESCRIPTOR.oneofs[0].name)
+    actual_report = getattr(report, which)
+
+    if which == 'waveform':
+        action = ReportAction.Waveform
+        mdib_version_group_msg = get_p_attr(actual_report.abstract_report,
+                                            'MdibVersionGroup')
+    elif which == 'metric':
+        action = ReportAction.EpisodicMetricReport
+        mdib_version_group_msg = get_p_attr(actual_report.abstract_metric_report.abstract_report,
+                                            'MdibVersionGroup')
+    elif which == 'alert':
+        action = ReportAction.EpisodicAlertReport
+        mdib_version_group_msg = get_p_attr(actual_report.abstract_alert_report.abstract_report,
+                                            'MdibVersionGroup')
+    elif which == 'component':
+        action = ReportAction.EpisodicComponentReport
+        mdib_version_group_msg = get_p_attr(actual_report.abstract_component_report.abstract_report,
+                                            'MdibVersionGroup')
+    elif which == 'context':
+        action = ReportAction.EpisodicContextReport
+        mdib_version_group_msg = get_p_attr(actual_report.abstract_context_report.abstract_report,
+                                            'MdibVersionGroup')
+    elif which == 'description':
+        action = ReportAction.DescriptionModificationReport
+        mdib_version_group_msg = get_p_attr(actual_report.abstract_report,
+                                            'MdibVersionGroup')
+    elif which == 'operational_state':
+        action = ReportAction.EpisodicOperationalStateReport
+        mdib_version_group_msg = get_p_attr(actual_report.abstract_operational_state_report.abstract_report,
+                                            'MdibVersionGroup')
+    else:
+        raise ValueError(' do not know how to handle report')
+    mdib_version_group = get_mdib_version_group(mdib_version_group_msg)
+    return EpisodicReportData(mdib_version_group, action, report_stream, msg_reader)
@@ -22,3 +22,13 @@ class MetadataServiceWrapper:
         request.addressing.action = 'org.somda.protosdc.metadata.action.GetMetadata'
         response = self._stub.GetMetadata(request)
         return response
+
+
+class AioMetadataServiceWrapper(MetadataServiceWrapper):
+    """MetadataServiceWrapper for a grpc.aio channel."""
+
+    async def get_metadata(self) -> GetMetadataResponse:
+        request = GetMetadataRequest()
+        request.addressing.message_id = uuid.uuid4().urn
+        request.addressing.action = 'org.somda.protosdc.metadata.action.GetMetadata'
+        return await self._stub.GetMetadata(request)
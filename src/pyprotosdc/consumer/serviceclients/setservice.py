@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import uuid
 from typing import TYPE_CHECKING
 import weakref
 import threading
 import logging
+import grpc
 from org.somda.protosdc.proto.model import sdc_services_pb2_grpc, sdc_messages_pb2
 from sdc11073 import  observableproperties
 from sdc11073.definitions_sdc import SdcV1Definitions
@@ -14,7 +16,7 @@ from pyprotosdc.actions import OperationInvokedAction
 
 if TYPE_CHECKING:
     from concurrent.futures import Future
-    from pyprotosdc.consumer.operations import GOperationsManager
+    from pyprotosdc.consumer.operations import GOperationsManager, OperationResult
     from pyprotosdc.msgreader import MessageReader
     from sdc11073.mdib.statecontainers import (AbstractComplexDeviceComponentStateContainer,
                                                AbstractMetricStateContainer,
@@ -33,24 +35,39 @@ class SetServiceWrapper:
         self._msg_reader = msg_reader
 
     def set_value(self, operation_handle: str, value: Decimal) -> Future:
+        response = self._stub.SetValue(self._mk_set_value_request(operation_handle, value))
+        return self._operations_manager.watch_operation(response)
+
+    @staticmethod
+    def _mk_set_value_request(operation_handle: str, value: Decimal) -> sdc_messages_pb2.SetValueRequest:
         request = sdc_messages_pb2.SetValueRequest()
         request.addressing.action = SdcV1Definitions.Actions.SetValue
         request.addressing.message_id = uuid.uuid4().urn
         request.payload.abstract_set.operation_handle_ref.string = operation_handle
         decimal_to_p(value, request.payload.requested_numeric_value)
-        response = self._stub.SetValue(request)
-        return self._operations_manager.watch_operation(response)
+        return request
 
     def set_string(self, operation_handle: str, value: str) -> Future:
+        response = self._stub.SetString(self._mk_set_string_request(operation_handle, value))
+        return self._operations_manager.watch_operation(response)
+
+    @staticmethod
+    def _mk_set_string_request(operation_handle: str, value: str) -> sdc_messages_pb2.SetStringRequest:
         request = sdc_messages_pb2.SetStringRequest()
         request.addressing.action = SdcV1Definitions.Actions.SetString
         request.addressing.message_id = uuid.uuid4().urn
         request.payload.abstract_set.operation_handle_ref.string = operation_handle
         request.payload.requested_string_value = value
-        response = self._stub.SetString(request)
-        return self._operations_manager.watch_operation(response)
+        return request
 
     def set_metric_state(self, operation_handle: str, proposed_metric_states: list[AbstractMetricStateContainer]) -> Future:
+        request = self._mk_set_metric_state_request(operation_handle, proposed_metric_states)
+        response = self._stub.SetMetricState(request)
+        return self._operations_manager.watch_operation(response)
+
+    @staticmethod
+    def _mk_set_metric_state_request(operation_handle: str, proposed_metric_states: list[AbstractMetricStateContainer]
+                                     ) -> sdc_messages_pb2.SetMetricStateRequest:
         request = sdc_messages_pb2.SetMetricStateRequest()
         request.addressing.action = SdcV1Definitions.Actions.SetMetricState
         request.addressing.message_id = uuid.uuid4().urn
@@ -58,10 +75,14 @@ class SetServiceWrapper:
         for proposed in proposed_metric_states:
             p = request.payload.proposed_metric_state.add()
             generic_state_to_p(proposed, p)
-        response = self._stub.SetMetricState(request)
-        return self._operations_manager.watch_operation(response)
+        return request
 
     def activate(self, operation_handle, values) -> Future:
+        response = self._stub.Activate(self._mk_activate_request(operation_handle, values))
+        return self._operations_manager.watch_operation(response)
+
+    @staticmethod
+    def _mk_activate_request(operation_handle, values) -> sdc_messages_pb2.ActivateRequest:
         request = sdc_messages_pb2.ActivateRequest()
         request.addressing.action = SdcV1Definitions.Actions.Activate
         request.addressing.message_id = uuid.uuid4().urn
@@ -69,10 +90,17 @@ class SetServiceWrapper:
         for v in values:
             p_arg = request.payload.argument.add()
             p_arg.arg_value = str(v).encode('utf-8')
-        response = self._stub.Activate(request)
-        return self._operations_manager.watch_operation(response)
+        return request
 
     def set_component_state(self, operation_handle, pm_component_states:list[AbstractComplexDeviceComponentStateContainer]) -> Future:
+        request = self._mk_set_component_state_request(operation_handle, pm_component_states)
+        response = self._stub.SetComponentState(request)
+        return self._operations_manager.watch_operation(response)
+
+    @staticmethod
+    def _mk_set_component_state_request(operation_handle,
+                                        pm_component_states: list[AbstractComplexDeviceComponentStateContainer]
+                                        ) -> sdc_messages_pb2.SetComponentStateRequest:
         request = sdc_messages_pb2.SetComponentStateRequest()
         request.addressing.action = SdcV1Definitions.Actions.SetComponentState
         request.addressing.message_id = uuid.uuid4().urn
@@ -80,10 +108,16 @@ class SetServiceWrapper:
         for c in pm_component_states:
             p_component_state = request.payload.proposed_component_state.add()
             generic_state_to_p(c, p_component_state)
-        response = self._stub.SetComponentState(request)
-        return self._operations_manager.watch_operation(response)
+        return request
 
     def set_context_state(self, operation_handle, pm_context_states:list[AbstractContextStateContainer]) -> Future:
+        request = self._mk_set_context_state_request(operation_handle, pm_context_states)
+        response = self._stub.SetContextState(request)
+        return self._operations_manager.watch_operation(response)
+
+    @staticmethod
+    def _mk_set_context_state_request(operation_handle, pm_context_states: list[AbstractContextStateContainer]
+                                      ) -> sdc_messages_pb2.SetContextStateRequest:
         request = sdc_messages_pb2.SetContextStateRequest()
         request.addressing.action = SdcV1Definitions.Actions.SetContextState
         request.addressing.message_id = uuid.uuid4().urn
@@ -91,8 +125,7 @@ class SetServiceWrapper:
         for c in pm_context_states:
             pm_context_state = request.payload.proposed_context_state.add()
             generic_state_to_p(c, pm_context_state)
-        response = self._stub.SetContextState(request)
-        return self._operations_manager.watch_operation(response)
+        return request
 
     # def register_mdib(self, mdib):
     #     """ Client sometimes must know the mdib data (e.g. Set service, activate method)."""
@@ -112,11 +145,98 @@ class SetServiceWrapper:
     def _read_operation_invoked_reports(self):
         """Method runs in background thread"""
         self._logger.info('start reading operation invoked reports')
+        for response in self._stub.OperationInvokedReport(self._mk_operation_invoked_report_request()):
+            # write to observable
+            self.operation_invoked_report = response
+        self._logger.info('stopped reading operation invoked reports')
+
+    @staticmethod
+    def _mk_operation_invoked_report_request() -> sdc_messages_pb2.OperationInvokedReportRequest:
         request = sdc_messages_pb2.OperationInvokedReportRequest()
         request.addressing.message_id = uuid.uuid4().urn
         request.addressing.action = OperationInvokedAction
+        return request
 
-        for response in self._stub.OperationInvokedReport(request):
-            # write to observable
-            self.operation_invoked_report = response
+
+class AioSetServiceWrapper(SetServiceWrapper):
+    """SetServiceWrapper for a grpc.aio channel.
+
+    The set methods are coroutines that return the OperationResult. The final invocation state is taken from the
+    OperationInvokedReport stream, which is read by a task of the event loop. The stream is started with the first
+    set operation (or with OperationInvokedReport), and the operation is only sent after the provider accepted
+    the subscription, otherwise the reports of a fast operation could be missed.
+    """
+    subscribe_timeout = 1.0  # max. wait time for the initial metadata of the OperationInvokedReport stream
+
+    def __init__(self, channel, msg_reader: MessageReader):
+        super().__init__(channel, msg_reader)
+        self._report_reader: asyncio.Task | None = None
+        self._subscribe_lock = asyncio.Lock()
+
+    async def set_value(self, operation_handle: str, value: Decimal) -> OperationResult:
+        await self.OperationInvokedReport()
+        response = await self._stub.SetValue(self._mk_set_value_request(operation_handle, value))
+        return await asyncio.wrap_future(self._operations_manager.watch_operation(response))
+
+    async def set_string(self, operation_handle: str, value: str) -> OperationResult:
+        await self.OperationInvokedReport()
+        response = await self._stub.SetString(self._mk_set_string_request(operation_handle, value))
+        return await asyncio.wrap_future(self._operations_manager.watch_operation(response))
+
+    async def set_metric_state(self, operation_handle: str,
+                               proposed_metric_states: list[AbstractMetricStateContainer]) -> OperationResult:
+        await self.OperationInvokedReport()
+        request = self._mk_set_metric_state_request(operation_handle, proposed_metric_states)
+        response = await self._stub.SetMetricState(request)
+        return await asyncio.wrap_future(self._operations_manager.watch_operation(response))
+
+    async def activate(self, operation_handle, values) -> OperationResult:
+        await self.OperationInvokedReport()
+        response = await self._stub.Activate(self._mk_activate_request(operation_handle, values))
+        return await asyncio.wrap_future(self._operations_manager.watch_operation(response))
+
+    async def set_component_state(self, operation_handle,
+                                  pm_component_states: list[AbstractComplexDeviceComponentStateContainer]
+                                  ) -> OperationResult:
+        await self.OperationInvokedReport()
+        request = self._mk_set_component_state_request(operation_handle, pm_component_states)
+        response = await self._stub.SetComponentState(request)
+        return await asyncio.wrap_future(self._operations_manager.watch_operation(response))
+
+    async def set_context_state(self, operation_handle,
+                                pm_context_states: list[AbstractContextStateContainer]) -> OperationResult:
+        await self.OperationInvokedReport()
+        request = self._mk_set_context_state_request(operation_handle, pm_context_states)
+        response = await self._stub.SetContextState(request)
+        return await asyncio.wrap_future(self._operations_manager.watch_operation(response))
+
+    async def OperationInvokedReport(self):
+        """Start the task that reads the OperationInvokedReport stream, if it is not running."""
+        async with self._subscribe_lock:
+            if self._report_reader is not None and not self._report_reader.done():
+                return
+            call = self._stub.OperationInvokedReport(self._mk_operation_invoked_report_request())
+            # the provider sends the initial metadata when the subscription exists. A provider that sends it
+            # with the first report would block the first operation, therefore the wait time is limited.
+            metadata = asyncio.ensure_future(call.initial_metadata())
+            await asyncio.wait([metadata], timeout=self.subscribe_timeout)
+            self._report_reader = asyncio.create_task(self._read_operation_invoked_reports_async(call),
+                                                      name='read_operation_invoked_reports')
+
+    async def _read_operation_invoked_reports_async(self, call):
+        self._logger.info('start reading operation invoked reports')
+        try:
+            async for response in call:
+                self.operation_invoked_report = response
+                self._operations_manager.on_operation_invoked_report(response.operation_invoked)
+        except grpc.RpcError as ex:
+            self._logger.warning('OperationInvokedReport ended: %s', ex.code())
+        finally:
+            call.cancel()
         self._logger.info('stopped reading operation invoked reports')
+
+    async def close(self):
+        if self._report_reader is not None:
+            self._report_reader.cancel()
+            await asyncio.gather(self._report_reader, return_exceptions=True)
+            self._report_reader = None
@@ -270,7 +270,7 @@ class _NetworkingThreadBase(ABC):
             logging.getLogger(commlog.DISCOVERY_OUT).debug(data, extra={'ip_address': msg.addr})
             self.sockets_collection.uni_out_socket.sendto(data, (msg.addr, msg.port))
         else:
-            logging.getLogger(commlog.MULTICAST_OUT).debug(data)
+            logging.getLogger(commlog.DISCOVERY_OUT).debug(data, extra={'ip_address': msg.addr})
             self._logger.debug('send multicast %d bytes, msg (%d) action=%s: to=%s:%r id=%s',
                                len(data),
                                q_msg.repeat,
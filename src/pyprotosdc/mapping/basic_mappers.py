@@ -1,5 +1,4 @@
 import decimal
-from functools import reduce
 
 from google.protobuf.duration_pb2 import Duration
 from google.protobuf.wrappers_pb2 import StringValue
@@ -40,18 +39,38 @@ def duration_from_p(p: Duration) -> float:
     return ret
 
 
+# memos for the scales that occur in practice. They are not extended, the scale comes from the peer.
+_decimal_divisors = {scale: decimal.Decimal(10 ** scale) for scale in range(21)}
+_float_divisors = {scale: 10.0 ** scale for scale in range(21)}
+
+
 def decimal_to_p(pm_value: decimal.Decimal,
                  # pm_property_type: type,
                  p_dest: common_types_pb2.Decimal):
-    t = pm_value.as_tuple()
-    abs_value = reduce(lambda x, y: x * 10 + y, t.digits)
-    p_dest.value = abs_value * -1 if t.sign else abs_value
-    p_dest.scale = -t.exponent
+    exponent = pm_value.as_tuple().exponent
+    if exponent >= 0:
+        p_dest.value = int(pm_value)
+        p_dest.scale = 0
+        return
+    p_dest.value = int(pm_value.scaleb(-exponent))  # exact, int64 values have less digits than context precision
+    p_dest.scale = -exponent
 
 
 def decimal_from_p(p: common_types_pb2.Decimal) -> decimal.Decimal:
-    # return decimal.Decimal(p.value) / decimal.Decimal(int(math.pow(10, p.scale)))
-    return decimal.Decimal(p.value) / decimal.Decimal(10 ** p.scale)
+    scale = p.scale
+    divisor = _decimal_divisors.get(scale)
+    if divisor is None:
+        return decimal.Decimal(p.value).scaleb(-scale)
+    return decimal.Decimal(p.value) / divisor
+
+
+def decimal_from_p_as_float(p: common_types_pb2.Decimal) -> float:
+    """Same as decimal_from_p, but returns a float. For consumers that do not need Decimal precision."""
+    scale = p.scale
+    divisor = _float_divisors.get(scale)
+    if divisor is None:
+        return p.value * 10.0 ** -scale  # 10.0 ** scale overflows for scale > 308
+    return p.value / divisor
 
 
 def _enum_name_to_p(name):
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import inspect
 import logging
+import traceback
 from typing import Any, Callable
 from google.protobuf.internal.python_message import GeneratedProtocolMessageType
 from org.somda.protosdc.proto.model.biceps.abstractalertstateoneof_pb2 import AbstractAlertStateOneOfMsg
@@ -130,6 +131,8 @@ from .pmtypesmapper import (instance_identifier_to_oneof_p_func,
                             person_reference_from_oneof_p,
                             base_demographics_from_oneof_p,
                             _realtime_array_from_p,
+                            realtime_samples_from_p,
+                            realtime_array_to_p,
                             localized_text_from_p,
                             node_text_qname_to_p,
                             node_text_qname_from_p)
@@ -273,11 +276,11 @@ def generic_to_p(pm_src: PropertyBasedPMType,
     return map_generic_to_p(pm_src, p_dest, 0)
 
 
-def map_generic_to_p(pm_src: PropertyBasedPMType,
-                     p_dest: GeneratedProtocolMessageType,
-                     recurse_count: int,
-                     ):
-    """Copy data from a pm_types object to a proto object.
+def _map_generic_to_p_reflective(pm_src: PropertyBasedPMType,
+                                 p_dest: GeneratedProtocolMessageType,
+                                 recurse_count: int,
+                                 ):
+    """Copy data from a pm_types object to a proto object by inspecting the class hierarchy on every call.
      :param pm_src: the pm_types object to copy from
      :param p_dest: the proto object to copy to.
      :param recurse_count: used to calculate indent for log output
@@ -407,10 +410,7 @@ def map_generic_to_p(pm_src: PropertyBasedPMType,
             elif isinstance(cp_type, DecimalListAttributeProperty):
                 pm_list = getattr(pm_src, pm_prop_name)
                 if pm_list is not None:
-                    for dec in pm_list:
-                        tmp = common_types_pb2.Decimal()
-                        decimal_to_p(dec, tmp)
-                        p_dest_current.decimal.append(tmp)
+                    realtime_array_to_p(pm_list, p_dest_current)
 
             elif isinstance(cp_type, _AttributeListBase):
                 # This is always a list of handles ( values in 'entry_ref')
@@ -490,9 +490,10 @@ def generic_from_p(p: GeneratedProtocolMessageType,
     return map_generic_from_p(p, pm_dest, 0)
 
 
-def map_generic_from_p(p: GeneratedProtocolMessageType,
-                       pm_dest: PropertyBasedPMType | None,
-                       recurse_count: int):
+def _map_generic_from_p_reflective(p: GeneratedProtocolMessageType,
+                                   pm_dest: PropertyBasedPMType | None,
+                                   recurse_count: int):
+    """Copy data from a proto object to a pm_types object by inspecting the class hierarchy on every call."""
     indent = '     ' * recurse_count
 
     if pm_dest is None:
@@ -607,9 +608,7 @@ def map_generic_from_p(p: GeneratedProtocolMessageType,
                             dest_list.append(src.string)
                 elif isinstance(dest_type, DecimalListAttributeProperty):
                     scr_list = getattr(p_current_entry_point, p_name)
-                    dest_list = getattr(pm_dest, name)
-                    for src in scr_list.decimal:
-                        dest_list.append(decimal_from_p(src))
+                    getattr(pm_dest, name).extend(realtime_samples_from_p(scr_list))
 
                 else:  # _AttributeListBase):
                     # This is always a list of handles
@@ -753,3 +752,521 @@ def map_generic_from_p(p: GeneratedProtocolMessageType,
                         setattr(pm_dest, name, value)
                         _logger().debug('%s recursive map_generic_from_p done', indent)
     return pm_dest
+
+
+# Compiled mapping plans
+# ----------------------
+# The reflective functions above walk the mro of the pm class, read the _props of every class, compute the
+# protobuf member names and dispatch on the property type for every single call.
+# All of this only depends on the pair (pm class, protobuf class). A plan is the result of this walk:
+# a list of segments (one per biceps class in the mro), each with a list of pre-resolved steps.
+# Plans are compiled on first use of a class pair and cached.
+# If a plan cannot be compiled (e.g. because of a protobuf member that does not exist), the pair is handled
+# by the reflective function. It will raise the same error at the same point as it always did.
+
+use_mapping_plans = True  # set to False in order to use the reflective functions only
+
+_NO_PLAN = object()  # marker for class pairs that are handled by the reflective functions
+
+_to_p_plans: dict[tuple[type, type], Any] = {}
+_from_p_plans: dict[tuple[type, type], Any] = {}
+_from_p_constructors: dict[type, tuple[Callable | None, type | None, int]] = {}
+
+
+class _ToPPlan:
+    """Pre-resolved steps that copy a pm class into a protobuf class.
+
+    special_handler is set if the whole class pair is handled by a special function.
+    segments is a list of (p_entry_name, is_extension, steps).
+    steps is a list of (pm_prop_name, p_name, convert) tuples.
+    """
+    __slots__ = ('special_handler', 'segments')
+
+    def __init__(self, special_handler: Callable | None, segments: list):
+        self.special_handler = special_handler
+        self.segments = segments
+
+
+def _handle_ref_list_to_p(value, p_dest_current, p_entry, p_root, recurse_count):
+    for ref in value:
+        tmp = HandleRefMsg()
+        tmp.string = ref
+        p_dest_current.handle_ref.append(tmp)
+
+
+def _decimal_list_to_p(value, p_dest_current, p_entry, p_root, recurse_count):
+    realtime_array_to_p(value, p_dest_current)
+
+
+def _handle_ref_extend_to_p(value, p_dest_current, p_entry, p_root, recurse_count):
+    # This is always a list of handles ( values in 'entry_ref')
+    p_dest_current.handle_ref.extend(value)
+
+
+def _sub_element_list_to_p(value, p_dest_current, p_entry, p_root, recurse_count):
+    # In case of a list we might need a factory method
+    for elem in value:
+        special_handler_list = _to_p_factories_by_pm.get(elem.__class__)
+        if special_handler_list:
+            p_value = special_handler_list(elem, map_generic_to_p, recurse_count)
+        else:
+            p_value = _to_cls[elem.__class__]()
+            map_generic_to_p(elem, p_value, recurse_count + 1)
+        p_dest_current.append(p_value)
+
+
+def _sub_element_handle_ref_list_to_p(value, p_dest_current, p_entry, p_root, recurse_count):
+    for elem in value:
+        tmp = HandleRefMsg()
+        tmp.string = elem
+        p_dest_current.append(tmp)
+
+
+def _extend_to_p(value, p_dest_current, p_entry, p_root, recurse_count):
+    p_dest_current.extend(value)
+
+
+def _recursive_to_p(value, p_dest_current, p_entry, p_root, recurse_count):
+    map_generic_to_p(value, p_dest_current, recurse_count + 1)
+
+
+def _compile_to_p_converter(cp_type, p_name: str, p_field: Any) -> Callable:
+    """Return a function convert(value, p_dest_current, p_entry, p_root, recurse_count).
+
+    The order of the checks is the same as in _map_generic_to_p_reflective.
+    """
+    to_one_of_p_func = _to_one_of_p_funcs_by_p.get(p_field.__class__)
+    if to_one_of_p_func is not None:
+        def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+            to_one_of_p_func(value, p_dest_current, map_generic_to_p, recurse_count)
+        return convert
+
+    attr_to_p_func = attr_to_p_funcs.get(cp_type.__class__)
+    if attr_to_p_func is not None:
+        def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+            attr_to_p_func(value, p_dest_current)
+        return convert
+
+    if isinstance(cp_type, BooleanAttributeProperty):
+        if cp_type.is_optional:
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                p_dest_current.value = value
+        else:
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                setattr(p_root, p_name, value)
+        return convert
+    if isinstance(cp_type, (TimestampAttributeProperty, CurrentTimestampAttributeProperty)):
+        to_xml = cp_type._converter.to_xml
+
+        def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+            p_dest_current.unsigned_long = int(to_xml(value))
+        return convert
+    if isinstance(cp_type, (OperationRefListAttributeProperty,
+                            EntryRefListAttributeProperty,
+                            AlertConditionRefListAttributeProperty)):
+        return _handle_ref_list_to_p
+    if isinstance(cp_type, DecimalListAttributeProperty):
+        return _decimal_list_to_p
+    if isinstance(cp_type, _AttributeListBase):
+        return _handle_ref_extend_to_p
+    if isinstance(cp_type, _AttributeBase):
+        to_xml = cp_type._converter.to_xml
+        if not cp_type.is_optional:
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                p_dest_current.string = to_xml(value)
+        elif hasattr(p_field, 'value'):
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                p_dest_current.value = to_xml(value)
+        elif hasattr(p_field, 'string'):
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                p_dest_current.string = to_xml(value)
+        else:
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                raise AttributeError(f'do not know how to handle {p_dest_current.__class__}')
+        return convert
+    if isinstance(cp_type, NodeTextQNameProperty):
+        if cp_type.is_optional:
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                raise TypeError(f'no handler for optional {p_dest_current.__class__.__name__} ')
+        else:
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                node_text_qname_to_p(value, p_dest_current)
+        return convert
+    if isinstance(cp_type, NodeTextProperty):
+        if cp_type.is_optional:
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                p_dest_current.value = value
+        else:
+            def convert(value, p_dest_current, p_entry, p_root, recurse_count):
+                setattr(p_entry, p_name, value)
+        return convert
+    if isinstance(cp_type, SubElementListProperty):
+        return _sub_element_list_to_p
+    if isinstance(cp_type, SubElementHandleRefListProperty):
+        return _sub_element_handle_ref_list_to_p
+    if isinstance(cp_type, SubElementTextListProperty):
+        return _extend_to_p
+    return _recursive_to_p
+
+
+def _compile_to_p_plan(pm_cls: type, p_dest: GeneratedProtocolMessageType) -> _ToPPlan:
+    """Walk the class hierarchy of pm_cls once and resolve everything that does not depend on values."""
+    special_handler_pm = _to_p_funcs_by_pm.get(pm_cls)
+    if special_handler_pm:
+        return _ToPPlan(lambda pm_src, p, recurse_count: special_handler_pm(pm_src, p, map_generic_to_p,
+                                                                            recurse_count + 1),
+                        [])
+    to_one_of_p_func = _to_one_of_p_funcs_by_p.get(p_dest.__class__)
+    if to_one_of_p_func:
+        return _ToPPlan(lambda pm_src, p, recurse_count: to_one_of_p_func(pm_src, p, map_generic_to_p,
+                                                                          recurse_count + 1),
+                        [])
+    segments = []
+    p_current_entry_point = None
+    for tmp_cls in inspect.getmro(pm_cls):
+        if tmp_cls.__name__.startswith('_'):
+            continue
+        elif tmp_cls is ExtensionLocalValue:
+            segments.append((None, True, []))
+            continue
+        elif tmp_cls in _stop_iter_classes:
+            break
+        pm_prop_names = tmp_cls.__dict__.get('_props', [])
+        if p_current_entry_point is None:
+            p_current_entry_point = p_dest
+            p_entry_name = None
+        else:
+            p_entry_name = name_to_p(tmp_cls.__name__)
+            p_current_entry_point = getattr(p_current_entry_point, p_entry_name)
+        steps = []
+        for pm_prop_name in pm_prop_names:
+            cp_type = getattr(pm_cls, pm_prop_name)
+            special_handler = _to_p_funcs_by_pm.get(cp_type.__class__)
+            if special_handler:
+                steps.append((pm_prop_name, None, special_handler))
+                continue
+            if isinstance(cp_type, _AttributeBase):
+                p_name = attr_name_to_p(pm_prop_name)
+            else:
+                p_name = p_name_from_pm_name(p_current_entry_point, pm_cls, pm_prop_name)
+            p_field = getattr(p_current_entry_point, p_name)
+            steps.append((pm_prop_name, p_name, _compile_to_p_converter(cp_type, p_name, p_field)))
+        segments.append((p_entry_name, False, steps))
+    return _ToPPlan(None, segments)
+
+
+def _execute_to_p_plan(plan: _ToPPlan,
+                       pm_src: PropertyBasedPMType,
+                       p_dest: GeneratedProtocolMessageType,
+                       recurse_count: int) -> GeneratedProtocolMessageType:
+    if plan.special_handler is not None:
+        plan.special_handler(pm_src, p_dest, recurse_count)
+        return p_dest
+    p_entry = p_dest
+    for p_entry_name, is_extension, steps in plan.segments:
+        if is_extension:
+            extension_from_pm(pm_src, p_dest)
+            continue
+        if p_entry_name is not None:
+            p_entry = getattr(p_entry, p_entry_name)
+        for pm_prop_name, p_name, convert in steps:
+            if p_name is None:
+                convert(pm_src, p_entry)
+                continue
+            value = getattr(pm_src, pm_prop_name)
+            if value in (None, []):
+                continue
+            convert(value, getattr(p_entry, p_name), p_entry, p_dest, recurse_count)
+    return p_dest
+
+
+def map_generic_to_p(pm_src: PropertyBasedPMType,
+                     p_dest: GeneratedProtocolMessageType,
+                     recurse_count: int,
+                     ):
+    """Copy data from a pm_types object to a proto object.
+     :param pm_src: the pm_types object to copy from
+     :param p_dest: the proto object to copy to.
+     :param recurse_count: used to calculate indent for log output
+    """
+    if not use_mapping_plans:
+        return _map_generic_to_p_reflective(pm_src, p_dest, recurse_count)
+    key = (pm_src.__class__, p_dest.__class__)
+    plan = _to_p_plans.get(key)
+    if plan is None:
+        try:
+            plan = _compile_to_p_plan(pm_src.__class__, p_dest)
+        except Exception:
+            _logger().debug('no to_p plan for %s, %s: %s', key[0].__name__, key[1].__name__,
+                            traceback.format_exc())
+            plan = _NO_PLAN
+        _to_p_plans[key] = plan
+    if plan is _NO_PLAN:
+        return _map_generic_to_p_reflective(pm_src, p_dest, recurse_count)
+    return _execute_to_p_plan(plan, pm_src, p_dest, recurse_count)
+
+
+class _FromPPlan:
+    """Pre-resolved steps that copy a protobuf class into a pm class.
+
+    segments is a list of (p_entry_name, special_handler, steps).
+    steps is a list of (p_name, check_optional, convert) tuples.
+    """
+    __slots__ = ('segments',)
+
+    def __init__(self, segments: list):
+        self.segments = segments
+
+
+def _setter(name: str, func: Callable) -> Callable:
+    """Return a convert function that sets pm_dest.name = func(p_src)."""
+    def convert(pm_dest, p_src, p_entry, recurse_count):
+        setattr(pm_dest, name, func(p_src))
+    return convert
+
+
+def _compile_from_p_attribute_list_converter(dest_type, name: str) -> Callable:
+    if isinstance(dest_type, AlertConditionRefListAttributeProperty):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            dest_list = getattr(pm_dest, name)
+            for elem in p_src.handle_ref:
+                dest_list.append(elem.string)
+    elif isinstance(dest_type, OperationRefListAttributeProperty):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            if p_src.handle_ref:
+                setattr(pm_dest, name, [src.string for src in p_src.handle_ref])
+    elif isinstance(dest_type, EntryRefListAttributeProperty):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            dest_list = getattr(pm_dest, name)
+            for src in p_src.handle_ref:
+                dest_list.append(src.string)
+    elif isinstance(dest_type, DecimalListAttributeProperty):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            getattr(pm_dest, name).extend(realtime_samples_from_p(p_src))
+    else:
+        # This is always a list of handles
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            getattr(pm_dest, name).extend(p_src.entry_ref)
+    return convert
+
+
+def _compile_from_p_attribute_converter(dest_type, name: str, p_name: str) -> Callable:
+    if isinstance(dest_type, EnumAttributeProperty):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            if p_entry.HasField(p_name):
+                setattr(pm_dest, name, enum_attr_from_p_func(p_entry, p_name, pm_dest, name))
+        return convert
+    if isinstance(dest_type, ReferencedVersionAttributeProperty):
+        return _setter(name, lambda p_src: p_src.version_counter.unsigned_long)
+    if isinstance(dest_type, VersionCounterAttributeProperty):
+        return _setter(name, lambda p_src: p_src.unsigned_long)
+    if isinstance(dest_type, DurationAttributeProperty):
+        return _setter(name, duration_from_p)
+    if isinstance(dest_type, QualityIndicatorAttributeProperty):
+        return _setter(name, lambda p_src: decimal_from_p(p_src.decimal))
+    if isinstance(dest_type, DecimalAttributeProperty):
+        return _setter(name, decimal_from_p)
+    if isinstance(dest_type, (TimestampAttributeProperty, CurrentTimestampAttributeProperty)):
+        return _setter(name, lambda p_src: p_src.unsigned_long / 1000)
+    if isinstance(dest_type, (HandleAttributeProperty,
+                              HandleRefAttributeProperty,
+                              LocalizedTextRefAttributeProperty,
+                              SymbolicCodeNameAttributeProperty,
+                              ExtensionAttributeProperty,
+                              CodeIdentifierAttributeProperty)):
+        return _setter(name, lambda p_src: p_src.string)
+    if isinstance(dest_type, AnyURIAttributeProperty):
+        return _setter(name, lambda p_src: p_src.any_u_r_i)
+    if isinstance(dest_type, (BooleanAttributeProperty, IntegerAttributeProperty, StringAttributeProperty)):
+        # handle optional / non-optional fields
+        is_optional = dest_type.is_optional
+
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            value = p_src.value if is_optional else p_src
+            if value is not None:
+                setattr(pm_dest, name, value)
+        return convert
+
+    def convert(pm_dest, p_src, p_entry, recurse_count):
+        raise RuntimeError(f'{dest_type}')
+    return convert
+
+
+def _compile_from_p_element_list_converter(dest_type, name: str) -> Callable:
+    if isinstance(dest_type, SubElementListProperty):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            dest_list = getattr(pm_dest, name)
+            for elem in p_src:
+                pm_factory = _from_one_of_p_factories.get(elem.__class__)
+                if pm_factory:
+                    dest_list.append(pm_factory(elem, map_generic_from_p, recurse_count + 1))
+                else:
+                    dest_list.append(map_generic_from_p(elem, None, recurse_count + 1))
+    elif isinstance(dest_type, SubElementHandleRefListProperty):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            dest_list = getattr(pm_dest, name)
+            for handle_ref_msg in p_src:
+                dest_list.append(handle_ref_msg.string)
+    elif isinstance(dest_type, (SubElementTextListProperty, SubElementWithSubElementListProperty)):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            getattr(pm_dest, name).extend(p_src)
+    else:
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            pass
+    return convert
+
+
+def _compile_from_p_sub_node_converter(dest_type, name: str, p_name: str, p_field: Any) -> Callable:
+    # this is a single biceps sub node, it can be optional
+    pm_factory = _from_one_of_p_factories.get(p_field.__class__)
+    if pm_factory:
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            setattr(pm_dest, name, pm_factory(p_src, map_generic_from_p, recurse_count + 1))
+        return convert
+    if isinstance(p_field, TransactionIdMsg):
+        return _setter(name, lambda p_src: p_src.unsigned_int)
+    if isinstance(dest_type, NodeTextQNameProperty):
+        return _setter(name, node_text_qname_from_p)
+    if isinstance(dest_type, NodeEnumTextProperty):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            if p_entry.HasField(p_name):
+                setattr(pm_dest, name, enum_attr_from_p_func(p_entry, p_name, pm_dest, name))
+        return convert
+    if isinstance(dest_type, NodeTextProperty):
+        if dest_type.is_optional:
+            return _setter(name, lambda p_src: p_src.value)
+        return _setter(name, lambda p_src: p_src)
+
+    def convert(pm_dest, p_src, p_entry, recurse_count):
+        if p_entry.HasField(p_name):
+            setattr(pm_dest, name, map_generic_from_p(p_src, None, recurse_count + 1))
+    return convert
+
+
+def _compile_from_p_step(pm_cls: type, name: str, p_root: GeneratedProtocolMessageType,
+                         p_entry: GeneratedProtocolMessageType) -> tuple[str, bool, Callable]:
+    """Return (p_name, check_optional, convert) for property name of pm_cls.
+
+    The order of the checks is the same as in _map_generic_from_p_reflective.
+    """
+    dest_type = getattr(pm_cls, name)
+    if isinstance(dest_type, SubElementWithSubElementListProperty):
+        # This is only a helper class, the real class is in value_class
+        dest_type = dest_type.value_class
+
+    if isinstance(dest_type, _AttributeBase):
+        p_name = attr_name_to_p(name)
+        check_optional = not isinstance(dest_type, _AttributeListBase) and dest_type.is_optional
+    else:
+        p_name = p_name_from_pm_name(p_root, pm_cls, name)
+        check_optional = not isinstance(dest_type, _ElementListProperty) and getattr(dest_type, 'is_optional',
+                                                                                      False)
+    p_field = getattr(p_entry, p_name)
+
+    special_handler = _from_p_factories.get(dest_type)
+    if special_handler:
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            setattr(pm_dest, name, special_handler(p_src, map_generic_from_p, recurse_count + 1))
+    elif isinstance(p_field, ExtensionMsg):
+        def convert(pm_dest, p_src, p_entry, recurse_count):
+            extension_from_p(pm_dest, p_src, name)
+    elif isinstance(dest_type, _AttributeListBase):
+        convert = _compile_from_p_attribute_list_converter(dest_type, name)
+    elif isinstance(dest_type, _AttributeBase):
+        convert = _compile_from_p_attribute_converter(dest_type, name, p_name)
+    elif isinstance(dest_type, _ElementListProperty):
+        convert = _compile_from_p_element_list_converter(dest_type, name)
+    else:
+        check_optional = dest_type.is_optional
+        convert = _compile_from_p_sub_node_converter(dest_type, name, p_name, p_field)
+    return p_name, check_optional, convert
+
+
+def _compile_from_p_plan(pm_cls: type, p: GeneratedProtocolMessageType) -> _FromPPlan:
+    """Walk the class hierarchy of pm_cls once and resolve everything that does not depend on values."""
+    segments = []
+    p_current_entry_point = None
+    for tmp_cls in inspect.getmro(pm_cls):
+        if tmp_cls.__name__.startswith('_'):
+            continue
+        elif tmp_cls in _stop_iter_classes:
+            break
+        names = tmp_cls.__dict__.get('_props', [])
+        if p_current_entry_point is None:
+            p_current_entry_point = p
+            p_entry_name = None
+        else:
+            p_entry_name = name_to_p(tmp_cls.__name__)
+            p_current_entry_point = getattr(p_current_entry_point, p_entry_name)
+        special_handler = _from_p_factories.get(tmp_cls)
+        if special_handler:
+            segments.append((p_entry_name, special_handler, []))
+            break
+        steps = [_compile_from_p_step(pm_cls, name, p, p_current_entry_point) for name in names]
+        segments.append((p_entry_name, None, steps))
+    return _FromPPlan(segments)
+
+
+def _execute_from_p_plan(plan: _FromPPlan,
+                         p: GeneratedProtocolMessageType,
+                         pm_dest: PropertyBasedPMType,
+                         recurse_count: int) -> PropertyBasedPMType:
+    p_entry = p
+    for p_entry_name, special_handler, steps in plan.segments:
+        if p_entry_name is not None:
+            p_entry = getattr(p_entry, p_entry_name)
+        if special_handler is not None:
+            special_handler(p_entry, pm_dest)
+            break
+        for p_name, check_optional, convert in steps:
+            if check_optional and not p_entry.HasField(p_name):
+                # optional value, not set
+                continue
+            convert(pm_dest, getattr(p_entry, p_name), p_entry, recurse_count)
+    return pm_dest
+
+
+def _instantiate_from_p(p: GeneratedProtocolMessageType, recurse_count: int) -> PropertyBasedPMType:
+    """Create a new pm instance for p, with all constructor parameters = None."""
+    try:
+        pm_factory, pm_cls, args_count = _from_p_constructors[p.__class__]
+    except KeyError:
+        pm_factory = _from_one_of_p_factories.get(p.__class__)
+        if pm_factory:
+            pm_cls, args_count = None, 0
+        else:
+            pm_cls = _from_cls[p.__class__]
+            # use inspect to determine number of parameters for constructor.
+            args_count = len(inspect.signature(pm_cls.__init__).parameters) - 1
+        _from_p_constructors[p.__class__] = pm_factory, pm_cls, args_count
+    if pm_factory:
+        return pm_factory(p, map_generic_from_p, recurse_count + 1)
+    return pm_cls(*[None] * args_count)
+
+
+def map_generic_from_p(p: GeneratedProtocolMessageType,
+                       pm_dest: PropertyBasedPMType | None,
+                       recurse_count: int):
+    """Copy data from a proto object to a pm_types object.
+
+    If pm_dest is None, a new pm_types object is instantiated.
+    """
+    if not use_mapping_plans:
+        return _map_generic_from_p_reflective(p, pm_dest, recurse_count)
+    if pm_dest is None:
+        if p.__class__ in _from_one_of_p_factories:
+            return _instantiate_from_p(p, recurse_count)
+        pm_dest = _instantiate_from_p(p, recurse_count)
+    key = (pm_dest.__class__, p.__class__)
+    plan = _from_p_plans.get(key)
+    if plan is None:
+        try:
+            plan = _compile_from_p_plan(pm_dest.__class__, p)
+        except Exception:
+            _logger().debug('no from_p plan for %s, %s: %s', key[0].__name__, key[1].__name__,
+                            traceback.format_exc())
+            plan = _NO_PLAN
+        _from_p_plans[key] = plan
+    if plan is _NO_PLAN:
+        return _map_generic_from_p_reflective(p, pm_dest, recurse_count)
+    return _execute_from_p_plan(plan, p, pm_dest, recurse_count)
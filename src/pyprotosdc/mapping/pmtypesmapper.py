@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import array
 import decimal
 import logging
 from typing import List, Callable
 
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, array('d') is used instead
+    np = None
+
 from google.protobuf.wrappers_pb2 import Int32Value
 from lxml import etree as etree_
 from org.somda.protosdc.proto.model.biceps.abstractstateoneof_pb2 import AbstractStateOneOfMsg
@@ -39,7 +45,7 @@ from sdc11073.xml_types.xml_structure import (ExtensionLocalValue
                                               )
 
 from .basic_mappers import (string_value_to_p, string_value_from_p,
-                            decimal_to_p, decimal_from_p,
+                            decimal_to_p, decimal_from_p, decimal_from_p_as_float,
                             enum_attr_to_p, enum_attr_from_p_func)
 from .mapping_helpers import (attr_name_to_p,
                               p_name_from_pm_name,
@@ -132,13 +138,63 @@ def instance_identifier_from_oneof_p(p: InstanceIdentifierOneOfMsg,
     return None
 
 
-def _realtime_array_to_p(samples: List[str],
-                         p: RealTimeValueTypeMsg,
-                         recurse_count: int) -> None:
-    for s in samples:
-        tmp = common_types_pb2.Decimal()
-        decimal_to_p(s, tmp)
-        p.decimal.append(tmp)
+# Realtime samples can also be given as numpy array or array('d') of floats, e.g. by code that writes
+# waveform messages without SampleArrayValue instances (pm types only accept lists of Decimals).
+# Float samples are written with a fixed scale, e.g. scale 6 means 1.5 => value=1500000, scale=6.
+realtime_samples_scale = 6
+# If True, received realtime samples are decoded to floats instead of Decimals (see realtime_samples_from_p),
+# e.g. for a consumer that keeps waveforms in a NumpyRtBuffer.
+realtime_samples_as_floats = False
+
+
+def _is_float_array(samples) -> bool:
+    return isinstance(samples, array.array) or (np is not None and isinstance(samples, np.ndarray))
+
+
+def realtime_array_to_p(samples,
+                        p: RealTimeValueTypeMsg,
+                        scale: int | None = None) -> None:
+    """Write samples to the decimal list of p.
+
+    samples is a list of Decimals, a numpy array or an array('d').
+    Float arrays are scaled to integers in one step, no Decimal objects are created.
+    """
+    add = p.decimal.add
+    if _is_float_array(samples):
+        if scale is None:
+            scale = realtime_samples_scale
+        factor = 10 ** scale
+        if np is not None:
+            values = np.rint(np.asarray(samples, dtype=np.float64) * factor).astype(np.int64).tolist()
+        else:
+            values = [round(sample * factor) for sample in samples]
+        for value in values:
+            add(value=value, scale=scale)
+    else:
+        for sample in samples:
+            decimal_to_p(sample, add())
+
+
+def realtime_array_from_p_as_floats(p: RealTimeValueTypeMsg):
+    """Return the samples of p as numpy array, or array('d') if numpy is not available."""
+    decimals = p.decimal
+    if np is not None:
+        values = np.asarray([d.value for d in decimals], dtype=np.int64)
+        scales = np.asarray([d.scale for d in decimals], dtype=np.int64)
+        if len(scales) and (scales == scales[0]).all():  # realtime_array_to_p writes one scale for all samples
+            return values / 10.0 ** int(scales[0])
+        return values / np.power(10.0, scales)
+    return array.array('d', [decimal_from_p_as_float(d) for d in decimals])
+
+
+def realtime_samples_from_p(p: RealTimeValueTypeMsg) -> list:
+    """Return the samples of p as list of Decimals, or as list of floats if realtime_samples_as_floats is True.
+
+    pm types only check the type of Samples when it is assigned, the generic mappers extend the list.
+    """
+    if realtime_samples_as_floats:
+        return realtime_array_from_p_as_floats(p).tolist()
+    return [decimal_from_p(d) for d in p.decimal]
 
 
 def _realtime_array_from_p(p: RealTimeValueTypeMsg) -> list[decimal.Decimal]:
@@ -7,6 +7,11 @@ from .mapping.mapping_helpers import attr_name_to_p, find_one_of_state
 class MdibStructureError(Exception):
     pass
 
+
+def read_descriptor_handle(p_state_one_of: AbstractStateOneOfMsg) -> str:
+    """The descriptor handle of a state, without decoding the state."""
+    return sm.p_get_attr_value(find_one_of_state(p_state_one_of), 'DescriptorHandle').string
+
 if TYPE_CHECKING:
     from org.somda.protosdc.proto.model.biceps.abstractstateoneof_pb2 import AbstractStateOneOfMsg
     from org.somda.protosdc.proto.model import sdc_services_pb2_grpc, sdc_messages_pb2
@@ -110,16 +115,17 @@ class MessageReader(object):
             ret.extend(self._read_abstract_complex_device_component_descriptor_children(p_mds))
         return ret
 
+    @classmethod
+    def read_states(cls, p_states: list[AbstractStateOneOfMsg], mdib: GClientMdibContainer | None) -> list[AbstractStateContainer]:
+        return [cls.read_state(p_state_one_of, mdib) for p_state_one_of in p_states]
+
     @staticmethod
-    def read_states(p_states: list[AbstractStateOneOfMsg], mdib: GClientMdibContainer | None) -> list[AbstractStateContainer]:
-        ret = []
-        for p_state_one_of in p_states:
-            p_state = find_one_of_state(p_state_one_of)
-            descr_handle = sm.p_get_attr_value(p_state, 'DescriptorHandle').string
-            descr = None if mdib is None else mdib.descriptions.handle.get_one(descr_handle)
-            state = sm.generic_state_from_p(p_state, descr)
-            ret.append(state)
-        return ret
+    def read_state(p_state_one_of: AbstractStateOneOfMsg, mdib: GClientMdibContainer | None) -> AbstractStateContainer:
+        p_state = find_one_of_state(p_state_one_of)
+        descr = None
+        if mdib is not None:
+            descr = mdib.descriptions.handle.get_one(read_descriptor_handle(p_state_one_of))
+        return sm.generic_state_from_p(p_state, descr)
 
     @staticmethod
     def read_descriptors(p_descriptors, parent_handle):
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent import futures
+
+import grpc
+
+from org.somda.protosdc.proto.model import sdc_services_pb2_grpc
+from org.somda.protosdc.proto.model.metadata import metadata_services_pb2_grpc
+
+from pyprotosdc.provider.provider import GSdcProvider
+from pyprotosdc.provider.services.mdibreportingservice import AioMdibReportingService
+from pyprotosdc.provider.services.mdibreportingservice import add_mdib_reporting_service_to_server
+from pyprotosdc.provider.services.getservice import add_get_service_to_server
+from pyprotosdc.provider.services.setservice import AioSetService
+from . import subscriptionmgr
+
+
+class AioGSdcProvider(GSdcProvider):
+    """GSdcProvider that runs a grpc.aio server.
+
+    The report streams (EpisodicReport, OperationInvokedReport) are coroutines in the event loop of the server,
+    therefore the number of streams is not limited by the thread pool. Get, Set, Metadata etc. stay synchronous
+    and run in the migration thread pool of the server (max_workers threads).
+    Mdib transactions are still committed in any thread, the reports are handed to the event loop thread-safe.
+    """
+    subscriptions_manager_cls = subscriptionmgr.AioGSubscriptionsManager
+    set_service_cls = AioSetService
+    mdib_reporting_service_cls = AioMdibReportingService
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._subscriptions_manager.max_subscriptions = None  # streams do not need a thread
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _serve(self):
+        asyncio.run(self._aio_serve())
+        print('server terminated')
+
+    async def _aio_serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=self._max_workers,
+                                                                  thread_name_prefix='grpc_thr_p'),
+                                       options=self._grpc_options,
+                                       maximum_concurrent_rpcs=self._maximum_concurrent_rpcs,
+                                       compression=self._compression)
+
+        add_get_service_to_server(self.get_service, self._server)
+        sdc_services_pb2_grpc.add_SetServiceServicer_to_server(self.set_service, self._server)
+        add_mdib_reporting_service_to_server(self.mdib_reporting_service, self._server)
+        sdc_services_pb2_grpc.add_LocalizationServiceServicer_to_server(self.localization_service, self._server)
+        sdc_services_pb2_grpc.add_ArchiveServiceServicer_to_server(self.archive_service, self._server)
+        metadata_services_pb2_grpc.add_MetadataServiceServicer_to_server(self.metadata_service, self._server)
+        addrs = self._g_discovery.get_active_addresses()
+        self._port_number = self._server.add_insecure_port(f'{addrs[0]}:0')
+        self._x_addr = (addrs[0], self._port_number)
+        await self._server.start()
+        print('server started')
+        await self._server.wait_for_termination()
+
+    def _stop_server(self, grace: float):
+        if self._loop is None or self._loop.is_closed():
+            return
+        stopped = asyncio.run_coroutine_threadsafe(self._server.stop(grace), self._loop)
+        stopped.result(timeout=grace + 5)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any
+
+from ..mapping.descriptorsmapper import generic_descriptor_to_p
+from ..mapping.statesmapper import generic_state_to_p
+
+if TYPE_CHECKING:
+    from google.protobuf.message import Message
+    from sdc11073.mdib.descriptorcontainers import AbstractDescriptorContainer
+    from sdc11073.mdib.statecontainers import AbstractStateContainer
+
+
+class FragmentCache:
+    """Keeps the protobuf representation of descriptors and states.
+
+    Descriptors are keyed by (Handle, DescriptorVersion), states by (Handle or DescriptorHandle, StateVersion),
+    both also by the class of the destination message, because the same container is mapped into different
+    one-of messages (e.g. GetMdibResponse and EpisodicMetricReport).
+    Only the newest version per handle is kept, an older version is replaced when the version changes.
+    Real time sample array states are not cached, they change with every transaction.
+    The cached messages are copied into the destination, they are never part of a response.
+    The cache is used by Get requests, report threads and transaction observers. Mapping is done outside
+    of the lock; remove and clear increment the generation, a fragment that was mapped before is not stored.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._descriptors: dict[tuple[str, Any], tuple[int, Message]] = {}
+        self._states: dict[tuple[str, Any], tuple[int, Message]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def descriptor_to_p(self, descr: AbstractDescriptorContainer, p: Message | None) -> Message:
+        """Same as generic_descriptor_to_p, but copies a cached fragment if possible. Returns p."""
+        if not self.enabled or p is None:
+            return generic_descriptor_to_p(descr, p)
+        return self._to_p(self._descriptors, descr.Handle, descr.DescriptorVersion, descr, p,
+                          generic_descriptor_to_p)
+
+    def state_to_p(self, state: AbstractStateContainer, p: Message | None) -> Message:
+        """Same as generic_state_to_p, but copies a cached fragment if possible. Returns p."""
+        if not self.enabled or p is None or state.is_realtime_sample_array_metric_state:
+            return generic_state_to_p(state, p)
+        handle = state.Handle if state.is_multi_state else state.DescriptorHandle
+        return self._to_p(self._states, handle, state.StateVersion, state, p, generic_state_to_p)
+
+    def _to_p(self, fragments: dict, handle: str, version: int, container, p: Message, to_p) -> Message:
+        key = (handle, p.__class__)
+        with self._lock:
+            entry = fragments.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+                generation = self._generation
+        if entry is not None:
+            p.MergeFrom(entry[1])  # p is always a new message, MergeFrom is cheaper than CopyFrom
+            return p
+        to_p(container, p)
+        fragment = p.__class__()
+        fragment.CopyFrom(p)
+        with self._lock:
+            if generation == self._generation:
+                fragments[key] = (version, fragment)
+        return p
+
+    def remove(self, handles: list[str]):
+        """Remove all fragments of the handles, e.g. of deleted descriptors."""
+        handles = set(handles)
+        with self._lock:
+            self._generation += 1
+            for fragments in (self._descriptors, self._states):
+                for key in [key for key in fragments if key[0] in handles]:
+                    del fragments[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._descriptors.clear()
+            self._states.clear()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from typing import TYPE_CHECKING, Any
+from collections import Counter
 from concurrent import futures
 import traceback
 import threading
@@ -16,13 +17,19 @@ from pyprotosdc.provider.services.getservice import GetService
 from pyprotosdc.provider.services.setservice import SetService
 from pyprotosdc.provider.services.metadataservice import MetadataService
 from pyprotosdc.provider.services.mdibreportingservice import MdibReportingService
+from pyprotosdc.provider.services.mdibreportingservice import add_mdib_reporting_service_to_server
+from pyprotosdc.provider.services.getservice import add_get_service_to_server
 from . import subscriptionmgr
+from pyprotosdc.actions import ReportAction
+from .reportdispatcher import ReportDispatcher
+from .fragmentcache import FragmentCache
+from .reporthistory import ReportHistory
 from pyprotosdc.provider.services.localizationservice import LocalizationService
 from ..msgreader import MessageReader
 from pyprotosdc.provider.services.archiveservice import ArchiveService
 from sdc11073.intervaltimer import IntervalTimer
 from sdc11073.exceptions import ApiUsageError
-from .sco import ScoOperationsRegistry
+from .sco import ScoOperationsRegistry, RejectionPolicy
 from sdc11073.xml_types import pm_types, pm_qnames
 from sdc11073.location import SdcLocation
 from sdc11073 import loghelper
@@ -37,6 +44,7 @@ if TYPE_CHECKING:
     from sdc11073.provider.operations import OperationDefinitionBase
     from sdc11073.mdib.providermdib import ProviderMdib
     from sdc11073.mdib.transactionsprotocol import TransactionResultProtocol
+    from sdc11073.mdib.mdibbase import MdibVersionGroup
     from sdc11073.xml_types.dpws_types import ThisDeviceType, ThisModelType
     from sdc11073.xml_types import msg_types
     from sdc11073.certloader import SSLContextContainer
@@ -45,6 +53,11 @@ if TYPE_CHECKING:
 
 
 class GSdcProvider(object):
+    # classes that a derived provider (e.g. the grpc.aio variant) can replace
+    subscriptions_manager_cls = subscriptionmgr.GSubscriptionsManager
+    set_service_cls = SetService
+    mdib_reporting_service_cls = MdibReportingService
+
     def __init__(self,
                  g_discovery: GDiscovery,
                  this_model: ThisModelType,
@@ -54,8 +67,61 @@ class GSdcProvider(object):
                  ssl_context_container: SSLContextContainer | None = None,
                  max_subscription_duration: int = 15,
                  socket_timeout: int | float | None = None,
-                 log_prefix: str = '' ): #pylint:disable=too-many-arguments
-        """Construct a GSdcProvider."""
+                 log_prefix: str = '',
+                 serialize_reports_once: bool = True,
+                 report_dispatcher_workers: int = 0,
+                 report_dispatcher_queue_size: int = 1000,
+                 report_coalescing_window: float = 0,
+                 max_workers: int = 34,
+                 reserved_unary_workers: int = 2,
+                 maximum_concurrent_rpcs: int | None = None,
+                 grpc_options: list[tuple[str, Any]] | None = None,
+                 compression: grpc.Compression | None = None,
+                 cache_fragments: bool = True,
+                 sco_workers: int = 1,
+                 sco_max_queue_size: int = 10,
+                 sco_rejection_policy: RejectionPolicy = RejectionPolicy.BLOCK,
+                 operation_invoked_window: float = 0,
+                 collapse_wait_start: bool = False,
+                 waveform_batch_interval: float = 0,
+                 priority_lanes: bool = False,
+                 report_history_bytes: int = 0): #pylint:disable=too-many-arguments
+        """Construct a GSdcProvider.
+
+        If report_dispatcher_workers > 0, reports are mapped and sent in that many worker threads
+        instead of the thread that commits the mdib transaction.
+        If report_coalescing_window > 0, metric, alert and operational state updates within this time (in seconds)
+        are sent as one report per report type, with only the newest state per descriptor handle.
+        max_workers is the thread pool size of the grpc server. Every report stream (EpisodicReport,
+        OperationInvokedReport) occupies one thread for its lifetime, therefore only
+        max_workers - reserved_unary_workers streams are accepted. This guarantees that Get / Set calls
+        always find a free thread. The limit counts streams, not consumers: a GSdcConsumer opens two streams,
+        so the default of 34 workers accepts 16 consumers.
+        maximum_concurrent_rpcs, grpc_options (e.g. max. message size, keepalive) and compression are passed
+        to grpc.server.
+        If cache_fragments is True, the protobuf representation of every descriptor and state is kept per version
+        and reused by Get responses and reports.
+        Delayed operations of every sco are executed by sco_workers threads, operations with the same
+        operation target are executed one after the other. At most sco_max_queue_size operations wait for
+        execution, further requests fail according to sco_rejection_policy.
+        If operation_invoked_window > 0, invocation states within this time (in seconds) are sent as one
+        OperationInvokedReport. With collapse_wait_start, WAIT and START are omitted if the final state
+        of the invocation is in the same report.
+        If waveform_batch_interval > 0, the waveform reports within this time (in seconds) are sent as one report.
+        This is the default for new subscriptions (see also collectRtSamplesPeriod), a consumer can request
+        another interval per subscription with the grpc metadata key "waveform-batch-interval-ms".
+        With priority_lanes, every subscription delivers alert and operation reports before metric and context
+        reports, and those before waveforms (see ReportQueue for the starvation limit). Reports are then no longer
+        in mdib version order, a GClientMdibContainer needs accept_reordered_reports. Batched waveforms are still
+        put into the queue before the next other report, but with priority lanes they can be delivered after it.
+        DescriptionModificationReports are never reordered.
+        If report_history_bytes > 0, the last serialized episodic reports (up to this size) are kept, and a consumer
+        whose subscription broke gets the reports it missed instead of having to call GetMdib again.
+        The reports of a broken subscription are recorded for ReportHistory.resume_timeout seconds.
+        """
+        if max_workers <= reserved_unary_workers:
+            raise ValueError(f'max_workers={max_workers} must be greater than '
+                             f'reserved_unary_workers={reserved_unary_workers}')
         if g_discovery is None:
             raise ValueError('g_discovery is None')
         self._g_discovery = g_discovery
@@ -64,19 +130,36 @@ class GSdcProvider(object):
         self._log_prefix = log_prefix
         self._sslContext=None
         self._mdib = mdib
-        self._subscriptions_manager =  subscriptionmgr.GSubscriptionsManager(self._mdib.sdc_definitions,
-                                                                             max_subscription_duration,
-                                                                             log_prefix=self._log_prefix)
+        self.fragment_cache = FragmentCache(enabled=cache_fragments)
+        self._sco_workers = sco_workers
+        self._sco_max_queue_size = sco_max_queue_size
+        self._sco_rejection_policy = sco_rejection_policy
+        report_history = ReportHistory(report_history_bytes) if report_history_bytes > 0 else None
+        self._subscriptions_manager = self.subscriptions_manager_cls(self._mdib.sdc_definitions,
+                                                                     max_subscription_duration,
+                                                                     log_prefix=self._log_prefix,
+                                                                     serialize_once=serialize_reports_once,
+                                                                     coalescing_window=report_coalescing_window,
+                                                                     max_subscriptions=max_workers - reserved_unary_workers,
+                                                                     fragment_cache=self.fragment_cache,
+                                                                     operation_invoked_window=operation_invoked_window,
+                                                                     collapse_wait_start=collapse_wait_start,
+                                                                     waveform_batch_interval=waveform_batch_interval,
+                                                                     priority_lanes=priority_lanes,
+                                                                     report_history=report_history)
+        self._max_workers = max_workers
+        self._maximum_concurrent_rpcs = maximum_concurrent_rpcs
+        self._grpc_options = grpc_options
+        self._compression = compression
         self._location = None
         self._server = None
         self._server_thread = None
         self._rtSampleSendThread = None
-        self.collectRtSamplesPeriod = 0.1  # in seconds
         self._x_addr: tuple[str, int] | None = None
         self._transaction_id = 0  # central transaction number handling for all called operations.
         self._transaction_id_lock = threading.Lock()
-        self.get_service = GetService(self._mdib)
-        self.set_service = SetService(self)
+        self.get_service = GetService(self._mdib, self.fragment_cache)
+        self.set_service = self.set_service_cls(self)
         self.metadata_service = MetadataService(self)
 
         sco_descr_list = self._mdib.descriptions.NODETYPE.get(pm_qnames.ScoDescriptor, [])
@@ -92,7 +175,7 @@ class GSdcProvider(object):
             role_provider = DefaultProduct(self._mdib, sco, self._log_prefix)
             self.product_lookup[sco_descr.Handle] = role_provider
 
-        self.mdib_reporting_service = MdibReportingService(self._subscriptions_manager)
+        self.mdib_reporting_service = self.mdib_reporting_service_cls(self._subscriptions_manager)
         self.localization_service = LocalizationService(self._mdib)
         self.archive_service = ArchiveService(self._mdib)
 
@@ -104,7 +187,17 @@ class GSdcProvider(object):
 
         self._logger = loghelper.get_logger_adapter('sdc.grpc.provider', log_prefix) # logging.getLogger('sdc.device')
         self.msg_reader = MessageReader(self._logger)
-        properties.bind(self._mdib, transaction=self._send_episodic_reports)
+        self._report_dispatcher = None
+        if report_dispatcher_workers > 0:
+            self._report_dispatcher = ReportDispatcher(self._send_episodic_reports,
+                                                       report_dispatcher_workers,
+                                                       report_dispatcher_queue_size,
+                                                       log_prefix)
+            self._subscriptions_manager.delivery_gate = self._report_dispatcher.wait_for_turn
+        # reports that were not mapped because nobody subscribed to them, key is the ReportAction
+        self.skipped_reports = Counter()
+        self.skipped_report_entries = Counter()  # number of states / descriptors in skipped reports
+        properties.bind(self._mdib, transaction=self._on_transaction)
 
         # deviceMdibContainer.setSdcDevice(self)
 
@@ -112,6 +205,8 @@ class GSdcProvider(object):
     def start_all(self, startRealtimeSampleLoop=True, shared_http_server=None):
         for pr in self.product_lookup.values():
             pr.init_operations()
+        if self._report_dispatcher is not None:
+            self._report_dispatcher.start()
         self._server_thread = threading.Thread(target=self._serve, name='grpc_server')
         self._server_thread.daemon = True
         self._server_thread.start()
@@ -129,14 +224,32 @@ class GSdcProvider(object):
             self._runRtSampleThread = False
             self._rtSampleSendThread.join()
             self._rtSampleSendThread = None
+        if self._report_dispatcher is not None:
+            self._report_dispatcher.stop()
         self._subscriptions_manager.stop()
         if self._server:
-            self._server.stop(grace=2)
+            self._stop_server(grace=2)
+
+    def _stop_server(self, grace: float):
+        self._server.stop(grace=grace)
 
     @property
     def subscriptions_manager(self) ->  subscriptionmgr.GSubscriptionsManager:
         return self._subscriptions_manager
 
+    def get_subscription_stats(self) -> list[subscriptionmgr.SubscriptionStats]:
+        """Delivery statistics of all subscriptions, e.g. to find a consumer that falls behind."""
+        return self._subscriptions_manager.get_subscription_stats()
+
+    @property
+    def collectRtSamplesPeriod(self) -> float:
+        """Waveform batch interval of new subscriptions in seconds, 0 means no batching."""
+        return self._subscriptions_manager.waveform_batch_interval
+
+    @collectRtSamplesPeriod.setter
+    def collectRtSamplesPeriod(self, value: float):
+        self._subscriptions_manager.waveform_batch_interval = value
+
 
     # def start_realtimesample_loop(self):
     #     if not self._rtSampleSendThread:
@@ -194,12 +307,15 @@ class GSdcProvider(object):
             return self._transaction_id
 
     def _serve(self):
-        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=10,
-                                                              thread_name_prefix='grpc_thr_p'))
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=self._max_workers,
+                                                              thread_name_prefix='grpc_thr_p'),
+                                   options=self._grpc_options,
+                                   maximum_concurrent_rpcs=self._maximum_concurrent_rpcs,
+                                   compression=self._compression)
 
-        sdc_services_pb2_grpc.add_GetServiceServicer_to_server(self.get_service, self._server)
+        add_get_service_to_server(self.get_service, self._server)
         sdc_services_pb2_grpc.add_SetServiceServicer_to_server(self.set_service, self._server)
-        sdc_services_pb2_grpc.add_MdibReportingServiceServicer_to_server(self.mdib_reporting_service, self._server)
+        add_mdib_reporting_service_to_server(self.mdib_reporting_service, self._server)
         sdc_services_pb2_grpc.add_LocalizationServiceServicer_to_server(self.localization_service, self._server)
         sdc_services_pb2_grpc.add_ArchiveServiceServicer_to_server(self.archive_service, self._server)
         metadata_services_pb2_grpc.add_MetadataServiceServicer_to_server(self.metadata_service, self._server)
@@ -343,7 +459,10 @@ class GSdcProvider(object):
                                          op_cls_getter,
                                          self._mdib,
                                          sco_descr,
-                                         log_prefix=self._log_prefix)
+                                         log_prefix=self._log_prefix,
+                                         workers_count=self._sco_workers,
+                                         max_queue_size=self._sco_max_queue_size,
+                                         rejection_policy=self._sco_rejection_policy)
 
     def _mk_default_role_handlers(self):
         from sdc11073.roles.product import DefaultProduct
@@ -352,51 +471,56 @@ class GSdcProvider(object):
                               self._log_prefix)
 
 
-    def _send_episodic_reports(self, transaction_result: TransactionResultProtocol):
+    def _on_transaction(self, transaction_result: TransactionResultProtocol):
         mdib_version_group = self._mdib.mdib_version_group
+        if self._report_dispatcher is not None:
+            self._report_dispatcher.dispatch(transaction_result, mdib_version_group)
+        else:
+            self._send_episodic_reports(transaction_result, mdib_version_group)
+
+    def _send_episodic_reports(self, transaction_result: TransactionResultProtocol,
+                               mdib_version_group: MdibVersionGroup):
+        # Only report types that at least one subscription requested are mapped.
+        requested_actions = self._subscriptions_manager.requested_actions()
 
         if transaction_result.has_descriptor_updates:
-            # port_type_impl = self.hosted_services.description_event_service
-            updated = transaction_result.descr_updated
-            created = transaction_result.descr_created
-            deleted = transaction_result.descr_deleted
-            states = transaction_result.all_states()
-            self._subscriptions_manager.send_descriptor_updates(
-                updated, created, deleted, states, mdib_version_group)
-
-        states = transaction_result.metric_updates
-        if len(states) > 0:
-            self._subscriptions_manager.send_episodic_metric_report(states, mdib_version_group)
-            # self._periodic_reports_handler.store_metric_states(mdib_version_group.mdib_version,
-            #                                                    transaction_result.metric_updates)
-
-        states = transaction_result.alert_updates
-        if len(states) > 0:
-            # port_type_impl = self.hosted_services.state_event_service
-            self._subscriptions_manager.send_episodic_alert_report(
-                states, mdib_version_group)
-            # self._periodic_reports_handler.store_alert_states(mdib_version_group.mdib_version, states)
-
-        states = transaction_result.comp_updates
-        if len(states) > 0:
-            # port_type_impl = self.hosted_services.state_event_service
-            self._subscriptions_manager.send_episodic_component_state_report(
-                states, mdib_version_group)
-            # self._periodic_reports_handler.store_component_states(mdib_version_group.mdib_version, states)
-
-        states = transaction_result.ctxt_updates
-        if len(states) > 0:
-
-            self._subscriptions_manager.send_episodic_context_report(states, mdib_version_group)
-            # self._periodic_reports_handler.store_context_states(mdib_version_group.mdib_version, states)
-
-        states = transaction_result.op_updates
-        if len(states) > 0:
-            # port_type_impl = self.hosted_services.state_event_service
-            self._subscriptions_manager.send_episodic_operational_state_report(states, mdib_version_group)
-            # self._periodic_reports_handler.store_operational_states(mdib_version_group.mdib_version, states)
-
-        states = transaction_result.rt_updates
-        if len(states) > 0:
-            # port_type_impl = self.hosted_services.waveform_service
-            self._subscriptions_manager.send_realtime_samples_report(states, mdib_version_group)
+            if ReportAction.DescriptionModificationReport.value in requested_actions:
+                updated = transaction_result.descr_updated
+                created = transaction_result.descr_created
+                deleted = transaction_result.descr_deleted
+                states = transaction_result.all_states()
+                self._subscriptions_manager.send_descriptor_updates(
+                    updated, created, deleted, states, mdib_version_group)
+            else:
+                self._count_skipped_report(ReportAction.DescriptionModificationReport,
+                                           len(transaction_result.descr_updated)
+                                           + len(transaction_result.descr_created)
+                                           + len(transaction_result.descr_deleted))
+                self._subscriptions_manager.skip_report(ReportAction.DescriptionModificationReport,
+                                                        mdib_version_group)
+
+        mgr = self._subscriptions_manager
+        for action, states, send_func in (
+                (ReportAction.EpisodicMetricReport, transaction_result.metric_updates,
+                 mgr.send_episodic_metric_report),
+                (ReportAction.EpisodicAlertReport, transaction_result.alert_updates,
+                 mgr.send_episodic_alert_report),
+                (ReportAction.EpisodicComponentReport, transaction_result.comp_updates,
+                 mgr.send_episodic_component_state_report),
+                (ReportAction.EpisodicContextReport, transaction_result.ctxt_updates,
+                 mgr.send_episodic_context_report),
+                (ReportAction.EpisodicOperationalStateReport, transaction_result.op_updates,
+                 mgr.send_episodic_operational_state_report),
+                (ReportAction.Waveform, transaction_result.rt_updates,
+                 mgr.send_realtime_samples_report)):
+            if len(states) == 0:
+                continue
+            if action.value in requested_actions:
+                send_func(states, mdib_version_group)
+            else:
+                self._count_skipped_report(action, len(states))
+                mgr.skip_report(action, mdib_version_group)
+
+    def _count_skipped_report(self, action: ReportAction, entries_count: int):
+        self.skipped_reports[action] += 1
+        self.skipped_report_entries[action] += entries_count
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import queue
+import threading
+import traceback
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable
+
+from sdc11073 import loghelper
+
+if TYPE_CHECKING:
+    from sdc11073.mdib.mdibbase import MdibVersionGroup
+    from sdc11073.mdib.transactionsprotocol import TransactionResultProtocol
+
+
+@dataclass
+class _EnqueuedTransaction:
+    sequence_number: int
+    transaction_result: TransactionResultProtocol | None
+    mdib_version_group: MdibVersionGroup | None
+
+
+stop_msg = _EnqueuedTransaction(-1, None, None)  # special instance that is used as stop message
+
+
+class ReportDispatcher:
+    """Maps and sends the reports of mdib transactions in worker threads.
+
+    The thread that commits a transaction only enqueues the transaction result.
+    With more than one worker, transactions are mapped in parallel, but delivered to the subscriptions
+    in the order of the transactions. send_func must call wait_for_turn before it hands a report to the
+    subscriptions.
+    """
+
+    def __init__(self,
+                 send_func: Callable[[TransactionResultProtocol, MdibVersionGroup], None],
+                 workers_count: int = 1,
+                 max_queue_size: int = 1000,
+                 log_prefix: str = ''):
+        self._send_func = send_func
+        self._workers_count = workers_count
+        self._queue = queue.Queue(max_queue_size)  # put blocks if the queue is full, transactions are never dropped
+        self._workers: list[threading.Thread] = []
+        self._sequence_number = 0  # last enqueued transaction
+        self._sequence_lock = threading.Lock()
+        self._next_to_deliver = 1
+        self._turn = threading.Condition()
+        self._local = threading.local()
+        self._logger = loghelper.get_logger_adapter('sdc.grpc.dev.report_dispatcher', log_prefix)
+
+    @property
+    def is_running(self) -> bool:
+        return len(self._workers) > 0
+
+    def start(self):
+        for i in range(self._workers_count):
+            worker = threading.Thread(target=self._run, name=f'ReportDispatcher_{i}')
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Stop all workers after all enqueued transactions have been sent."""
+        for _ in self._workers:
+            self._queue.put(stop_msg)
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers = []
+
+    def dispatch(self, transaction_result: TransactionResultProtocol, mdib_version_group: MdibVersionGroup):
+        """Enqueue the transaction result. Sends it immediately if the dispatcher is not running."""
+        if not self._workers:
+            self._send_func(transaction_result, mdib_version_group)
+            return
+        # the sequence number must have the same order as the queue
+        with self._sequence_lock:
+            self._sequence_number += 1
+            self._queue.put(_EnqueuedTransaction(self._sequence_number, transaction_result, mdib_version_group))
+
+    def wait_for_turn(self):
+        """Block until all previous transactions are delivered.
+
+        Does nothing if it is not called in a worker thread.
+        """
+        sequence_number = getattr(self._local, 'sequence_number', None)
+        if sequence_number is None:
+            return
+        with self._turn:
+            self._turn.wait_for(lambda: self._next_to_deliver == sequence_number)
+
+    def _run(self):
+        while True:
+            from_queue: _EnqueuedTransaction = self._queue.get()
+            if from_queue.sequence_number == -1:
+                return
+            self._local.sequence_number = from_queue.sequence_number
+            try:
+                self._send_func(from_queue.transaction_result, from_queue.mdib_version_group)
+            except Exception:
+                self._logger.error('error sending reports of mdib version %d: %s',
+                                   from_queue.mdib_version_group.mdib_version, traceback.format_exc())
+            finally:
+                self.wait_for_turn()  # in case send_func did not deliver anything
+                self._local.sequence_number = None
+                with self._turn:
+                    self._next_to_deliver += 1
+                    self._turn.notify_all()
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sdc11073.mdib.mdibbase import MdibVersionGroup
+    from .subscriptionmgr import SerializedReport
+
+
+@dataclass
+class ResumePoint:
+    """What a consumer already received in an earlier subscription.
+
+    action_mdib_versions has the mdib version of the last received report per action. Actions without an entry
+    use mdib_version, the base of the earlier subscription (all its reports have a newer mdib version).
+    Reports are tracked per action, because a provider with priority lanes delivers reports of different
+    actions out of mdib version order.
+    """
+    sequence_id: str
+    mdib_version: int
+    action_mdib_versions: dict[str, int] = field(default_factory=dict)
+
+    def mdib_version_of(self, action: str) -> int:
+        return self.action_mdib_versions.get(action, self.mdib_version)
+
+
+class _HistoryEntry:
+    __slots__ = ('mdib_version', 'action', 'report')
+
+    def __init__(self, mdib_version: int, action: str, report: SerializedReport):
+        self.mdib_version = mdib_version
+        self.action = action
+        self.report = report
+
+
+class ReportHistory:
+    """The last serialized episodic reports, ordered by mdib version.
+
+    A consumer whose EpisodicReport stream broke can get the reports it missed instead of a new GetMdib.
+    The oldest reports are removed if the history has more than max_reports reports or more than max_bytes
+    serialized bytes. Reports that were not created because nobody subscribed their action are marked with skip.
+    The history is cleared if the sequence id of the mdib changes.
+    Actions of a broken subscription are still recorded for resume_timeout seconds.
+    """
+
+    def __init__(self, max_bytes: int = 10_000_000, max_reports: int = 10_000, resume_timeout: float = 60):
+        self.max_bytes = max_bytes
+        self.max_reports = max_reports
+        self.resume_timeout = resume_timeout
+        # held by the subscriptions manager while it records and delivers a report, and while it adds a
+        # resumed subscription. A report is therefore either in the history or in the queue of the subscription.
+        self.lock = threading.RLock()
+        self.sequence_id: str | None = None
+        self.last_mdib_version: int | None = None  # of the newest report
+        self._entries: deque[_HistoryEntry] = deque()
+        self._bytes = 0
+        # per action the newest mdib version of a report that is not (or no longer) in the history
+        self._missing_mdib_versions: dict[str, int] = {}
+
+    def append(self, mdib_version_group: MdibVersionGroup, action: str, report: SerializedReport):
+        with self.lock:
+            self._check_sequence_id(mdib_version_group)
+            self._entries.append(_HistoryEntry(mdib_version_group.mdib_version, action, report))
+            self.last_mdib_version = mdib_version_group.mdib_version
+            self._bytes += len(report.data)
+            while len(self._entries) > self.max_reports or (self._bytes > self.max_bytes and len(self._entries) > 1):
+                removed = self._entries.popleft()
+                self._bytes -= len(removed.report.data)
+                self._missing_mdib_versions[removed.action] = removed.mdib_version
+
+    def skip(self, mdib_version_group: MdibVersionGroup, action: str):
+        """Note that the report of action with this mdib version was not created."""
+        with self.lock:
+            self._check_sequence_id(mdib_version_group)
+            self._missing_mdib_versions[action] = mdib_version_group.mdib_version
+
+    def _check_sequence_id(self, mdib_version_group: MdibVersionGroup):
+        # caller holds self.lock
+        if mdib_version_group.sequence_id != self.sequence_id:
+            self.clear()
+            self.sequence_id = mdib_version_group.sequence_id
+
+    def base_mdib_version(self) -> int:
+        """All reports that are recorded from now on have a newer mdib version than the returned one.
+
+        One mdib transaction can create reports of several actions, therefore this is the mdib version
+        before the newest report.
+        """
+        with self.lock:
+            return -1 if self.last_mdib_version is None else self.last_mdib_version - 1
+
+    def reports_since(self, resume_point: ResumePoint, actions: list[str]) -> list[SerializedReport] | None:
+        """Return the reports of actions that are newer than the resume point.
+
+        Returns None if some of them are not in the history.
+        """
+        with self.lock:
+            if resume_point.sequence_id != self.sequence_id:
+                return None
+            for action in actions:
+                missing = self._missing_mdib_versions.get(action)
+                if missing is not None and missing > resume_point.mdib_version_of(action):
+                    return None
+            return [entry.report for entry in self._entries
+                    if entry.action in actions and entry.mdib_version > resume_point.mdib_version_of(entry.action)]
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._missing_mdib_versions.clear()
+            self.sequence_id = None
+            self.last_mdib_version = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-import queue
 import threading
 import time
 import traceback
+from collections import deque
 from dataclasses import dataclass
+from enum import Enum
 from typing import TYPE_CHECKING
 
 from sdc11073 import loghelper
@@ -23,17 +24,38 @@ if TYPE_CHECKING:
 @dataclass
 class _EnqueuedOperation:
     transaction_id: int
-    operation: OperationDefinitionBase | None
-    request: AnySetServiceRequest | None  # protobuf request
-    operation_request: msg_types.AbstractSet | None  # request converted to corresponding msg_types instance
+    operation: OperationDefinitionBase
+    request: AnySetServiceRequest  # protobuf request
+    operation_request: msg_types.AbstractSet  # request converted to corresponding msg_types instance
 
 
-stop_msg = _EnqueuedOperation(-1, None, None, None)  # special instance that is uses as stop message
+class RejectionPolicy(str, Enum):
+    """What enqueue_operation does if the queue of the executor is full."""
+    BLOCK = 'block'  # wait up to enqueue_timeout seconds for a free slot, then reject
+    REJECT = 'reject'  # reject immediately
 
 
-class _OperationsWorker(threading.Thread):
-    """Thread that enqueues and processes all operations.
+class OperationQueueFullError(Exception):
+    """Raised if an operation cannot be enqueued."""
 
+
+@dataclass
+class OperationsExecutorStats:
+    queue_depth: int
+    queue_high_water_mark: int
+    executed_operations: int
+    rejected_operations: int
+    execution_time_min: float | None
+    execution_time_avg: float | None
+    execution_time_max: float | None  # of the last executions
+    execution_time_abs_max: float | None  # since start
+
+
+class _OperationsExecutor:
+    """Worker threads that process all delayed operations.
+
+    Operations with the same operation target are executed in the order of their requests, one after the other.
+    Operations with different targets are executed in parallel if there is more than one worker.
     Progress notifications are sent via subscription manager.
     """
 
@@ -41,73 +63,167 @@ class _OperationsWorker(threading.Thread):
                  operations_registry: ScoOperationsRegistry,
                  subscriptions_manager: GSubscriptionsManager,
                  mdib: ProviderMdib,
-                 log_prefix: str):
-        super().__init__(name='DeviceOperationsWorker')
-        self.daemon = True
+                 log_prefix: str,
+                 workers_count: int = 1,
+                 max_queue_size: int = 10,
+                 rejection_policy: RejectionPolicy = RejectionPolicy.BLOCK,
+                 enqueue_timeout: float = 1.0):
         self._operations_registry = operations_registry
         self._subscriptions_manager = subscriptions_manager
         self._mdib = mdib
-        self._operations_queue = queue.Queue(10)  # spooled operations
+        self._workers_count = workers_count
+        self.max_queue_size = max_queue_size
+        self.rejection_policy = rejection_policy
+        self.enqueue_timeout = enqueue_timeout
+        self._workers: list[threading.Thread] = []
+        self._cond = threading.Condition()
+        self._pending: dict[str, deque[_EnqueuedOperation]] = {}  # key is the operation target
+        self._ready_targets: deque[str] = deque()  # targets with pending operations that no worker executes
+        self._queue_depth = 0
+        self._stopping = False
+        self.queue_high_water_mark = 0
+        self.executed_operations = 0
+        self.rejected_operations = 0
+        self.last_execution_times = deque(maxlen=100)
+        self.max_execution_time = None
         self._logger = loghelper.get_logger_adapter('sdc.device.op_worker', log_prefix)
 
+    @property
+    def queue_depth(self) -> int:
+        return self._queue_depth
+
+    def start(self):
+        for i in range(self._workers_count):
+            worker = threading.Thread(target=self._run, args=(i,), name=f'DeviceOperationsWorker_{i}')
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Stop all workers after the enqueued operations have been executed."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=1)
+        self._workers = []
+
     def enqueue_operation(self, operation: OperationDefinitionBase,
                           request: AnySetServiceRequest,  # protobuf request
                           operation_request: msg_types.AbstractSet,  # request converted to msg_types
                           transaction_id: int):
-        """Enqueue operation."""
-        self._operations_queue.put(_EnqueuedOperation(transaction_id, operation, request, operation_request), timeout=1)
+        """Enqueue operation.
 
-    def run(self):
-        while True:
-            try:
-                try:
-                    from_queue: _EnqueuedOperation = self._operations_queue.get(timeout=1.0)
-                except queue.Empty:
-                    self._operations_registry.check_invocation_timeouts()
-                else:
-                    if from_queue.transaction_id == -1:
-                        self._logger.info('stop request found. Terminating now.')
-                        return
-                    # tr_id, operation, request, operation_request = from_queue  # unpack tuple
-                    time.sleep(0.001)
-                    self._logger.info('%s: starting operation "%s" argument=%r',
-                                      from_queue.operation.__class__.__name__,
-                                      from_queue.operation.handle, from_queue.operation_request.argument)
-                    # duplicate the WAIT response to the operation request as notification. Standard requires this.
-                    self._subscriptions_manager.send_operation_invoked_report(
-                        from_queue.operation, from_queue.transaction_id, msg_types.InvocationState.WAIT,
-                        self._mdib.mdib_version_group)
-                    time.sleep(0.001)  # not really necessary, but in real world there might also be some delay.
-                    self._subscriptions_manager.send_operation_invoked_report(
-                        from_queue.operation, from_queue.transaction_id, msg_types.InvocationState.START,
-                        self._mdib.mdib_version_group)
+        :raises OperationQueueFullError: if the queue is full (after enqueue_timeout with RejectionPolicy.BLOCK)
+        """
+        target = operation.operation_target_handle or operation.handle
+        with self._cond:
+            if self.rejection_policy == RejectionPolicy.BLOCK:
+                has_space = self._cond.wait_for(lambda: self._queue_depth < self.max_queue_size,
+                                                timeout=self.enqueue_timeout)
+            else:
+                has_space = self._queue_depth < self.max_queue_size
+            if not has_space:
+                self.rejected_operations += 1
+                raise OperationQueueFullError(f'max. {self.max_queue_size} operations can be enqueued')
+            pending = self._pending.get(target)
+            if pending is None:
+                pending = deque()
+                self._pending[target] = pending
+                self._ready_targets.append(target)  # no worker executes this target now
+            pending.append(_EnqueuedOperation(transaction_id, operation, request, operation_request))
+            self._queue_depth += 1
+            self.queue_high_water_mark = max(self.queue_high_water_mark, self._queue_depth)
+            self._cond.notify_all()
 
+    def _next_operation(self, worker_index: int) -> tuple[str, _EnqueuedOperation] | None:
+        """Wait for an operation whose target is not executed by another worker. Returns None to stop."""
+        with self._cond:
+            while not self._ready_targets:
+                if self._stopping:
+                    return None
+                if not self._cond.wait(timeout=1.0) and worker_index == 0:
+                    self._cond.release()
                     try:
-                        execute_result = from_queue.operation.execute_operation(from_queue.request,
-                                                                                from_queue.operation_request)
-                        self._logger.info('%s: successfully finished operation "%s"',
-                                          from_queue.operation.__class__.__name__, from_queue.operation.handle)
-                        self._subscriptions_manager.send_operation_invoked_report(
-                            from_queue.operation, from_queue.transaction_id, execute_result.invocation_state,
-                            self._mdib.mdib_version_group,
-                            execute_result.operation_target_handle)
-
-                    except Exception as ex:
-                        self._logger.error('%s: error executing operation "%s": %s',
-                                           from_queue.operation.__class__.__name__,
-                                           from_queue.operation.handle, traceback.format_exc())
-                        self._subscriptions_manager.send_operation_invoked_report(
-                            from_queue.operation, from_queue.transaction_id, msg_types.InvocationState.FAILED,
-                            self._mdib.mdib_version_group,
-                            error=msg_types.InvocationError.OTHER, error_message=repr(ex))
+                        self._operations_registry.check_invocation_timeouts()
+                    finally:
+                        self._cond.acquire()
+            target = self._ready_targets.popleft()
+            from_queue = self._pending[target].popleft()
+            self._queue_depth -= 1
+            self._cond.notify_all()  # there is space in the queue now
+            return target, from_queue
+
+    def _done(self, target: str, execution_time: float):
+        with self._cond:
+            self.executed_operations += 1
+            self.last_execution_times.append(execution_time)
+            if self.max_execution_time is None or execution_time > self.max_execution_time:
+                self.max_execution_time = execution_time
+            if self._pending[target]:
+                self._ready_targets.append(target)
+                self._cond.notify_all()
+            else:
+                del self._pending[target]
 
+    def _run(self, worker_index: int):
+        while True:
+            next_operation = self._next_operation(worker_index)
+            if next_operation is None:
+                self._logger.info('stop request found. Terminating now.')
+                return
+            target, from_queue = next_operation
+            start = time.perf_counter()
+            try:
+                self._execute(from_queue)
             except Exception:
                 self._logger.error('%s: unexpected error while handling operation: %s',
                                    self.__class__.__name__, traceback.format_exc())
+            finally:
+                self._done(target, time.perf_counter() - start)
 
-    def stop(self):
-        self._operations_queue.put(stop_msg)  # a dummy request to stop the thread
-        self.join(timeout=1)
+    def _execute(self, from_queue: _EnqueuedOperation):
+        self._logger.info('%s: starting operation "%s" argument=%r',
+                          from_queue.operation.__class__.__name__,
+                          from_queue.operation.handle, from_queue.operation_request.argument)
+        # duplicate the WAIT response to the operation request as notification. Standard requires this.
+        self._subscriptions_manager.send_operation_invoked_report(
+            from_queue.operation, from_queue.transaction_id, msg_types.InvocationState.WAIT,
+            self._mdib.mdib_version_group)
+        self._subscriptions_manager.send_operation_invoked_report(
+            from_queue.operation, from_queue.transaction_id, msg_types.InvocationState.START,
+            self._mdib.mdib_version_group)
+        try:
+            execute_result = from_queue.operation.execute_operation(from_queue.request,
+                                                                    from_queue.operation_request)
+            self._logger.info('%s: successfully finished operation "%s"',
+                              from_queue.operation.__class__.__name__, from_queue.operation.handle)
+            self._subscriptions_manager.send_operation_invoked_report(
+                from_queue.operation, from_queue.transaction_id, execute_result.invocation_state,
+                self._mdib.mdib_version_group,
+                execute_result.operation_target_handle)
+
+        except Exception as ex:
+            self._logger.error('%s: error executing operation "%s": %s',
+                               from_queue.operation.__class__.__name__,
+                               from_queue.operation.handle, traceback.format_exc())
+            self._subscriptions_manager.send_operation_invoked_report(
+                from_queue.operation, from_queue.transaction_id, msg_types.InvocationState.FAILED,
+                self._mdib.mdib_version_group,
+                error=msg_types.InvocationError.OTHER, error_message=repr(ex))
+
+    def get_stats(self) -> OperationsExecutorStats:
+        with self._cond:
+            times = list(self.last_execution_times)
+            return OperationsExecutorStats(
+                queue_depth=self._queue_depth,
+                queue_high_water_mark=self.queue_high_water_mark,
+                executed_operations=self.executed_operations,
+                rejected_operations=self.rejected_operations,
+                execution_time_min=min(times) if times else None,
+                execution_time_avg=sum(times) / len(times) if times else None,
+                execution_time_max=max(times) if times else None,
+                execution_time_abs_max=self.max_execution_time)
 
 
 class ScoOperationsRegistry:
@@ -117,8 +233,19 @@ class ScoOperationsRegistry:
                  operation_cls_getter: OperationClassGetter,
                  mdib: ProviderMdib,
                  sco_descriptor_container: AbstractDescriptorProtocol,
-                 log_prefix: str | None = None):
-        self._worker = None
+                 log_prefix: str | None = None,
+                 workers_count: int = 1,
+                 max_queue_size: int = 10,
+                 rejection_policy: RejectionPolicy = RejectionPolicy.BLOCK):
+        """Construct a ScoOperationsRegistry.
+
+        Delayed operations are executed by workers_count threads, with strict ordering per operation target.
+        At most max_queue_size operations wait for execution, further requests fail according to rejection_policy.
+        """
+        self._worker: _OperationsExecutor | None = None
+        self._workers_count = workers_count
+        self._max_queue_size = max_queue_size
+        self._rejection_policy = rejection_policy
         self._subscriptions_manager = subscriptions_manager
         self.operation_cls_getter = operation_cls_getter
         self._mdib = mdib
@@ -156,7 +283,14 @@ class ScoOperationsRegistry:
         """Handle operation immediately or delayed in worker thread, depending on operation.delayed_processing."""
 
         if operation.delayed_processing:
-            self._worker.enqueue_operation(operation, request, converted_request, transaction_id)
+            try:
+                self._worker.enqueue_operation(operation, request, converted_request, transaction_id)
+            except OperationQueueFullError as ex:
+                self._logger.warning('operation "%s" rejected: %s', operation.handle, ex)
+                self._subscriptions_manager.send_operation_invoked_report(
+                    operation, transaction_id, msg_types.InvocationState.FAILED, self._mdib.mdib_version_group,
+                    error=msg_types.InvocationError.OTHER, error_message=str(ex))
+                return msg_types.InvocationState.FAILED
             return msg_types.InvocationState.WAIT
         try:
             execute_result = operation.execute_operation(request, converted_request)
@@ -177,14 +311,21 @@ class ScoOperationsRegistry:
             return msg_types.InvocationState.FAILED
 
     def start_worker(self):
-        """Start worker thread."""
+        """Start worker threads."""
         if self._worker is not None:
             raise ApiUsageError('SCO worker is already running')
-        self._worker = _OperationsWorker(self, self._subscriptions_manager, self._mdib, self._log_prefix)
+        self._worker = _OperationsExecutor(self, self._subscriptions_manager, self._mdib, self._log_prefix,
+                                           self._workers_count, self._max_queue_size, self._rejection_policy)
         self._worker.start()
 
+    def get_executor_stats(self) -> OperationsExecutorStats | None:
+        """Queue depth and execution times of delayed operations, None if the worker is not running."""
+        if self._worker is None:
+            return None
+        return self._worker.get_stats()
+
     def stop_worker(self):
-        """Stop worker thread."""
+        """Stop worker threads."""
         if self._worker is not None:
             self._worker.stop()
             self._worker = None
@@ -1,46 +1,52 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 import logging
+import threading
 import traceback
 from collections import namedtuple
+from typing import Any, Callable, Hashable
 
+import grpc
+from org.somda.protosdc.proto.model import sdc_messages_pb2
 from org.somda.protosdc.proto.model import sdc_services_pb2_grpc
 from org.somda.protosdc.proto.model.sdc_messages_pb2 import (GetMdibResponse,
                                                              GetMdDescriptionResponse,
                                                              GetMdStateResponse,
                                                              GetContextStatesResponse)
 
+from sdc11073 import observableproperties as properties
 from sdc11073.xml_types import pm_qnames
 from pyprotosdc.mapping import descriptorsmapper as dm
-from pyprotosdc.mapping import statesmapper as sm
-from pyprotosdc.mapping.mapping_helpers import (attr_name_to_p,
-                                                get_p_attr)
+from pyprotosdc.mapping.mapping_helpers import get_p_attr
 
 from pyprotosdc.mapping.msgtypes_mappers import set_mdib_version_group
+from pyprotosdc.provider.fragmentcache import FragmentCache
 
 if TYPE_CHECKING:
     from org.somda.protosdc.proto.model.sdc_messages_pb2 import GetMdibRequest
+    from sdc11073.mdib.mdibbase import MdibVersionGroup
+    from sdc11073.mdib.transactionsprotocol import TransactionResultProtocol
 
 
 _StackEntry = namedtuple('Stackentry', 'src dest')
 
 
-def _alert_system_all_to_p(mdib, alert_system_descr, p_parent):
+def _alert_system_all_to_p(mdib, alert_system_descr, p_parent, fragments: FragmentCache):
     if alert_system_descr.NODETYPE != pm_qnames.AlertSystemDescriptor:
         raise ValueError('wrong NodeType')
-    dm.generic_descriptor_to_p(alert_system_descr, p_parent.abstract_complex_device_component_descriptor.alert_system)
+    fragments.descriptor_to_p(alert_system_descr, p_parent.abstract_complex_device_component_descriptor.alert_system)
     dest_alert_system = p_parent.abstract_complex_device_component_descriptor.alert_system
     src_as_children = mdib.descriptions.parent_handle.get(alert_system_descr.Handle)
     for src_as_child in src_as_children:
         if src_as_child.NODETYPE == pm_qnames.AlertSignalDescriptor:
             dest_as_child = dest_alert_system.alert_signal.add()
-            dm.generic_descriptor_to_p(src_as_child, dest_as_child)
+            fragments.descriptor_to_p(src_as_child, dest_as_child)
             src_asd_children = mdib.descriptions.parent_handle.get(src_as_child.Handle, [])
             for src_asd_child in src_asd_children:
                 raise RuntimeError(f'handling of {src_asd_child.NODETYPE.localname} not implemented')
         elif src_as_child.NODETYPE in (pm_qnames.AlertConditionDescriptor, pm_qnames.LimitAlertConditionDescriptor):
             dest_as_child = dest_alert_system.alert_condition.add()
-            dm.generic_descriptor_to_p(src_as_child, dest_as_child)
+            fragments.descriptor_to_p(src_as_child, dest_as_child)
             src_asd_children = mdib.descriptions.parent_handle.get(src_as_child.Handle, [])
             for src_asd_child in src_asd_children:
                 raise RuntimeError(
@@ -49,74 +55,73 @@ def _alert_system_all_to_p(mdib, alert_system_descr, p_parent):
             raise RuntimeError(f'handling of {src_as_child.NODETYPE.localname} not implemented')
 
 
-def _sco_all_to_p(mdib, sco_descr, p_parent):
-    dm.generic_descriptor_to_p(sco_descr,
+def _sco_all_to_p(mdib, sco_descr, p_parent, fragments: FragmentCache):
+    fragments.descriptor_to_p(sco_descr,
                                p_parent.abstract_complex_device_component_descriptor.sco)
     src_sco_children = mdib.descriptions.parent_handle.get(sco_descr.Handle, [])
     dest_sco = p_parent.abstract_complex_device_component_descriptor.sco
     for src_sco_child in src_sco_children:
         dest_sco_child = dest_sco.operation.add()
-        dm.generic_descriptor_to_p(src_sco_child, dest_sco_child)
+        fragments.descriptor_to_p(src_sco_child, dest_sco_child)
 
 
-def _mdib_to_p(mdib, p_mds_list, p_state_list):
+def _mdib_to_p(mdib, p_mds_list, p_state_list, fragments: FragmentCache):
     src_mds_list = mdib.descriptions.NODETYPE.get(pm_qnames.MdsDescriptor)
     for scr_mds in src_mds_list:
         p_mds = p_mds_list.add()  # this creates a new entry in list with correct type
-        _mds_to_p(mdib, scr_mds, p_mds)
-    _md_state_to_p(mdib.states.objects, p_state_list)
+        _mds_to_p(mdib, scr_mds, p_mds, fragments)
+    _md_state_to_p(mdib.states.objects, p_state_list, fragments)
 
 
-def _md_state_to_p(state_container_list, p_state_list):
+def _md_state_to_p(state_container_list, p_state_list, fragments: FragmentCache):
     for stateContainer in state_container_list:
         abstract_state_one_of_msg = p_state_list.add()
-        sm.generic_state_to_p(stateContainer, abstract_state_one_of_msg)
+        fragments.state_to_p(stateContainer, abstract_state_one_of_msg)
 
 
-def _mds_to_p(mdib, scr_mds, p_mds):
+def _mds_to_p(mdib, scr_mds, p_mds, fragments: FragmentCache):
     """ reconstruct single mds """
-    dm.generic_descriptor_to_p(scr_mds, p_mds)
+    fragments.descriptor_to_p(scr_mds, p_mds)
     # children of mds (vmd, alertsystem, sco, ...)
     mds_children = mdib.descriptions.parent_handle.get(scr_mds.Handle, [])
     for mds_child in mds_children:  # e.g. vmd, sco, alertsystem,...
         if mds_child.NODETYPE == pm_qnames.VmdDescriptor:
             src_vmd = mds_child  # give it a better name for code readability
             dest_vmd = p_mds.vmd.add()
-            dm.generic_descriptor_to_p(src_vmd, dest_vmd)
+            fragments.descriptor_to_p(src_vmd, dest_vmd)
             src_vmd_children = mdib.descriptions.parent_handle.get(src_vmd.Handle, [])
             for src_vmd_child in src_vmd_children:
                 if src_vmd_child.NODETYPE == pm_qnames.ChannelDescriptor:
                     dest_vmd_child = dest_vmd.channel.add()
-                    dm.generic_descriptor_to_p(src_vmd_child, dest_vmd_child)
+                    fragments.descriptor_to_p(src_vmd_child, dest_vmd_child)
                     # dest_vmd.channel.append(dest_vmd_child)
                     src_channel_children = mdib.descriptions.parent_handle.get(src_vmd_child.Handle, [])
                     for src_channel_child in src_channel_children:
                         # children of channels are always metrics
                         dest_metric = dest_vmd_child.metric.add()
-                        dm.generic_descriptor_to_p(src_channel_child, dest_metric)
+                        fragments.descriptor_to_p(src_channel_child, dest_metric)
                         # dest_vmd_child.metric.append(dest_metric)
                 elif src_vmd_child.NODETYPE == pm_qnames.ScoDescriptor:
                     dest_sco = dest_vmd.abstract_complex_device_component_descriptor.sco
-                    _sco_all_to_p(mdib, src_vmd_child, dest_vmd)
+                    _sco_all_to_p(mdib, src_vmd_child, dest_vmd, fragments)
                 elif src_vmd_child.NODETYPE == pm_qnames.AlertSystemDescriptor:
-                    _alert_system_all_to_p(mdib, src_vmd_child, dest_vmd)
+                    _alert_system_all_to_p(mdib, src_vmd_child, dest_vmd, fragments)
                 else:
                     raise RuntimeError(f'handling of {src_vmd_child.NODETYPE.localname} not implemented')
         elif mds_child.NODETYPE == pm_qnames.AlertSystemDescriptor:
-            _alert_system_all_to_p(mdib, mds_child, p_mds)
+            _alert_system_all_to_p(mdib, mds_child, p_mds, fragments)
         elif mds_child.NODETYPE == pm_qnames.ScoDescriptor:
-            _sco_all_to_p(mdib, mds_child, p_mds)
+            _sco_all_to_p(mdib, mds_child, p_mds, fragments)
         elif mds_child.NODETYPE == pm_qnames.SystemContextDescriptor:
             src_sc = mds_child  # give it a better name for code readability
-            dm.generic_descriptor_to_p(src_sc,
+            fragments.descriptor_to_p(src_sc,
                                        p_mds.system_context)
             src_sc_children = mdib.descriptions.parent_handle.get(src_sc.Handle, [])
             for src_sc_child in src_sc_children:
-                p = dm.generic_descriptor_to_p(src_sc_child, None)
                 if src_sc_child.NODETYPE == pm_qnames.PatientContextDescriptor:
-                    dm.generic_descriptor_to_p(src_sc_child, p_mds.system_context.patient_context)
+                    fragments.descriptor_to_p(src_sc_child, p_mds.system_context.patient_context)
                 elif src_sc_child.NODETYPE == pm_qnames.LocationContextDescriptor:
-                    dm.generic_descriptor_to_p(src_sc_child, p_mds.system_context.location_context)
+                    fragments.descriptor_to_p(src_sc_child, p_mds.system_context.location_context)
                 else:
                     p = dm.generic_descriptor_to_p(src_sc_child, None)
                     if src_sc_child.NODETYPE == pm_qnames.EnsembleContextDescriptor:
@@ -132,7 +137,7 @@ def _mds_to_p(mdib, scr_mds, p_mds):
                             f'handling of {src_sc_child.NODETYPE.localname} not implemented')
         elif mds_child.NODETYPE == pm_qnames.ClockDescriptor:
             src_clock = mds_child  # give it a better name for code readability
-            dm.generic_descriptor_to_p(src_clock,
+            fragments.descriptor_to_p(src_clock,
                                        p_mds.clock)
             src_clk_children = mdib.descriptions.parent_handle.get(src_clock.Handle, [])
             for src_clk_child in src_clk_children:
@@ -142,7 +147,7 @@ def _mds_to_p(mdib, scr_mds, p_mds):
             src_batt = mds_child  # give it a better name for code readability
             # battery is a list, src_batt is only one member of it.
             # => add an entry  to p_mds.battery and copy data to it
-            dm.generic_descriptor_to_p(src_batt,
+            fragments.descriptor_to_p(src_batt,
                                        p_mds.battery.add())
             src_bat_children = mdib.descriptions.parent_handle.get(src_batt.Handle, [])
             for src_bat_child in src_bat_children:
@@ -153,53 +158,221 @@ def _mds_to_p(mdib, scr_mds, p_mds):
             raise RuntimeError(f'handling of {mds_child.NODETYPE.localname} not implemented')
 
 
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.data: bytes | None = None
+
+
+class VersionedResponseCache:
+    """Keeps the serialized response of the newest key.
+
+    Concurrent requests for the same key share one build (single-flight).
+    A key must contain everything the response depends on, e.g. the mdib version.
+    invalidate increments the generation. A build is only stored if the generation did not change since the
+    caller read the key, otherwise a build that was started before a change could store outdated data.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._key: Hashable | None = None
+        self._data: bytes | None = None
+        self._in_flight: dict[Hashable, _Flight] = {}
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, key: Hashable, build: Callable[[], bytes], generation: int | None = None) -> bytes:
+        """Return the cached data of key, or the result of build.
+
+        generation is the value of self.generation when the caller read key (default: now).
+        """
+        with self._lock:
+            if generation is None:
+                generation = self.generation
+            if self._key == key:
+                self.hits += 1
+                return self._data
+            flight = self._in_flight.get(key)
+            is_builder = flight is None
+            if is_builder:
+                flight = _Flight()
+                self._in_flight[key] = flight
+        if not is_builder:
+            flight.done.wait()
+            if flight.data is not None:
+                with self._lock:
+                    self.hits += 1
+                return flight.data
+            return build()  # build failed in the other thread, try it again here
+        try:
+            flight.data = build()
+            with self._lock:
+                self.builds += 1
+                if generation == self.generation:
+                    self._key = key
+                    self._data = flight.data
+            return flight.data
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._key = None
+            self._data = None
+
+
+def serialize_get_response(response: Any) -> bytes:
+    """Response serializer that accepts already serialized responses."""
+    if isinstance(response, bytes):
+        return response
+    return response.SerializeToString()
+
+
+def add_get_service_to_server(servicer: GetService, server: grpc.Server):
+    """Same as sdc_services_pb2_grpc.add_GetServiceServicer_to_server, but GetMdib and GetMdDescription
+    responses come from the response caches of the servicer."""
+    rpc_method_handlers = {
+        'GetMdib': grpc.unary_unary_rpc_method_handler(
+            servicer.get_mdib_serialized,
+            request_deserializer=sdc_messages_pb2.GetMdibRequest.FromString,
+            response_serializer=serialize_get_response,
+        ),
+        'GetMdDescription': grpc.unary_unary_rpc_method_handler(
+            servicer.get_md_description_serialized,
+            request_deserializer=sdc_messages_pb2.GetMdDescriptionRequest.FromString,
+            response_serializer=serialize_get_response,
+        ),
+        'GetMdState': grpc.unary_unary_rpc_method_handler(
+            servicer.GetMdState,
+            request_deserializer=sdc_messages_pb2.GetMdStateRequest.FromString,
+            response_serializer=sdc_messages_pb2.GetMdStateResponse.SerializeToString,
+        ),
+        'GetContextStates': grpc.unary_unary_rpc_method_handler(
+            servicer.GetContextStates,
+            request_deserializer=sdc_messages_pb2.GetContextStatesRequest.FromString,
+            response_serializer=sdc_messages_pb2.GetContextStatesResponse.SerializeToString,
+        ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+        'org.somda.protosdc.proto.model.GetService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
 class GetService(sdc_services_pb2_grpc.GetServiceServicer):
 
-    def __init__(self, mdib):
+    def __init__(self, mdib, fragment_cache: FragmentCache | None = None):
         super().__init__()
         self._mdib = mdib
+        self._fragments = fragment_cache or FragmentCache(enabled=False)
         self._logger = logging.getLogger('sdc.grpc.dev.GetService')
+        # sdc11073 does not count description changes, therefore it is done here
+        self._description_version = 0
+        self.mdib_cache = VersionedResponseCache()
+        self.md_description_cache = VersionedResponseCache()
+        properties.bind(self._mdib, transaction=self._on_transaction)
+        properties.bind(self._mdib, sequence_id=self._on_sequence_id)
+
+    def _on_transaction(self, transaction_result: TransactionResultProtocol):
+        # called while the mdib_lock is held, therefore keys and generations that are read under the mdib_lock
+        # belong together
+        if not transaction_result.has_descriptor_updates and not transaction_result.all_states():
+            return  # e.g. a waveform transaction without samples, the mdib version did not change
+        self.mdib_cache.invalidate()
+        if (transaction_result.descr_created or transaction_result.descr_updated
+                or transaction_result.descr_deleted):
+            self._description_version += 1
+            self.md_description_cache.invalidate()
+        if transaction_result.descr_deleted:
+            self._fragments.remove([descr.Handle for descr in transaction_result.descr_deleted])
+
+    def _on_sequence_id(self, sequence_id: str):
+        # versions start again with a new sequence id, a cached fragment with the same version can be outdated
+        self._logger.info('sequence id changed to %s, clearing caches', sequence_id)
+        self._fragments.clear()
+        self.mdib_cache.invalidate()
+        self.md_description_cache.invalidate()
+
+    def _mk_mdib_response(self) -> GetMdibResponse:
+        mdib_version_group = self._mdib.mdib_version_group
+        response = GetMdibResponse()
+        set_mdib_version_group(get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup'),
+                               mdib_version_group)
+        _mdib_to_p(self._mdib, response.payload.mdib.md_description.mds, response.payload.mdib.md_state.state,
+                   self._fragments)
+        mdib_version_group_msg = get_p_attr(response.payload.mdib, 'MdibVersionGroup')
+        set_mdib_version_group(mdib_version_group_msg, mdib_version_group)
+        # also version 0 is written
+        get_p_attr(mdib_version_group_msg, 'MdibVersion').unsigned_long = mdib_version_group.mdib_version
+        return response
 
     def GetMdib(self, request: GetMdibRequest, context) -> GetMdibResponse:
         try:
-            response = GetMdibResponse()
-            mdib_version_group_msg = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
-            set_mdib_version_group(mdib_version_group_msg, self._mdib.mdib_version_group)
-            _mdib_to_p(self._mdib, response.payload.mdib.md_description.mds, response.payload.mdib.md_state.state)
-            mdib_version_group_msg = getattr(response.payload.mdib, attr_name_to_p('MdibVersionGroup'))
-            mdib_version_group_msg1 = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
-            mdib_version_group_msg2 = get_p_attr(response.payload.mdib, 'MdibVersionGroup')
-            set_mdib_version_group(mdib_version_group_msg1, self._mdib.mdib_version_group)
-            set_mdib_version_group(mdib_version_group_msg2, self._mdib.mdib_version_group)
-
-            getattr(mdib_version_group_msg, attr_name_to_p('MdibVersion')).unsigned_long = self._mdib.mdib_version
-            setattr(mdib_version_group_msg, attr_name_to_p('SequenceId'), self._mdib.sequence_id)
-            name = attr_name_to_p('InstanceId')
-            if mdib_version_group_msg.HasField(name):
-                getattr(mdib_version_group_msg, name).value = self._mdib.instance_id
-            return response
+            return self._mk_mdib_response()
         except:
             print(traceback.format_exc())
             self._logger.error(traceback.format_exc())
             raise
 
+    def get_mdib_serialized(self, request: GetMdibRequest, context) -> bytes:
+        """Serialized GetMdibResponse, the same bytes for all requests of the same mdib version."""
+        with self._mdib.mdib_lock:
+            key = (self._mdib.sequence_id, self._mdib.mdib_version)
+            generation = self.mdib_cache.generation
+        try:
+            return self.mdib_cache.get(key, lambda: self._mk_mdib_response().SerializeToString(), generation)
+        except:
+            self._logger.error(traceback.format_exc())
+            raise
+
+    def _mk_md_description_part(self) -> GetMdDescriptionResponse:
+        response = GetMdDescriptionResponse()
+        p_mds_list = response.payload.md_description.mds
+        src_mds_list = self._mdib.descriptions.NODETYPE.get(pm_qnames.MdsDescriptor)
+        for scr_mds in src_mds_list:
+            p_mds = p_mds_list.add()  # this creates a new entry in list with correct type
+            _mds_to_p(self._mdib, scr_mds, p_mds, self._fragments)
+        return response
+
+    def _mk_md_description_header(self, mdib_version_group: MdibVersionGroup | None = None) \
+            -> GetMdDescriptionResponse:
+        response = GetMdDescriptionResponse()
+        mdib_version_group_msg = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
+        set_mdib_version_group(mdib_version_group_msg, mdib_version_group or self._mdib.mdib_version_group)
+        return response
+
     def GetMdDescription(self, request, context):
         try:
             # ignore requested handles, always return all
-            response = GetMdDescriptionResponse()
-            mdib_version_group_msg = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
-            set_mdib_version_group(mdib_version_group_msg, self._mdib.mdib_version_group)
-            p_mds_list = response.payload.md_description.mds
-            src_mds_list = self._mdib.descriptions.NODETYPE.get(pm_qnames.MdsDescriptor)
-            for scr_mds in src_mds_list:
-                p_mds = p_mds_list.add()  # this creates a new entry in list with correct type
-                _mds_to_p(self._mdib, scr_mds, p_mds)
+            response = self._mk_md_description_header()
+            response.MergeFrom(self._mk_md_description_part())
             return response
         except:
             print(traceback.format_exc())
             self._logger.error(traceback.format_exc())
             raise
 
+    def get_md_description_serialized(self, request, context) -> bytes:
+        """Serialized GetMdDescriptionResponse.
+
+        Only the small header with the current mdib version is serialized per request. The description part
+        is cached per description version. Concatenated protobuf messages are merged by the parser.
+        """
+        with self._mdib.mdib_lock:
+            mdib_version_group = self._mdib.mdib_version_group
+            key = (self._mdib.sequence_id, self._description_version)
+            generation = self.md_description_cache.generation
+        try:
+            description = self.md_description_cache.get(
+                key, lambda: self._mk_md_description_part().SerializeToString(), generation)
+            return self._mk_md_description_header(mdib_version_group).SerializeToString() + description
+        except:
+            self._logger.error(traceback.format_exc())
+            raise
+
     def GetMdState(self, request, context):
         try:
             requested_handles = [h.string for h in request.payload.handle_ref]
@@ -226,7 +399,7 @@ class GetService(sdc_services_pb2_grpc.GetServiceServicer):
             mdib_version_group_msg = get_p_attr(response.payload.abstract_get_response, 'MdibVersionGroup')
             set_mdib_version_group(mdib_version_group_msg, self._mdib.mdib_version_group)
 
-            _md_state_to_p(states, response.payload.md_state.state)
+            _md_state_to_p(states, response.payload.md_state.state, self._fragments)
             return response
         except:
             print(traceback.format_exc())
@@ -266,7 +439,7 @@ class GetService(sdc_services_pb2_grpc.GetServiceServicer):
                 states = states_dict.values()
                 # states = [self._mdib.context_states.descriptor_handle.get_one(h.string) for h in requested_handles]
 
-            _md_state_to_p(states, response.payload.context_state)
+            _md_state_to_p(states, response.payload.context_state, self._fragments)
             return response
         except:
             print(traceback.format_exc())
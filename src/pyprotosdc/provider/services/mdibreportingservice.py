@@ -1,16 +1,110 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 import logging
+import math
+import grpc
 from org.somda.protosdc.proto.model import sdc_services_pb2_grpc
+from org.somda.protosdc.proto.model import sdc_messages_pb2
 from pyprotosdc.actions import ReportAction
+from pyprotosdc.provider.subscriptionmgr import SerializedReport, TooManySubscriptionsError
+from pyprotosdc.provider.reporthistory import ResumePoint
 
 if TYPE_CHECKING:
-    from pyprotosdc.provider.subscriptionmgr import GSubscriptionsManager
+    from pyprotosdc.provider.subscriptionmgr import GDevSubscription, GSubscriptionsManager
 
 
 
 filter_all_actions = list(ReportAction)
 
+# optional grpc metadata of an EpisodicReport call: waveform batch interval of the subscription in milliseconds
+WAVEFORM_BATCH_INTERVAL_KEY = 'waveform-batch-interval-ms'
+MAX_WAVEFORM_BATCH_INTERVAL_MS = 60_000
+# Resuming a subscription (see ReportHistory): with a report history, the initial metadata of the response has
+# the sequence id and the base mdib version of the subscription. A consumer that resumes sends the sequence id,
+# the base mdib version of the earlier subscription and one "<action>=<mdib version>" entry per action it received.
+# The initial metadata of the response tells with RESUMED_KEY if the missed reports are sent.
+# Malformed metadata is answered with StatusCode.INVALID_ARGUMENT.
+RESUME_SEQUENCE_ID_KEY = 'resume-sequence-id'
+RESUME_MDIB_VERSION_KEY = 'resume-mdib-version'
+RESUME_ACTION_MDIB_VERSION_KEY = 'resume-action-mdib-version'
+RESUMED_KEY = 'resumed'
+
+
+def get_resume_point(context) -> ResumePoint | None:
+    """Return the resume point if the consumer wants to resume an earlier subscription.
+
+    Raises ValueError if the metadata is malformed.
+    """
+    metadata = context.invocation_metadata() or ()
+    values = dict(metadata)
+    sequence_id = values.get(RESUME_SEQUENCE_ID_KEY)
+    mdib_version = values.get(RESUME_MDIB_VERSION_KEY)
+    if sequence_id is None or mdib_version is None:
+        return None
+    action_mdib_versions = {}
+    try:
+        for key, value in metadata:
+            if key == RESUME_ACTION_MDIB_VERSION_KEY:
+                action, version = value.rsplit('=', 1)
+                action_mdib_versions[action] = int(version)
+        return ResumePoint(sequence_id, int(mdib_version), action_mdib_versions)
+    except ValueError:
+        raise ValueError(f'malformed resume metadata {metadata!r}') from None
+
+
+def initial_metadata(subscription: GDevSubscription, resume_from: ResumePoint | None) -> tuple[tuple[str, str], ...]:
+    ret = [(RESUME_MDIB_VERSION_KEY, str(subscription.base_mdib_version))]
+    if subscription.base_sequence_id is not None:
+        ret.append((RESUME_SEQUENCE_ID_KEY, subscription.base_sequence_id))
+    if resume_from is not None:
+        ret.append((RESUMED_KEY, '0' if subscription.resumed_reports is None else '1'))
+    return tuple(ret)
+
+
+def get_waveform_batch_interval(context) -> float | None:
+    """Return the waveform batch interval in seconds that the consumer requested, or None.
+
+    Raises ValueError if the metadata is malformed.
+    """
+    metadata = dict(context.invocation_metadata() or ())
+    interval_ms = metadata.get(WAVEFORM_BATCH_INTERVAL_KEY)
+    if interval_ms is None:
+        return None
+    try:
+        value = float(interval_ms)
+    except ValueError:
+        value = math.nan
+    if not 0 <= value <= MAX_WAVEFORM_BATCH_INTERVAL_MS:  # also false for nan
+        raise ValueError(f'{WAVEFORM_BATCH_INTERVAL_KEY} must be a number between 0 and '
+                         f'{MAX_WAVEFORM_BATCH_INTERVAL_MS}, got {interval_ms!r}')
+    return value / 1000
+
+
+def serialize_episodic_report(report: sdc_messages_pb2.EpisodicReportStream | SerializedReport) -> bytes:
+    """Response serializer that accepts already serialized reports."""
+    if isinstance(report, SerializedReport):
+        return report.data
+    return report.SerializeToString()
+
+
+def add_mdib_reporting_service_to_server(servicer: MdibReportingService, server: grpc.Server):
+    """Same as sdc_services_pb2_grpc.add_MdibReportingServiceServicer_to_server, but with serialize_episodic_report."""
+    rpc_method_handlers = {
+        'EpisodicReport': grpc.unary_stream_rpc_method_handler(
+            servicer.EpisodicReport,
+            request_deserializer=sdc_messages_pb2.EpisodicReportRequest.FromString,
+            response_serializer=serialize_episodic_report,
+        ),
+        'PeriodicReport': grpc.unary_stream_rpc_method_handler(
+            servicer.PeriodicReport,
+            request_deserializer=sdc_messages_pb2.PeriodicReportRequest.FromString,
+            response_serializer=sdc_messages_pb2.PeriodicReportStream.SerializeToString,
+        ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+        'org.somda.protosdc.proto.model.MdibReportingService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
 class MdibReportingService(sdc_services_pb2_grpc.MdibReportingServiceServicer):
 
     def __init__(self, subscriptions_manager: GSubscriptionsManager):
@@ -26,16 +120,40 @@ class MdibReportingService(sdc_services_pb2_grpc.MdibReportingServiceServicer):
         if not actions:
             actions = filter_all_actions
         self._logger.info('EpisodicReport called')
-        subscription = self._subscriptions_manager.on_subscribe_request(actions)
+        try:
+            resume_from = get_resume_point(context)
+            waveform_batch_interval = get_waveform_batch_interval(context)
+        except ValueError as ex:
+            self._logger.warning('EpisodicReport rejected: %s', ex)
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(ex))
+        try:
+            subscription = self._subscriptions_manager.on_subscribe_request(actions, resume_from)
+        except TooManySubscriptionsError as ex:
+            self._logger.warning('EpisodicReport rejected: %s', ex)
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(ex))
+        if waveform_batch_interval is not None:
+            subscription.waveform_batch_interval = waveform_batch_interval
+        # the stream ends (and frees its grpc server thread) as soon as the rpc is terminated, e.g. by the client
+        context.add_callback(subscription.close)
         _run = True
         try:
+            if self._subscriptions_manager.report_history is not None:
+                context.send_initial_metadata(initial_metadata(subscription, resume_from))
+                for report in subscription.resumed_reports or ():
+                    yield report
+                    subscription.record_delivery(report, None)
             while _run:
                 report = subscription.reports.get()
                 if report == 'stop':
                     _run = False
+                    if subscription.end_reason is not None:
+                        context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, subscription.end_reason)
                 else:
+                    enqueued = subscription.reports.last_enqueued
                     self._logger.info('yield EpisodicReport %s', report.addressing.action)
                     yield report
+                    # the generator continues when grpc wants the next report
+                    subscription.record_delivery(report, enqueued)
         finally:
             self._logger.info('EpisodicReport end')
             self._subscriptions_manager.remove_subscription(subscription)
@@ -45,4 +163,52 @@ class MdibReportingService(sdc_services_pb2_grpc.MdibReportingServiceServicer):
             for name in ('alert', 'component', 'context', 'description', 'metric', 'operational_state', 'waveform'):
                 self._logger.info('episodic report field %s: %r', name, report.report.HasField(name))
         except:
-            pass
\ No newline at end of file
+            pass
+
+
+class AioMdibReportingService(MdibReportingService):
+    """MdibReportingService for a grpc.aio server.
+
+    The report streams are coroutines, they do not occupy a thread of the server.
+    The subscriptions manager must create subscriptions with an AioReportQueue.
+    """
+
+    async def EpisodicReport(self, request, context):
+        actions = list(request.filter.action_filter.action)
+        # empty list means subscribe all
+        if not actions:
+            actions = filter_all_actions
+        self._logger.info('EpisodicReport called')
+        try:
+            resume_from = get_resume_point(context)
+            waveform_batch_interval = get_waveform_batch_interval(context)
+        except ValueError as ex:
+            self._logger.warning('EpisodicReport rejected: %s', ex)
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(ex))
+        try:
+            subscription = self._subscriptions_manager.on_subscribe_request(actions, resume_from)
+        except TooManySubscriptionsError as ex:
+            self._logger.warning('EpisodicReport rejected: %s', ex)
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(ex))
+        if waveform_batch_interval is not None:
+            subscription.waveform_batch_interval = waveform_batch_interval
+        # if the client ends the rpc, the coroutine is cancelled and the subscription is removed in finally
+        try:
+            if self._subscriptions_manager.report_history is not None:
+                await context.send_initial_metadata(initial_metadata(subscription, resume_from))
+                for report in subscription.resumed_reports or ():
+                    yield report
+                    subscription.record_delivery(report, None)
+            while True:
+                report = await subscription.reports.get_async()
+                if report == 'stop':
+                    if subscription.end_reason is not None:
+                        await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, subscription.end_reason)
+                    return
+                enqueued = subscription.reports.last_enqueued
+                self._logger.info('yield EpisodicReport %s', report.addressing.action)
+                yield report
+                subscription.record_delivery(report, enqueued)
+        finally:
+            self._logger.info('EpisodicReport end')
+            self._subscriptions_manager.remove_subscription(subscription)
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import functools
 import logging
 import traceback
 import uuid
 from typing import TYPE_CHECKING
 
+import grpc
+
 from org.somda.protosdc.proto.model import sdc_messages_pb2
 from org.somda.protosdc.proto.model import sdc_services_pb2_grpc
 from org.somda.protosdc.proto.model.biceps.localizedtext_pb2 import LocalizedTextMsg
@@ -17,6 +20,7 @@ from pyprotosdc.mapping.basic_mappers import (enum_attr_to_p,
 from pyprotosdc.mapping.mapping_helpers import attr_name_to_p, get_p_attr
 from pyprotosdc.mapping.msgtypes_mappers import set_mdib_version_group
 from pyprotosdc.actions import OperationInvokedAction
+from pyprotosdc.provider.subscriptionmgr import TooManySubscriptionsError
 
 if TYPE_CHECKING:
     from enum import Enum
@@ -25,15 +29,18 @@ if TYPE_CHECKING:
     from sdc11073.mdib.mdibbase import MdibVersionGroup
 
 
-def set_method(response):
+def set_method(response_cls: type):
     """Decorator for all set methods .
 
     If handles the case that there is no registered operation for the operation handle.
+    Every call gets its own response_cls instance, therefore set methods can run in parallel.
     """
 
     def inner_decorator(f):
+        @functools.wraps(f)
         def wrapped(self, request, context):
             try:
+                response = response_cls()
                 transaction_id = self._provider.generate_transaction_id()
                 invocation_info = response.payload.abstract_set_response.invocation_info
                 invocation_info.transaction_id.unsigned_int = transaction_id
@@ -69,7 +76,7 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
         self._mdib = provider.mdib
         self._logger = logging.getLogger('sdc.grpc.dev.SetService')
 
-    @set_method(sdc_messages_pb2.ActivateResponse())
+    @set_method(sdc_messages_pb2.ActivateResponse)
     def Activate(self,
                  operation,
                  transaction_id,
@@ -80,7 +87,9 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
         # convert proto arguments to pm arguments
         pm_activate = msg_types.Activate()
         for arg in request.payload.argument:
-            pm_activate.add_argument(arg.arg_value)
+            pm_argument = msg_types.Argument()
+            pm_argument.ArgValue = arg.arg_value
+            pm_activate.add_argument(pm_argument)
         pm_invocation_state = self._provider.handle_operation_request(operation,
                                                                       request,
                                                                       pm_activate,
@@ -93,7 +102,7 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
 
         return response
 
-    @set_method(sdc_messages_pb2.SetMetricStateResponse())
+    @set_method(sdc_messages_pb2.SetMetricStateResponse)
     def SetMetricState(self,
                        operation,
                        transaction_id,
@@ -118,7 +127,7 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
         self._logger.debug('SetMetricState called, transaction %d', transaction_id)
         return response
 
-    @set_method(sdc_messages_pb2.SetComponentStateResponse())
+    @set_method(sdc_messages_pb2.SetComponentStateResponse)
     def SetComponentState(self,
                           operation,
                           transaction_id,
@@ -144,7 +153,7 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
         self._logger.debug('SetComponentState called, transaction %d', transaction_id)
         return response
 
-    @set_method(sdc_messages_pb2.SetContextStateResponse())
+    @set_method(sdc_messages_pb2.SetContextStateResponse)
     def SetContextState(self,
                         operation,
                         transaction_id,
@@ -170,7 +179,7 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
         self._logger.debug('SetContextState called, transaction %d', transaction_id)
         return response
 
-    @set_method(sdc_messages_pb2.SetAlertStateResponse())
+    @set_method(sdc_messages_pb2.SetAlertStateResponse)
     def SetAlertState(self,
                       operation,
                       transaction_id,
@@ -196,7 +205,7 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
         self._logger.debug('SetAlertState called, transaction %d', transaction_id)
         return response
 
-    @set_method(sdc_messages_pb2.SetStringResponse())
+    @set_method(sdc_messages_pb2.SetStringResponse)
     def SetString(self,
                   operation,
                   transaction_id,
@@ -219,7 +228,7 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
         self._logger.debug('SetString called, transaction %d', transaction_id)
         return response
 
-    @set_method(sdc_messages_pb2.SetValueResponse())
+    @set_method(sdc_messages_pb2.SetValueResponse)
     def SetValue(self,
                  operation,
                  transaction_id,
@@ -249,14 +258,57 @@ class SetService(sdc_services_pb2_grpc.SetServiceServicer):
     def OperationInvokedReport(self, request, context):
         actions = [OperationInvokedAction]
         self._logger.debug('OperationInvokedReport called')
-        subscription = self._provider.subscriptions_manager.on_subscribe_request(actions)
+        try:
+            subscription = self._provider.subscriptions_manager.on_subscribe_request(actions)
+        except TooManySubscriptionsError as ex:
+            self._logger.warning('OperationInvokedReport rejected: %s', ex)
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(ex))
+        # the stream ends (and frees its grpc server thread) as soon as the rpc is terminated, e.g. by the client
+        context.add_callback(subscription.close)
+        # tells the consumer that the subscription exists, before it invokes operations
+        context.send_initial_metadata(())
         _run = True
-        while _run:
-            report = subscription.reports.get()
-            if report == 'stop':
-                _run = False
-                self._logger.info('OperationInvokedReport stopped')
-            else:
+        try:
+            while _run:
+                report = subscription.reports.get()
+                if report == 'stop':
+                    _run = False
+                    self._logger.info('OperationInvokedReport stopped')
+                    if subscription.end_reason is not None:
+                        context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, subscription.end_reason)
+                else:
+                    self._logger.info('yield OperationInvokedReport %s', report.__class__.__name__)
+                    yield report
+                    # self._logger.info('yield OperationInvokedReport done')
+        finally:
+            self._provider.subscriptions_manager.remove_subscription(subscription)
+
+
+class AioSetService(SetService):
+    """SetService for a grpc.aio server.
+
+    The set methods stay synchronous (grpc.aio runs them in its migration thread pool),
+    only the OperationInvokedReport stream is a coroutine.
+    """
+
+    async def OperationInvokedReport(self, request, context):
+        actions = [OperationInvokedAction]
+        self._logger.debug('OperationInvokedReport called')
+        try:
+            subscription = self._provider.subscriptions_manager.on_subscribe_request(actions)
+        except TooManySubscriptionsError as ex:
+            self._logger.warning('OperationInvokedReport rejected: %s', ex)
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(ex))
+        await context.send_initial_metadata(())
+        try:
+            while True:
+                report = await subscription.reports.get_async()
+                if report == 'stop':
+                    self._logger.info('OperationInvokedReport stopped')
+                    if subscription.end_reason is not None:
+                        await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, subscription.end_reason)
+                    return
                 self._logger.info('yield OperationInvokedReport %s', report.__class__.__name__)
                 yield report
-                # self._logger.info('yield OperationInvokedReport done')
+        finally:
+            self._provider.subscriptions_manager.remove_subscription(subscription)
@@ -1,18 +1,26 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Callable
+import asyncio
+import contextlib
+import functools
 import uuid
 from collections import deque
+from dataclasses import dataclass
+from enum import Enum, IntEnum
 import queue
+import threading
+import time
 from lxml import etree as etree_
 from sdc11073.etc import short_filter_string
 from sdc11073.namespaces import default_ns_helper as nsh
 from sdc11073 import multikey
 from sdc11073 import loghelper
+from sdc11073.xml_types.msg_types import InvocationState
 from org.somda.protosdc.proto.model.sdc_messages_pb2 import EpisodicReportStream
 from org.somda.protosdc.proto.model.sdc_messages_pb2 import OperationInvokedReportStream
 from pyprotosdc.actions import ReportAction, OperationInvokedAction
-from ..mapping.statesmapper import generic_state_to_p
-from ..mapping.descriptorsmapper import generic_descriptor_to_p
+from .fragmentcache import FragmentCache
+from .reporthistory import ReportHistory, ResumePoint
 from ..mapping.basic_mappers import enum_attr_to_p
 from ..mapping.msgtypes_mappers import set_mdib_version_group
 from ..mapping.mapping_helpers import get_p_attr, find_one_of_p_for_container
@@ -24,6 +32,20 @@ if TYPE_CHECKING:
     from sdc11073.xml_types import msg_types
 
 MAX_ROUNDTRIP_VALUES = 20
+_KNOWN_ACTIONS = [a.value for a in ReportAction] + [OperationInvokedAction]
+DEFAULT_MAX_QUEUE_SIZE = 50
+DEFAULT_STARVATION_LIMIT = 8
+
+
+class TooManySubscriptionsError(Exception):
+    """Raised if a new subscription would exceed max_subscriptions."""
+
+
+class OverflowPolicy(str, Enum):
+    """What a subscription does with a new report if its queue is full."""
+    DROP_OLDEST = 'DropOldest'  # remove the oldest queued report
+    COALESCE = 'Coalesce'  # merge metric reports per handle, drop oldest if this is not possible
+    DISCONNECT = 'Disconnect'  # end the subscription
 
 
 class _RoundTripData(object):
@@ -45,11 +67,248 @@ class _RoundTripData(object):
         return 'min={:.4f} max={:.4f} avg={:.4f} absmax={:.4f}'.format(self.min, self.max, self.avg, self.abs_max)
 
 
+@dataclass
+class SubscriptionStats:
+    identifier: str
+    filter: tuple[str, ...]
+    queue_depth: int
+    queue_high_water_mark: int
+    delivered_reports: int
+    delivered_bytes: int
+    dropped_reports: int
+    coalesced_reports: int
+    roundtrip: _RoundTripData  # enqueue-to-yield latency of the last delivered reports in seconds
+    latency_by_priority: dict[ReportPriority, _RoundTripData]  # enqueue-to-dequeue latency
+
+
+class SerializedReport:
+    """A report message together with its serialized bytes.
+
+    The bytes are created once and shared by all subscriptions, see serialize_episodic_report in
+    mdibreportingservice.py for the matching grpc response serializer.
+    """
+    __slots__ = ('message', 'data')
+
+    def __init__(self, message: EpisodicReportStream, data: bytes | None = None):
+        self.message = message
+        self.data = message.SerializeToString() if data is None else data
+
+    @property
+    def addressing(self):
+        return self.message.addressing
+
+
+class ReportPriority(IntEnum):
+    """Delivery order of the reports in a subscription with priority lanes, lower value first."""
+    HIGH = 0  # alerts, operational states and operation invoked reports
+    NORMAL = 1  # metrics, contexts, components and description modifications
+    LOW = 2  # waveforms
+
+
+_REPORT_PRIORITIES = {ReportAction.EpisodicAlertReport.value: ReportPriority.HIGH,
+                      ReportAction.EpisodicOperationalStateReport.value: ReportPriority.HIGH,
+                      OperationInvokedAction: ReportPriority.HIGH,
+                      ReportAction.Waveform.value: ReportPriority.LOW}
+
+
+def report_priority(report) -> ReportPriority:
+    return _REPORT_PRIORITIES.get(report.addressing.action, ReportPriority.NORMAL)
+
+
+class _QueueEntry:
+    __slots__ = ('report', 'metric_handles', 'priority', 'enqueued', 'seq', 'barrier')
+
+    def __init__(self, report, metric_handles: list[str] | None,
+                 priority: ReportPriority = ReportPriority.NORMAL, enqueued: float | None = None,
+                 seq: int = 0, barrier: bool = False):
+        self.report = report
+        self.metric_handles = metric_handles  # handles of the states of an episodic metric report, else None
+        self.priority = priority
+        self.enqueued = time.monotonic() if enqueued is None else enqueued
+        self.seq = seq  # order of put
+        self.barrier = barrier  # no report is delivered across it, see ReportQueue
+
+
+def _merge_metric_reports(older: _QueueEntry, newer: _QueueEntry) -> _QueueEntry:
+    """Return older with the states of newer: the states of older that newer does not contain, then newer's states.
+
+    The merged report replaces older in the queue, it keeps the header (addressing, mdib version) of older,
+    so that the mdib versions in the stream still increase.
+    """
+    newer_msg = newer.report.message if isinstance(newer.report, SerializedReport) else newer.report
+    older_msg = older.report.message if isinstance(older.report, SerializedReport) else older.report
+    merged = EpisodicReportStream()
+    merged.CopyFrom(older_msg)
+    merged_part = merged.report.metric.abstract_metric_report.report_part[0]
+    older_part = older_msg.report.metric.abstract_metric_report.report_part[0]
+    newer_part = newer_msg.report.metric.abstract_metric_report.report_part[0]
+    newer_handles = set(newer.metric_handles)
+    kept = [(handle, p_state) for handle, p_state in zip(older.metric_handles, older_part.metric_state)
+            if handle not in newer_handles]
+    handles = [handle for handle, _ in kept] + list(newer.metric_handles)
+    p_states = [p_state for _, p_state in kept] + list(newer_part.metric_state)
+    del merged_part.metric_state[:]
+    merged_part.metric_state.extend(p_states)
+    if isinstance(older.report, SerializedReport):
+        merged = SerializedReport(merged)
+    return _QueueEntry(merged, handles, older.priority, older.enqueued, older.seq)
+
+
+class ReportQueue:
+    """A bounded queue of reports that never blocks the sender.
+
+    The consumer side has the same get / get_nowait / empty / qsize methods as queue.Queue.
+    If the queue is full, the subscription's overflow policy decides what happens.
+    If the subscription has priority lanes, every ReportPriority has its own FIFO and get returns the report
+    of the highest priority. A lane that was passed over starvation_limit times in a row is served next,
+    therefore a waveform is delayed by at most starvation_limit alert or metric reports.
+    A DescriptionModificationReport is a barrier across the lanes: it is delivered after all reports that were put
+    before it, and before all reports that were put after it. Otherwise e.g. the alert report of a new descriptor
+    could reach the consumer before the descriptor itself.
+    Without priority lanes all reports are in the NORMAL lane, which is a plain FIFO.
+    The 'stop' string is returned after all queued reports.
+    """
+
+    def __init__(self, subscription: GDevSubscription, maxsize: int):
+        self._subscription = subscription
+        self.maxsize = maxsize
+        self._lanes: tuple[deque[_QueueEntry], ...] = tuple(deque() for _ in ReportPriority)
+        self._size = 0
+        self._seq = 0
+        self._barriers: deque[int] = deque()  # seq of the queued barrier reports
+        self._stop: str | None = None
+        self._bypassed = [0] * len(ReportPriority)  # how often a non-empty lane was passed over in a row
+        self._not_empty = threading.Condition(threading.Lock())
+        self.high_water_mark = 0
+        self.last_enqueued: float | None = None  # put time of the report that get returned last
+        # time between put and get per priority, in seconds
+        self.latencies = {p: deque(maxlen=MAX_ROUNDTRIP_VALUES) for p in ReportPriority}
+        self.max_latencies = {p: 0.0 for p in ReportPriority}
+
+    def put(self, report, metric_handles: list[str] | None = None):
+        """Add a report. Returns False if the subscription has to be disconnected."""
+        with self._not_empty:
+            if isinstance(report, str):
+                self._stop = report
+                self._not_empty.notify()
+                return True
+            if self._subscription.priority_lanes:
+                priority = report_priority(report)
+                barrier = report.addressing.action == ReportAction.DescriptionModificationReport.value
+            else:
+                priority, barrier = ReportPriority.NORMAL, False
+            entry = _QueueEntry(report, metric_handles, priority, seq=self._seq, barrier=barrier)
+            self._seq += 1
+            if 0 < self.maxsize <= self._size:
+                if not self._handle_overflow(entry):
+                    return False
+            else:
+                self._lanes[priority].append(entry)
+                self._size += 1
+                if barrier:
+                    self._barriers.append(entry.seq)
+            self.high_water_mark = max(self.high_water_mark, self._size)
+            self._not_empty.notify()
+        return True
+
+    def _handle_overflow(self, entry: _QueueEntry) -> bool:
+        subscription = self._subscription
+        policy = subscription.overflow_policy
+        if policy == OverflowPolicy.DISCONNECT:
+            subscription.dropped_reports += self._size + 1
+            for lane in self._lanes:
+                lane.clear()
+            self._barriers.clear()
+            self._size = 0
+            return False
+        lane = self._lanes[entry.priority]
+        if policy == OverflowPolicy.COALESCE and entry.metric_handles is not None:
+            # never merge states across a barrier
+            newest_barrier = self._barriers[-1] if self._barriers else -1
+            for i in range(len(lane) - 1, -1, -1):
+                older = lane[i]
+                if older.seq < newest_barrier:
+                    break
+                if older.metric_handles is not None:
+                    lane[i] = _merge_metric_reports(older, entry)
+                    subscription.coalesced_reports += 1
+                    return True
+        # drop the oldest report of the lowest priority
+        for lowest in reversed(self._lanes):
+            if lowest:
+                if lowest.popleft().barrier:
+                    self._barriers.popleft()  # the oldest report of a lane is also its oldest barrier
+                break
+        lane.append(entry)
+        if entry.barrier:
+            self._barriers.append(entry.seq)
+        subscription.dropped_reports += 1
+        return True
+
+    def _pop(self):
+        # caller holds self._not_empty
+        if not self._size:
+            stop, self._stop = self._stop, None
+            return stop
+        limit = self._subscription.starvation_limit
+        # with a queued barrier only the reports before it can be delivered, the barrier itself comes last
+        barrier = self._barriers[0] if self._barriers else None
+        if barrier is not None and any(lane and lane[0].seq < barrier for lane in self._lanes):
+            barrier -= 1
+        chosen = None
+        for priority, lane in enumerate(self._lanes):
+            if not lane:
+                self._bypassed[priority] = 0
+            elif barrier is not None and lane[0].seq > barrier:
+                continue
+            elif chosen is None:
+                chosen = priority
+            elif limit and self._bypassed[priority] >= limit and self._bypassed[chosen] < limit:
+                chosen = priority
+        for priority, lane in enumerate(self._lanes):
+            if lane and (barrier is None or lane[0].seq <= barrier):
+                self._bypassed[priority] = 0 if priority == chosen else self._bypassed[priority] + 1
+        entry = self._lanes[chosen].popleft()
+        if entry.barrier:
+            self._barriers.popleft()
+        self._size -= 1
+        self.last_enqueued = entry.enqueued
+        latency = time.monotonic() - entry.enqueued
+        self.latencies[entry.priority].append(latency)
+        self.max_latencies[entry.priority] = max(self.max_latencies[entry.priority], latency)
+        return entry.report
+
+    def get(self, block: bool = True, timeout: float | None = None):
+        with self._not_empty:
+            if block:
+                if not self._not_empty.wait_for(lambda: self._size or self._stop is not None, timeout):
+                    raise queue.Empty
+            elif not self._size and self._stop is None:
+                raise queue.Empty
+            return self._pop()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self) -> bool:
+        with self._not_empty:
+            return not self._size and self._stop is None
+
+    def qsize(self) -> int:
+        with self._not_empty:
+            return self._size + (self._stop is not None)
+
+
 class GDevSubscription(object):
     MAX_NOTIFY_ERRORS = 1
     IDENT_TAG = etree_.QName('http.local.com', 'MyDevIdentifier')
 
-    def __init__(self, max_subscription_duration, filter_):  # pylint:disable=too-many-arguments
+    def __init__(self, max_subscription_duration, filter_,
+                 max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 waveform_batch_interval: float = 0,
+                 priority_lanes: bool = False,
+                 starvation_limit: int = DEFAULT_STARVATION_LIMIT):  # pylint:disable=too-many-arguments
         self.my_identifier = etree_.Element(self.IDENT_TAG)
         self.my_identifier.text = uuid.uuid4().urn
 
@@ -58,6 +317,8 @@ class GDevSubscription(object):
         # self._expireseconds = None
         # self.renew(7200)  # sets self._started and self._expireseconds
         self._filters = filter_
+        # the normalized actions of the filters, used for the 'action' index of the subscriptions manager
+        self.actions = [a for a in _KNOWN_ACTIONS if any(f.endswith(a) for f in filter_)]
 
         self._notifyErrors = 0
         self._is_closed = False
@@ -65,7 +326,26 @@ class GDevSubscription(object):
         self.last_roundtrip_times = deque(
             maxlen=MAX_ROUNDTRIP_VALUES)  # a list of last n roundtrip times for notifications
         self.max_roundtrip_time = 0
-        self.reports = queue.Queue(maxsize=50)
+        self.delivered_reports = 0
+        self.delivered_bytes = 0
+        self.overflow_policy = overflow_policy
+        self.dropped_reports = 0
+        self.coalesced_reports = 0
+        self.end_reason: str | None = None  # set if the provider ended the subscription
+        # waveform reports within this time (in seconds) are sent as one report
+        self.waveform_batch_interval = waveform_batch_interval
+        self._waveform_batch: list[EpisodicReportStream | SerializedReport] = []
+        self._waveform_lock = threading.RLock()
+        self._waveform_timer: threading.Timer | None = None
+        # deliver alerts and operation reports before metrics, and metrics before waveforms
+        self.priority_lanes = priority_lanes
+        self.starvation_limit = starvation_limit  # 0 means strict priority
+        # reports from the report history that the consumer missed, they are sent before the queued reports
+        self.resumed_reports: list[SerializedReport] | None = None
+        # with a report history: all reports of this subscription have a newer mdib version
+        self.base_sequence_id: str | None = None
+        self.base_mdib_version: int | None = None
+        self.reports = ReportQueue(self, max_queue_size)
 
     # def renew(self, expires):
     #     self._started = time.monotonic()
@@ -100,13 +380,72 @@ class GDevSubscription(object):
                 return True
         return False
 
-    def send_notification_report(self, report):
-        self.reports.put(report)
+    @property
+    def queue_high_water_mark(self) -> int:
+        return self.reports.high_water_mark
+
+    def send_notification_report(self, report, metric_handles: list[str] | None = None):
+        """Queue the report without blocking.
+
+        metric_handles are the descriptor handles of the states in an episodic metric report,
+        they allow to coalesce metric reports.
+        Returns False if the subscription was ended because of a queue overflow.
+        """
+        if self._is_closed:
+            return True
+        with self._waveform_lock:
+            if self.waveform_batch_interval > 0 and report.addressing.action == ReportAction.Waveform.value:
+                self._waveform_batch.append(report)
+                if self._waveform_timer is None:
+                    self._waveform_timer = threading.Timer(self.waveform_batch_interval, self.flush_waveforms)
+                    self._waveform_timer.daemon = True
+                    self._waveform_timer.start()
+                return True
+            # buffered waveforms have older mdib versions, they must be delivered first.
+            # With priority_lanes this only holds for DescriptionModificationReports, see ReportQueue.
+            return self._flush_waveforms() and self._put(report, metric_handles)
+
+    def flush_waveforms(self) -> bool:
+        """Send all buffered waveform reports as one report.
+
+        Returns False if the subscription was ended because of a queue overflow.
+        """
+        with self._waveform_lock:
+            return self._flush_waveforms()
+
+    def _flush_waveforms(self) -> bool:
+        # caller holds self._waveform_lock
+        if self._waveform_timer is not None:
+            self._waveform_timer.cancel()
+            self._waveform_timer = None
+        batch, self._waveform_batch = self._waveform_batch, []
+        if not batch:
+            return True
+        if len(batch) == 1:
+            return self._put(batch[0], None)
+        # Concatenated protobuf messages are parsed as one merged message: the states of all reports
+        # in their original order, addressing and MdibVersionGroup of the newest report.
+        # message is the same merge, so that it matches data (e.g. for the report history and the statistics).
+        message = EpisodicReportStream()
+        for report in batch:
+            message.MergeFrom(report.message if isinstance(report, SerializedReport) else report)
+        data = b''.join(r.data if isinstance(r, SerializedReport) else r.SerializeToString() for r in batch)
+        return self._put(SerializedReport(message, data), None)
+
+    def _put(self, report, metric_handles: list[str] | None) -> bool:
+        if not self.reports.put(report, metric_handles):
+            self.end_reason = f'report queue overflow ({self.reports.maxsize} reports)'
+            self._is_closed = True
+            self.reports.put('stop')
+            return False
+        return True
 
     # def sendNotificationEndMessage(self, action, code='SourceShuttingDown', reason='Event source going off line.'):
     #     pass
 
     def close(self):
+        if not self._is_closed:
+            self.flush_waveforms()
         self.reports.put('stop')
         self._is_closed = True
 
@@ -119,22 +458,174 @@ class GDevSubscription(object):
             ref_ident, self.my_identifier.text,
             short_filter_string(self._filters))
 
+    def record_delivery(self, report, enqueued: float | None):
+        """Called after a report was handed to grpc. enqueued is the monotonic time of ReportQueue.put."""
+        self.delivered_reports += 1
+        self.delivered_bytes += len(report.data) if isinstance(report, SerializedReport) else report.ByteSize()
+        if enqueued is not None:
+            roundtrip_time = time.monotonic() - enqueued
+            self.last_roundtrip_times.append(roundtrip_time)
+            self.max_roundtrip_time = max(self.max_roundtrip_time, roundtrip_time)
+
+    def get_stats(self) -> SubscriptionStats:
+        return SubscriptionStats(identifier=self.my_identifier.text,
+                                 filter=self.short_filter_names(),
+                                 queue_depth=self.reports.qsize(),
+                                 queue_high_water_mark=self.reports.high_water_mark,
+                                 delivered_reports=self.delivered_reports,
+                                 delivered_bytes=self.delivered_bytes,
+                                 dropped_reports=self.dropped_reports,
+                                 coalesced_reports=self.coalesced_reports,
+                                 roundtrip=self.get_roundtrip_stats(),
+                                 latency_by_priority=self.get_latency_stats())
+
     def get_roundtrip_stats(self):
         if len(self.last_roundtrip_times) > 0:
             return _RoundTripData(self.last_roundtrip_times, self.max_roundtrip_time)
         else:
             return _RoundTripData(None, None)
 
+    def get_latency_stats(self) -> dict[ReportPriority, _RoundTripData]:
+        """Time between queueing and delivery of the last reports per priority.
+
+        Without priority lanes all reports are counted as ReportPriority.NORMAL.
+        """
+        return {p: _RoundTripData(self.reports.latencies[p], self.reports.max_latencies[p])
+                for p in ReportPriority}
+
     def short_filter_names(self):
         return tuple([f.split('/')[-1] for f in self._filters])
 
 
+def _coalesced(action: ReportAction):
+    """Decorator for report methods whose states can be coalesced per descriptor handle.
+
+    If the coalescing window of the subscriptions manager is > 0, the states are only collected.
+    The report is sent when the window has elapsed or before any other report except a waveform is sent.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(self, states, mdib_version_group):
+            if self.coalescing_window <= 0:
+                return func(self, states, mdib_version_group)
+            self._add_pending_states(action, func, states, mdib_version_group)
+
+        return wrapped
+
+    return decorator
+
+
+def _after_coalesced(func):
+    """Decorator for report methods that are never coalesced.
+
+    Pending coalesced states are sent first, so that reports are still sent in mdib version order.
+    """
+
+    @functools.wraps(func)
+    def wrapped(self, *args, **kwargs):
+        if self.coalescing_window <= 0:
+            return func(self, *args, **kwargs)
+        if self.delivery_gate is not None:
+            self.delivery_gate()
+        with self._coalesce_lock:
+            self._send_pending_states()
+            return func(self, *args, **kwargs)
+
+    return wrapped
+
+
+def _beside_coalesced(func):
+    """Decorator for report methods that do not send pending coalesced states first (waveforms).
+
+    Waveforms are sent every few ms, flushing before them would shrink the coalescing window to the waveform period.
+    The mdib version group is remembered instead, pending states are sent with it if it is newer than theirs.
+    """
+
+    @functools.wraps(func)
+    def wrapped(self, states, mdib_version_group):
+        if self.coalescing_window <= 0:
+            return func(self, states, mdib_version_group)
+        if self.delivery_gate is not None:
+            self.delivery_gate()
+        with self._coalesce_lock:
+            self._newest_sent_mdib_version_group = mdib_version_group
+            return func(self, states, mdib_version_group)
+
+    return wrapped
+
+
+@dataclass
+class _InvocationPart:
+    operation_handle: str
+    transaction_id: int
+    invocation_state: InvocationState
+    mdib_version_group: MdibVersionGroup
+    operation_target: str | None
+    error: msg_types.InvocationError | None
+    error_message: str | None
+
+
+_FINAL_INVOCATION_STATES = (InvocationState.FINISHED, InvocationState.FINISHED_MOD, InvocationState.FAILED,
+                            InvocationState.CANCELLED, InvocationState.CANCELLED_MANUALLY)
+
+
+def _collapse_wait_start(parts: list[_InvocationPart]) -> list[_InvocationPart]:
+    """Remove WAIT and START of invocations whose final state is also in parts."""
+    finished = {part.transaction_id for part in parts if part.invocation_state in _FINAL_INVOCATION_STATES}
+    return [part for part in parts
+            if part.transaction_id not in finished
+            or part.invocation_state not in (InvocationState.WAIT, InvocationState.START)]
+
+
 class GSubscriptionsManager:
 
     DEFAULT_MAX_SUBSCR_DURATION = 7200  # max. possible duration of a subscription
 
-    def __init__(self, sdc_definitions, max_subscription_duration=None, log_prefix=None):
+    def __init__(self, sdc_definitions, max_subscription_duration=None, log_prefix=None, serialize_once=True,
+                 max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 coalescing_window: float = 0,
+                 max_subscriptions: int | None = None,
+                 fragment_cache: FragmentCache | None = None,
+                 operation_invoked_window: float = 0,
+                 collapse_wait_start: bool = False,
+                 waveform_batch_interval: float = 0,
+                 priority_lanes: bool = False,
+                 starvation_limit: int = DEFAULT_STARVATION_LIMIT,
+                 report_history: ReportHistory | None = None):
         self.sdc_definitions = sdc_definitions
+        # protobuf representation of states and descriptors, shared with the GetService.
+        # Only useful if the versions of the states are maintained (mdib transactions), therefore no cache by default.
+        self.fragment_cache = fragment_cache or FragmentCache(enabled=False)
+        # every subscription is a streaming rpc that occupies a grpc server thread, None means no limit
+        self.max_subscriptions = max_subscriptions  # EpisodicReport and OperationInvokedReport streams together
+        self.serialize_once = serialize_once  # serialize episodic reports only once for all subscribers
+        self.max_queue_size = max_queue_size  # used for new subscriptions
+        self.overflow_policy = overflow_policy  # used for new subscriptions
+        self.delivery_gate: Callable[[], None] | None = None  # called before a report is handed to subscriptions
+        # metric, alert and operational state updates within this time (in seconds) are sent as one report
+        self.coalescing_window = coalescing_window
+        self._coalesce_lock = threading.RLock()
+        self._pending_states: dict[ReportAction, tuple[Callable, dict[str, Any]]] = {}
+        self._pending_mdib_version_group: MdibVersionGroup | None = None
+        self._newest_sent_mdib_version_group: MdibVersionGroup | None = None  # of a waveform sent while pending
+        self._coalesce_timer: threading.Timer | None = None
+        # invocation states within this time (in seconds) are sent as one OperationInvokedReport
+        self.operation_invoked_window = operation_invoked_window
+        # if True, WAIT and START are not sent if the final state of the invocation is in the same report
+        self.collapse_wait_start = collapse_wait_start
+        self._invocations_lock = threading.Lock()
+        self._pending_invocations: list[_InvocationPart] = []
+        self._invocations_timer: threading.Timer | None = None
+        # default of new subscriptions: waveform reports within this time (in seconds) are sent as one report
+        self.waveform_batch_interval = waveform_batch_interval
+        # defaults of new subscriptions, see ReportQueue
+        self.priority_lanes = priority_lanes
+        self.starvation_limit = starvation_limit
+        # recent reports for consumers that resume a broken subscription, None means no resume
+        self.report_history = report_history
+        self._resumable_actions: dict[str, float] = {}  # actions of removed subscriptions, value is the expiry
         self.log_prefix = log_prefix
         self._logger = loghelper.get_logger_adapter('sdc.grpc.dev.subscrMgr', self.log_prefix)
         self._max_subscription_duration = max_subscription_duration or self.DEFAULT_MAX_SUBSCR_DURATION
@@ -142,30 +633,103 @@ class GSubscriptionsManager:
         self._subscriptions.add_index('identifier', multikey.UIndexDefinition(lambda obj: obj.my_identifier.text))
         self._subscriptions.add_index('netloc', multikey.IndexDefinition(
             lambda obj: obj._url.netloc))  # pylint:disable=protected-access
+        self._subscriptions.add_index('action', multikey.IndexDefinition1n(lambda obj: obj.actions))
         self.base_urls = None
 
     def stop(self):
+        self.flush_coalesced_reports()
+        self.flush_operation_invoked_reports()
         for s in self._subscriptions.objects:
             s.close()
 
-    def on_subscribe_request(self, action_strings: list[str]) -> GDevSubscription:
-        s = GDevSubscription(self._max_subscription_duration, action_strings)
-        with self._subscriptions.lock:
-            self._subscriptions.add_object(s)
+    def flush_coalesced_reports(self):
+        """Send all pending coalesced states now."""
+        with self._coalesce_lock:
+            self._send_pending_states()
+
+    def _add_pending_states(self, action: ReportAction, send_func: Callable, states, mdib_version_group):
+        if not self._getSubscriptionsForAction(action) and not self._keep_for_resume(action, mdib_version_group):
+            return
+        if self.delivery_gate is not None:
+            self.delivery_gate()
+        with self._coalesce_lock:
+            pending = self._pending_states.get(action)
+            if pending is None:
+                pending = self._pending_states[action] = (send_func, {})
+            for sc in states:
+                pending[1][sc.DescriptorHandle] = sc  # newer state replaces older state
+            self._pending_mdib_version_group = mdib_version_group
+            if self._coalesce_timer is None:
+                self._coalesce_timer = threading.Timer(self.coalescing_window, self.flush_coalesced_reports)
+                self._coalesce_timer.daemon = True
+                self._coalesce_timer.start()
+
+    def _send_pending_states(self):
+        # caller holds self._coalesce_lock
+        if self._coalesce_timer is not None:
+            self._coalesce_timer.cancel()
+            self._coalesce_timer = None
+        pending_states, self._pending_states = self._pending_states, {}
+        if not pending_states:
+            return
+        mdib_version_group = self._pending_mdib_version_group
+        newest = self._newest_sent_mdib_version_group
+        if (newest is not None
+                and newest.sequence_id == mdib_version_group.sequence_id
+                and newest.instance_id == mdib_version_group.instance_id
+                and newest.mdib_version > mdib_version_group.mdib_version):
+            # a waveform with a newer mdib version was sent, the pending states are still valid at that version
+            mdib_version_group = newest
+        for send_func, states in pending_states.values():
+            send_func(self, list(states.values()), mdib_version_group)
+
+    def _mk_subscription(self, action_strings: list[str]) -> GDevSubscription:
+        return GDevSubscription(self._max_subscription_duration, action_strings,
+                                self.max_queue_size, self.overflow_policy, self.waveform_batch_interval,
+                                self.priority_lanes, self.starvation_limit)
+
+    def on_subscribe_request(self, action_strings: list[str],
+                             resume_from: ResumePoint | None = None) -> GDevSubscription:
+        """Add a new subscription.
+
+        resume_from tells what the consumer received in an earlier subscription. If the report history
+        still has all reports since then, they are in subscription.resumed_reports, otherwise resumed_reports is None.
+        """
+        s = self._mk_subscription(action_strings)
+        with self.report_history.lock if self.report_history is not None else contextlib.nullcontext():
+            with self._subscriptions.lock:
+                if self.max_subscriptions is not None and len(self._subscriptions.objects) >= self.max_subscriptions:
+                    raise TooManySubscriptionsError(f'max. {self.max_subscriptions} subscriptions allowed')
+                self._subscriptions.add_object(s)
+            if self.report_history is not None:
+                s.base_sequence_id = self.report_history.sequence_id
+                s.base_mdib_version = self.report_history.base_mdib_version()
+                if resume_from is not None:
+                    s.resumed_reports = self.report_history.reports_since(resume_from, s.actions)
         self._logger.info('new {}', s)
+        if resume_from is not None:
+            self._logger.info('%s resumes from mdib version %d: %s', s, resume_from.mdib_version,
+                              'not possible' if s.resumed_reports is None else f'{len(s.resumed_reports)} reports')
         return s
 
     def remove_subscription(self, subscription: GDevSubscription):
         self._logger.info('remove  {}', subscription)
         self._subscriptions.remove_object(subscription)
+        if self.report_history is not None:
+            # the consumer might resume, keep recording its actions for a while
+            expiry = time.monotonic() + self.report_history.resume_timeout
+            with self._subscriptions.lock:
+                for action in subscription.actions:
+                    self._resumable_actions[action] = expiry
         # read queue empty in order to avoid possible blockings
         while not subscription.reports.empty():
             subscription.reports.get()
 
+    @_coalesced(ReportAction.EpisodicMetricReport)
     def send_episodic_metric_report(self, states, mdib_version_group):
         action = ReportAction.EpisodicMetricReport
         subscribers = self._getSubscriptionsForAction(action)
-        if not subscribers:
+        if not subscribers and not self._keep_for_resume(action, mdib_version_group):
             self._logger.debug('sending episodic metric report: no subscribers')
             return
         self._logger.info('sending episodic metric report to %d subscribers', len(subscribers))
@@ -181,16 +745,16 @@ class GSubscriptionsManager:
         p_report_part.abstract_report_part.source_mds.string = 'ToDo'
         for sc in states:
             p_st = p_report_part.metric_state.add()
-            generic_state_to_p(sc, p_st)
-        for s in subscribers:
-            s.send_notification_report(report)
+            self.fragment_cache.state_to_p(sc, p_st)
+        self._send_episodic_report(subscribers, report, mdib_version_group, [sc.DescriptorHandle for sc in states])
 
+    @_coalesced(ReportAction.EpisodicOperationalStateReport)
     def send_episodic_operational_state_report(self, states, mdib_version_group):
         action = ReportAction.EpisodicOperationalStateReport
         subscribers = self._getSubscriptionsForAction(action)
-        if not subscribers:
+        if not subscribers and not self._keep_for_resume(action, mdib_version_group):
             self._logger.debug('sending episodic operational state report: no subscribers')
-            # return
+            return
         self._logger.info('sending episodic operational state report to %d subscribers', len(subscribers))
         report = EpisodicReportStream()
         report.addressing.action = action.value
@@ -204,14 +768,14 @@ class GSubscriptionsManager:
         for sc in states:
             p_st_oneof = p_report_part.operation_state.add()
             p_st = find_one_of_p_for_container(sc, p_st_oneof)
-            generic_state_to_p(sc, p_st)
-        for s in subscribers:
-            s.send_notification_report(report)
+            self.fragment_cache.state_to_p(sc, p_st)
+        self._send_episodic_report(subscribers, report, mdib_version_group)
 
+    @_coalesced(ReportAction.EpisodicAlertReport)
     def send_episodic_alert_report(self, states, mdib_version_group):
         action = ReportAction.EpisodicAlertReport
         subscribers = self._getSubscriptionsForAction(action)
-        if not subscribers:
+        if not subscribers and not self._keep_for_resume(action, mdib_version_group):
             self._logger.debug('sending episodic alert report: no subscribers')
             return
         self._logger.info('sending episodic alert report to %d subscribers', len(subscribers))
@@ -227,14 +791,14 @@ class GSubscriptionsManager:
         p_report_part.abstract_report_part.source_mds.string = 'ToDo'
         for sc in states:
             p_st = p_report_part.alert_state.add()
-            generic_state_to_p(sc, p_st)
-        for s in subscribers:
-            s.send_notification_report(report)
+            self.fragment_cache.state_to_p(sc, p_st)
+        self._send_episodic_report(subscribers, report, mdib_version_group)
 
+    @_after_coalesced
     def send_episodic_component_state_report(self, states, mdib_version_group):
         action = ReportAction.EpisodicComponentReport
         subscribers = self._getSubscriptionsForAction(action)
-        if not subscribers:
+        if not subscribers and not self._keep_for_resume(action, mdib_version_group):
             self._logger.debug('sending episodic component state report: no subscribers')
             return
         self._logger.info('sending episodic component state report to %d subscribers', len(subscribers))
@@ -249,14 +813,14 @@ class GSubscriptionsManager:
             p_report_part = oneof_report.abstract_component_report.report_part.add()
             p_report_part.abstract_report_part.source_mds.string = 'ToDo'
             p_st = p_report_part.component_state.add()
-            generic_state_to_p(sc, p_st)
-        for s in subscribers:
-            s.send_notification_report(report)
+            self.fragment_cache.state_to_p(sc, p_st)
+        self._send_episodic_report(subscribers, report, mdib_version_group)
 
+    @_after_coalesced
     def send_episodic_context_report(self, states, mdib_version_group):
         action = ReportAction.EpisodicContextReport
         subscribers = self._getSubscriptionsForAction(action)
-        if not subscribers:
+        if not subscribers and not self._keep_for_resume(action, mdib_version_group):
             self._logger.debug('sending episodic context state report: no subscribers')
             return
         self._logger.info('sending episodic context state report to %d subscribers', len(subscribers))
@@ -271,14 +835,14 @@ class GSubscriptionsManager:
             p_report_part = oneof_report.abstract_context_report.report_part.add()  # ReportPartMsg
             p_report_part.abstract_report_part.source_mds.string = 'ToDo'
             p_st = p_report_part.context_state.add()
-            generic_state_to_p(sc, p_st)
-        for s in subscribers:
-            s.send_notification_report(report)
+            self.fragment_cache.state_to_p(sc, p_st)
+        self._send_episodic_report(subscribers, report, mdib_version_group)
 
+    @_beside_coalesced
     def send_realtime_samples_report(self, states, mdib_version_group):
         action = ReportAction.Waveform
         subscribers = self._getSubscriptionsForAction(action)
-        if not subscribers:
+        if not subscribers and not self._keep_for_resume(action, mdib_version_group):
             # self._logger.debug('sending real time samples report: no subscribers')
             return
         self._logger.info('sending real time samples report to %d subscribers', len(subscribers))
@@ -291,9 +855,8 @@ class GSubscriptionsManager:
         set_mdib_version_group(mdib_version_group_msg, mdib_version_group)
         for sc in states:
             p_st = waveform_stream_msg.state.add()
-            generic_state_to_p(sc, p_st)
-        for s in subscribers:
-            s.send_notification_report(episodic_report_stream)
+            self.fragment_cache.state_to_p(sc, p_st)
+        self._send_episodic_report(subscribers, episodic_report_stream, mdib_version_group)
 
     def _mk_descriptor_updates_report_part(self,
                                        report : DescriptionModificationReportMsg,
@@ -311,20 +874,23 @@ class GSubscriptionsManager:
                 # p_report_part.a_parent_descriptor.value = descrContainer.parentHandle
 
             p_descr = p_report_part.p_descriptor.add()
-            generic_descriptor_to_p(descr_container, p_descr)
+            self.fragment_cache.descriptor_to_p(descr_container, p_descr)
             related_state_containers = [s for s in updated_states if s.DescriptorHandle == descr_container.Handle]
             for state_container in related_state_containers:
                 p_state = p_report_part.state.add()
-                generic_state_to_p(state_container, p_state)
+                self.fragment_cache.state_to_p(state_container, p_state)
 
+    @_after_coalesced
     def send_descriptor_updates(self, updated, created, deleted, updated_states, mdib_version_group):
         action = ReportAction.DescriptionModificationReport
         subscribers = self._getSubscriptionsForAction(action)
-        if not subscribers:
+        if not subscribers and not self._keep_for_resume(action, mdib_version_group):
             self._logger.debug('sending DescriptionModificationReport: no subscribers')
             return
         self._logger.info('sending DescriptionModificationReport upd={} crt={} del={}', updated, created, deleted)
         report = EpisodicReportStream()
+        report.addressing.action = action.value
+        report.addressing.message_id = uuid.uuid4().urn
         oneof_report = report.report.description
         mdib_version_group_msg = get_p_attr(oneof_report.abstract_report,
                                             'MdibVersionGroup')
@@ -334,8 +900,7 @@ class GSubscriptionsManager:
         self._mk_descriptor_updates_report_part(oneof_report, 'Crt', created, updated_states)
         self._mk_descriptor_updates_report_part(oneof_report, 'Del', deleted, updated_states)
 
-        for s in subscribers:
-            s.send_notification_report(report)
+        self._send_episodic_report(subscribers, report, mdib_version_group)
 
     def send_operation_invoked_report(self,
                                       operation: OperationDefinitionBase,
@@ -345,42 +910,142 @@ class GSubscriptionsManager:
                                       operation_target: str | None = None,
                                       error: msg_types.InvocationError | None = None,
                                       error_message: str | None = None):
+        """Send the invocation state as OperationInvokedReport.
+
+        If operation_invoked_window > 0, all invocation states within the window are sent as one report
+        with one report part per invocation state.
+        """
         action = OperationInvokedAction
         subscribers = self._getSubscriptionsForAction(action)
         if not subscribers:
             self._logger.debug('sending operation invoked: no subscribers')
             return
-        self._logger.info('sending operation invoked to %d subscribers', len(subscribers))
+        part = _InvocationPart(operation.handle, transaction_id, invocation_state, mdib_version_group,
+                               operation_target, error, error_message)
+        if self.operation_invoked_window <= 0:
+            self._send_operation_invoked_parts(subscribers, [part])
+            return
+        with self._invocations_lock:
+            self._pending_invocations.append(part)
+            if self._invocations_timer is None:
+                self._invocations_timer = threading.Timer(self.operation_invoked_window,
+                                                          self.flush_operation_invoked_reports)
+                self._invocations_timer.daemon = True
+                self._invocations_timer.start()
 
+    def flush_operation_invoked_reports(self):
+        """Send all pending invocation states now."""
+        with self._invocations_lock:
+            if self._invocations_timer is not None:
+                self._invocations_timer.cancel()
+                self._invocations_timer = None
+            parts, self._pending_invocations = self._pending_invocations, []
+            if not parts:
+                return
+            if self.collapse_wait_start:
+                parts = _collapse_wait_start(parts)
+            subscribers = self._getSubscriptionsForAction(OperationInvokedAction)
+            if subscribers:
+                self._send_operation_invoked_parts(subscribers, parts)
+
+    def _send_operation_invoked_parts(self, subscribers: list[GDevSubscription], parts: list[_InvocationPart]):
+        self._logger.info('sending operation invoked with %d parts to %d subscribers', len(parts), len(subscribers))
         stream = OperationInvokedReportStream()
-        stream.addressing.action = action
-        stream.addressing.message_id = 'bernd'
+        stream.addressing.action = OperationInvokedAction
+        stream.addressing.message_id = uuid.uuid4().urn
         op_invoked = stream.operation_invoked
         mdib_version_group_msg = get_p_attr(op_invoked.abstract_report, 'MdibVersionGroup')
-
-        set_mdib_version_group(mdib_version_group_msg, mdib_version_group)
-        report_part = op_invoked.report_part.add()
-        report_part.abstract_report_part.source_mds.string = 'ToDo'
-        report_part.invocation_info.transaction_id.unsigned_int = transaction_id
-        enum_attr_to_p(invocation_state, report_part.invocation_info.invocation_state)
-        if error is not None:
-            enum_attr_to_p(error, report_part.invocation_info.invocation_error)
-        if error_message is not None:
-            tmp = report_part.invocation_info.invocation_error_message.add()  # LocalizedTextMsg
-            tmp.localized_text_content.string = error_message
-            get_p_attr(tmp, 'Lang').value = 'EN_en'
-        get_p_attr(report_part.invocation_source.instance_identifier, 'Root').any_u_r_i = nsh.SDC.namespace
-        get_p_attr(report_part.invocation_source.instance_identifier, 'Extension').string = 'AnonymousSdcParticipant'
-        get_p_attr(report_part, 'OperationHandleRef').string = operation.handle
-        if operation_target is not None:
-            get_p_attr(report_part, 'OperationTarget').string = operation_target
+        set_mdib_version_group(mdib_version_group_msg, parts[-1].mdib_version_group)
+        for part in parts:
+            report_part = op_invoked.report_part.add()
+            report_part.abstract_report_part.source_mds.string = 'ToDo'
+            report_part.invocation_info.transaction_id.unsigned_int = part.transaction_id
+            enum_attr_to_p(part.invocation_state, report_part.invocation_info.invocation_state)
+            if part.error is not None:
+                enum_attr_to_p(part.error, report_part.invocation_info.invocation_error)
+            if part.error_message is not None:
+                tmp = report_part.invocation_info.invocation_error_message.add()  # LocalizedTextMsg
+                tmp.localized_text_content.string = part.error_message
+                get_p_attr(tmp, 'Lang').value = 'EN_en'
+            get_p_attr(report_part.invocation_source.instance_identifier, 'Root').any_u_r_i = nsh.SDC.namespace
+            get_p_attr(report_part.invocation_source.instance_identifier,
+                       'Extension').string = 'AnonymousSdcParticipant'
+            get_p_attr(report_part, 'OperationHandleRef').string = part.operation_handle
+            if part.operation_target is not None:
+                get_p_attr(report_part, 'OperationTarget').string = part.operation_target
 
         for s in subscribers:
             s.send_notification_report(stream)
 
+    def _send_episodic_report(self, subscribers: list[GDevSubscription], report: EpisodicReportStream,
+                              mdib_version_group: MdibVersionGroup, metric_handles: list[str] | None = None):
+        if self.report_history is None:
+            if not subscribers:
+                return
+            if self.serialize_once:
+                report = SerializedReport(report)
+            if self.delivery_gate is not None:
+                self.delivery_gate()
+            self._deliver(subscribers, report, metric_handles)
+            return
+        serialized = SerializedReport(report)
+        if self.serialize_once:
+            report = serialized
+        if self.delivery_gate is not None:
+            self.delivery_gate()
+        with self.report_history.lock:
+            self.report_history.append(mdib_version_group, report.addressing.action, serialized)
+            # a subscription that was added in the meantime did not get this report from the history
+            self._deliver(self._getSubscriptionsForAction(report.addressing.action), report, metric_handles)
+
+    def _deliver(self, subscribers: list[GDevSubscription], report, metric_handles: list[str] | None):
+        for s in subscribers:
+            if not s.send_notification_report(report, metric_handles):
+                self._logger.warning('%s ended: %s', s, s.end_reason)
+
+    def get_subscription_stats(self) -> list[SubscriptionStats]:
+        """Return the delivery statistics of all subscriptions."""
+        with self._subscriptions.lock:
+            subscriptions = list(self._subscriptions.objects)
+        return [s.get_stats() for s in subscriptions]
+
+    def requested_actions(self) -> set[str]:
+        """Return the actions that at least one subscription wants to receive.
+
+        With a report history this includes the actions of subscriptions that might be resumed.
+        """
+        with self._subscriptions.lock:
+            actions = set(self._subscriptions.action.keys())
+            if self._resumable_actions:
+                now = time.monotonic()
+                actions.update(a for a, expiry in self._resumable_actions.items() if expiry > now)
+            return actions
+
+    def _keep_for_resume(self, action: ReportAction, mdib_version_group: MdibVersionGroup) -> bool:
+        """Return True if a report without subscribers is still needed for the report history.
+
+        If it is not needed, the history notes that it does not have this report.
+        """
+        if self.report_history is None:
+            return False
+        with self._subscriptions.lock:
+            expiry = self._resumable_actions.get(action.value)
+        if expiry is not None and expiry > time.monotonic():
+            return True
+        self.skip_report(action, mdib_version_group)
+        return False
+
+    def skip_report(self, action: ReportAction, mdib_version_group: MdibVersionGroup):
+        """Called for every report that is not created because nobody wants to receive it."""
+        if self.report_history is not None:
+            self.report_history.skip(mdib_version_group, action.value)
+
     def _getSubscriptionsForAction(self, action):
+        subscriptions = self._subscriptions.action.get(getattr(action, 'value', action))
+        if subscriptions is None:
+            return []
         with self._subscriptions.lock:
-            return [s for s in self._subscriptions.objects if s.matches(action)]
+            return list(subscriptions)
 
     # def _getSubscriptionforRequest(self, soapEnvelope):
     #     request_name = soapEnvelope.bodyNode[0].tag
@@ -430,3 +1095,58 @@ class GSubscriptionsManager:
     #         ret[k] = _RoundTripData(allvalues, max([s.max for s in stats]), )
     #     return ret
 
+
+class AioReportQueue(ReportQueue):
+    """ReportQueue that can be awaited in an asyncio event loop.
+
+    put can still be called from any thread, e.g. from the thread that commits an mdib transaction.
+    """
+
+    def __init__(self, subscription: GDevSubscription, maxsize: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(subscription, maxsize)
+        self._loop = loop
+        self._not_empty_event = asyncio.Event()
+
+    def put(self, report, metric_handles: list[str] | None = None):
+        ret = super().put(report, metric_handles)
+        try:
+            self._loop.call_soon_threadsafe(self._not_empty_event.set)
+        except RuntimeError:  # loop is already closed
+            pass
+        return ret
+
+    async def get_async(self):
+        while True:
+            try:
+                return self.get_nowait()
+            except queue.Empty:
+                self._not_empty_event.clear()
+                if self.empty():  # a put between get_nowait and clear would be lost otherwise
+                    await self._not_empty_event.wait()
+
+
+class AioDevSubscription(GDevSubscription):
+    """A subscription that is consumed by a coroutine instead of a thread."""
+
+    def __init__(self, max_subscription_duration, filter_,
+                 max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+                 overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 waveform_batch_interval: float = 0,
+                 priority_lanes: bool = False,
+                 starvation_limit: int = DEFAULT_STARVATION_LIMIT,
+                 loop: asyncio.AbstractEventLoop | None = None):
+        super().__init__(max_subscription_duration, filter_, max_queue_size, overflow_policy,
+                         waveform_batch_interval, priority_lanes, starvation_limit)
+        self.reports = AioReportQueue(self, max_queue_size, loop or asyncio.get_running_loop())
+
+
+class AioGSubscriptionsManager(GSubscriptionsManager):
+    """Subscriptions manager for the grpc.aio provider.
+
+    on_subscribe_request must be called in the event loop of the grpc server.
+    """
+
+    def _mk_subscription(self, action_strings: list[str]) -> AioDevSubscription:
+        return AioDevSubscription(self._max_subscription_duration, action_strings,
+                                  self.max_queue_size, self.overflow_policy, self.waveform_batch_interval,
+                                  self.priority_lanes, self.starvation_limit)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from threading import Lock
+from typing import TYPE_CHECKING
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, GClientMdibContainer uses sdc11073's ConsumerRtBuffer by default
+    np = None
+
+from sdc11073 import loghelper
+
+if TYPE_CHECKING:
+    from sdc11073.mdib.statecontainers import RealTimeSampleArrayMetricStateContainer
+
+
+class NumpyRtBuffer:
+    """Realtime samples of one waveform in preallocated numpy arrays.
+
+    Alternative to sdc11073's ConsumerRtBuffer, which creates one RtSampleContainer per sample. Only values and
+    time stamps are kept, no validity and no annotations.
+    Every sample is written twice (at index i and i + max_samples), therefore the last max_samples samples are
+    always a contiguous slice of the arrays, and get_window returns views instead of copies.
+    A view is overwritten when max_samples - len(view) newer samples are added, use copy() to keep it longer.
+    With pmtypesmapper.realtime_samples_as_floats the received samples are never converted to Decimals.
+    """
+
+    def __init__(self, sample_period: float, max_samples: int):
+        if np is None:
+            raise RuntimeError('NumpyRtBuffer needs numpy')
+        self.sample_period = sample_period
+        self._max_samples = max_samples
+        self._values = np.zeros(2 * max_samples, dtype=np.float64)
+        self._timestamps = np.zeros(2 * max_samples, dtype=np.float64)
+        self._position = 0  # next write index, always < max_samples
+        self._count = 0  # number of valid samples, <= max_samples
+        self._logger = loghelper.get_logger_adapter('sdc.client.mdib.rt')
+        self._lock = Lock()
+        self.last_sc = None  # last state container that was handled
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add_realtime_sample_array(self, realtime_sample_array_container: RealTimeSampleArrayMetricStateContainer):
+        """Add the samples of a RealTimeSampleArrayMetricStateContainer."""
+        self.last_sc = realtime_sample_array_container
+        metric_value = realtime_sample_array_container.MetricValue
+        if metric_value is None or not metric_value.Samples:
+            self._logger.debug('real time sample array "{} "has no samples, ignoring it',  # noqa: PLE1205
+                               realtime_sample_array_container.DescriptorHandle)
+            return
+        values = np.asarray(metric_value.Samples, dtype=np.float64)
+        timestamps = metric_value.DeterminationTime + np.arange(len(values)) * self.sample_period
+        self.add(values, timestamps)
+
+    def add(self, values: np.ndarray, timestamps: np.ndarray):
+        max_samples = self._max_samples
+        if len(values) > max_samples:
+            values = values[-max_samples:]
+            timestamps = timestamps[-max_samples:]
+        count = len(values)
+        with self._lock:
+            start = self._position
+            first = min(count, max_samples - start)  # samples until the end of the first half
+            for array, data in ((self._values, values), (self._timestamps, timestamps)):
+                array[start:start + first] = data[:first]
+                array[start + max_samples:start + max_samples + first] = data[:first]
+                array[:count - first] = data[first:]
+                array[max_samples:max_samples + count - first] = data[first:]
+            self._position = (start + count) % max_samples
+            self._count = min(self._count + count, max_samples)
+
+    def get_window(self, seconds: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return time stamps and values of the samples of the last seconds (all samples if seconds is None).
+
+        The arrays are read-only views of the buffer.
+        """
+        with self._lock:
+            end = self._position + self._max_samples
+            start = end - self._count
+            timestamps = self._timestamps[start:end]
+            values = self._values[start:end]
+        if seconds is not None and len(timestamps) > 0:
+            first = np.searchsorted(timestamps, timestamps[-1] - seconds, side='right')
+            timestamps = timestamps[first:]
+            values = values[first:]
+        timestamps = timestamps.view()
+        values = values.view()
+        timestamps.flags.writeable = False
+        values.flags.writeable = False
+        return timestamps, values
+
+    def clear(self):
+        with self._lock:
+            self._position = 0
+            self._count = 0
@@ -0,0 +1,101 @@
+import asyncio
+import traceback
+import unittest
+import uuid
+from decimal import Decimal
+
+from sdc11073.loghelper import basic_logging_setup
+from sdc11073.xml_types import msg_types, pm_qnames
+
+from pyprotosdc.actions import ReportAction
+from pyprotosdc.consumer.aioconsumer import AsyncGSdcConsumer
+from pyprotosdc.consumer.serviceclients.getservice import GetMdibResponseData
+from pyprotosdc.discovery.discoveryimpl import GDiscovery
+from tests.test_grpc_client_device import SomeProvider
+
+TIMEOUT = 5
+
+
+class TestAsyncConsumer(unittest.TestCase):
+    def setUp(self) -> None:
+        basic_logging_setup()
+        self.wsd = GDiscovery('127.0.0.1')
+        self.wsd.start()
+        self.sdc_provider = SomeProvider.from_mdib_file(self.wsd, uuid.uuid4().urn, 'mdib_two_mds.xml')
+        self.sdc_provider.start_all(startRealtimeSampleLoop=False)
+        host, port = self.sdc_provider._x_addr
+        self.address = f'{host}:{port}'
+
+    def tearDown(self) -> None:
+        try:
+            self.wsd.stop()
+        except:
+            print(traceback.format_exc())
+        try:
+            self.sdc_provider.stop_all()
+        except:
+            print(traceback.format_exc())
+
+    def _set_metric_value(self, handle: str, value: int):
+        with self.sdc_provider.mdib.metric_state_transaction() as tr:
+            state = tr.get_state(handle)
+            if state.MetricValue is None:
+                state.mk_metric_value()
+            state.MetricValue.Value = Decimal(value)
+
+    def test_get_mdib(self):
+        async def run():
+            async with AsyncGSdcConsumer(self.address) as consumer:
+                return await consumer.get_mdib()
+
+        response = asyncio.run(run())
+        self.assertIsInstance(response, GetMdibResponseData)
+        self.assertEqual(response.mdib_version_group.mdib_version, self.sdc_provider.mdib.mdib_version)
+        self.assertEqual(len(response.descriptors), len(self.sdc_provider.mdib.descriptions.objects))
+
+    def test_episodic_reports(self):
+        mdib = self.sdc_provider.mdib
+        metric_handle = mdib.descriptions.NODETYPE.get(pm_qnames.NumericMetricDescriptor)[0].Handle
+
+        async def read_reports(consumer, count):
+            ret = []
+            async for report in consumer.episodic_reports(filter=[ReportAction.EpisodicMetricReport]):
+                ret.append(report)
+                if len(ret) == count:
+                    break
+            return ret
+
+        async def run():
+            # one event loop drives the streams of several consumers
+            consumers = [AsyncGSdcConsumer(self.address) for _ in range(3)]
+            readers = [asyncio.create_task(read_reports(consumer, 2)) for consumer in consumers]
+            for _ in range(50):
+                if len(self.sdc_provider.subscriptions_manager._subscriptions.objects) == len(consumers):
+                    break
+                await asyncio.sleep(0.1)
+            for value in (1, 2):
+                await asyncio.to_thread(self._set_metric_value, metric_handle, value)
+            results = await asyncio.wait_for(asyncio.gather(*readers), TIMEOUT)
+            for consumer in consumers:
+                await consumer.close()
+            return results
+
+        results = asyncio.run(run())
+        for reports in results:
+            self.assertEqual([r.action for r in reports], [ReportAction.EpisodicMetricReport] * 2)
+            self.assertLess(reports[0].mdib_version_group.mdib_version, reports[1].mdib_version_group.mdib_version)
+        self.assertEqual(len(self.sdc_provider.subscriptions_manager._subscriptions.objects), 0)
+
+    def test_set_string(self):
+        op_handle = self.sdc_provider.mdib.descriptions.NODETYPE.get(pm_qnames.SetStringOperationDescriptor)[0].Handle
+
+        async def run():
+            async with AsyncGSdcConsumer(self.address) as consumer:
+                results = [await asyncio.wait_for(consumer.set_string(op_handle, 'MEZ'), TIMEOUT)]
+                results.append(await asyncio.wait_for(consumer.activate('invalid_handle', ['42']), TIMEOUT))
+                return results
+
+        result, failed = asyncio.run(run())
+        self.assertEqual(result.InvocationInfo.InvocationState, msg_types.InvocationState.FINISHED)
+        self.assertIsNone(result.InvocationInfo.InvocationError)
+        self.assertEqual(failed.InvocationInfo.InvocationState, msg_types.InvocationState.FAILED)
@@ -0,0 +1,42 @@
+import decimal
+import unittest
+from decimal import Decimal
+
+from org.somda.protosdc.proto.model.common import common_types_pb2
+
+from pyprotosdc.mapping import basic_mappers
+from pyprotosdc.mapping.basic_mappers import decimal_to_p, decimal_from_p, decimal_from_p_as_float
+
+
+class TestDecimalMappers(unittest.TestCase):
+    values = ['0', '1', '-1', '2.2', '-37.55', '0.000123', '120.50', '1E+2', '-1.5E+3',
+              '123456789.123456789', '0.0000000000000000000000001']
+
+    def test_decimal_roundtrip(self):
+        for text in self.values:
+            value = Decimal(text)
+            p = common_types_pb2.Decimal()
+            decimal_to_p(value, p)
+            self.assertGreaterEqual(p.scale, 0)
+            self.assertEqual(decimal_from_p(p), value, msg=text)
+            self.assertAlmostEqual(decimal_from_p_as_float(p), float(value), msg=text)
+
+    def test_decimal_to_p(self):
+        p = common_types_pb2.Decimal()
+        decimal_to_p(Decimal('-37.55'), p)
+        self.assertEqual((p.value, p.scale), (-3755, 2))
+        decimal_to_p(Decimal('1E+2'), p)
+        self.assertEqual((p.value, p.scale), (100, 0))
+
+    def test_unusual_scales(self):
+        # scales outside of the memo range are computed, but not memorized
+        for scale in (21, 30, 400):
+            p = common_types_pb2.Decimal(value=15, scale=scale)
+            self.assertEqual(decimal_from_p(p), Decimal(15).scaleb(-scale))
+            self.assertAlmostEqual(decimal_from_p_as_float(p), 15 * 10.0 ** -scale)
+        p = common_types_pb2.Decimal(value=15, scale=2 ** 32 - 1)
+        with self.assertRaises(decimal.InvalidOperation):  # beyond the exponent limit of the decimal context
+            decimal_from_p(p)
+        self.assertEqual(decimal_from_p_as_float(p), 0.0)
+        self.assertEqual(len(basic_mappers._decimal_divisors), 21)
+        self.assertEqual(len(basic_mappers._float_divisors), 21)
@@ -18,6 +18,8 @@ from sdc11073.xml_types import pm_types
 from sdc11073.xml_types import msg_types
 from sdc11073.mdib import descriptorcontainers, statecontainers
 from pyprotosdc.clientmdib import GClientMdibContainer
+from pyprotosdc.mapping import pmtypesmapper
+from pyprotosdc.rtbuffer import NumpyRtBuffer, np
 from sdc11073.roles.waveformprovider import waveforms
 from sdc11073.loghelper import basic_logging_setup
 
@@ -225,6 +227,30 @@ class TestClientSomeDeviceGRPC(unittest.TestCase):
         updated_metric_state = cl_mdib.states.descriptor_handle.get_one(rt_metric_handle)
         self.assertEqual(updated_metric_state.MetricValue.Samples[-1], Decimal('42'))
 
+    @unittest.skipIf(np is None, 'needs numpy')
+    def test_waveform_samples_as_floats(self):
+        self.sdc_consumer.subscribe_all()
+        cl_mdib = GClientMdibContainer(self.sdc_consumer)
+        cl_mdib.rt_buffer_cls = NumpyRtBuffer
+        cl_mdib.init_mdib()
+        rt_metric_handle = cl_mdib.descriptions.NODETYPE.get(pm_qnames.RealTimeSampleArrayMetricDescriptor)[0].Handle
+        coll = SingleValueCollector(cl_mdib, 'waveform_by_handle')
+        pmtypesmapper.realtime_samples_as_floats = True
+        try:
+            with self.sdc_provider.mdib.rt_sample_state_transaction() as tr:
+                rt_metric_state = tr.get_state(rt_metric_handle)
+                if not rt_metric_state.MetricValue:
+                    rt_metric_state.mk_metric_value()
+                rt_metric_state.MetricValue.Samples = [Decimal('1.5'), Decimal('-2.25'), Decimal('42')]
+            coll.result(timeout=NOTIFICATION_TIMEOUT)
+        finally:
+            pmtypesmapper.realtime_samples_as_floats = False
+        samples = cl_mdib.states.descriptor_handle.get_one(rt_metric_handle).MetricValue.Samples
+        self.assertEqual(samples, [1.5, -2.25, 42.0])
+        self.assertIsInstance(samples[0], float)
+        timestamps, values = cl_mdib.get_window(rt_metric_handle)
+        self.assertEqual(values.tolist(), [1.5, -2.25, 42.0])
+
     def test_alert_transaction(self):
         self.sdc_consumer.subscribe_all()
         cl_mdib = GClientMdibContainer(self.sdc_consumer)
@@ -359,8 +385,8 @@ class TestClientSomeDeviceGRPC(unittest.TestCase):
                                                              sco.operation_cls_getter)
 
 
-        sco.register_operation(op)
         self.sdc_provider.mdib.xtra.mk_state_containers_for_all_descriptors()
+        sco.register_operation(op)
 
         set_service = self.sdc_consumer.set_service
         consumer_mdib = GClientMdibContainer(self.sdc_consumer)
@@ -436,8 +462,8 @@ class TestClientSomeDeviceGRPC(unittest.TestCase):
         op = product.metric_provider.make_operation_instance(operation_descriptor_container,
                                                              sco.operation_cls_getter)
 
-        sco.register_operation(op)
         self.sdc_provider.mdib.xtra.mk_state_containers_for_all_descriptors()
+        sco.register_operation(op)
 
         cl_mdib = GClientMdibContainer(self.sdc_consumer)
         cl_mdib.init_mdib()
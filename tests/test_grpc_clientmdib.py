@@ -0,0 +1,99 @@
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sdc11073.definitions_sdc import SdcV1Definitions
+from sdc11073.mdib import statecontainers as sc
+from sdc11073.mdib.descriptorcontainers import NumericMetricDescriptorContainer
+from sdc11073.mdib.descriptorcontainers import RealTimeSampleArrayMetricDescriptorContainer
+from sdc11073.mdib.mdibbase import MdibVersionGroup
+
+from pyprotosdc.clientmdib import GClientMdibContainer
+from pyprotosdc.rtbuffer import NumpyRtBuffer, np
+
+
+class TestApplyStates(unittest.TestCase):
+    def setUp(self) -> None:
+        consumer = SimpleNamespace(sdc_definitions=SdcV1Definitions, log_prefix='', msg_reader=None)
+        self.mdib = GClientMdibContainer(consumer)
+        self.descriptors = [NumericMetricDescriptorContainer(f'metric_{i}', 'parent_handle') for i in range(300)]
+        self.mdib.add_description_containers(self.descriptors)
+        self.mdib.add_state_containers([self._mk_state(descr, 0, 0) for descr in self.descriptors[:-1]])
+
+    @staticmethod
+    def _mk_state(descr, value, state_version):
+        state = sc.NumericMetricStateContainer(descr)
+        state.mk_metric_value()
+        state.MetricValue.Value = Decimal(value)
+        state.StateVersion = state_version
+        return state
+
+    def test_apply_states(self):
+        report_states = [self._mk_state(descr, 1, 1) for descr in self.descriptors]
+        report_states[0].StateVersion = 0  # outdated
+        report_states[1].DescriptorVersion = 5  # descriptor version mismatch
+        with self.mdib.mdib_lock:
+            changed = self.mdib.apply_states(report_states, 'EpisodicMetricReport')
+        self.assertEqual(len(changed), 299)
+        self.assertNotIn('metric_0', changed)
+        states = self.mdib.states.descriptor_handle
+        self.assertEqual(states.get_one('metric_0').MetricValue.Value, Decimal(0))
+        self.assertEqual(states.get_one('metric_1').MetricValue.Value, Decimal(1))
+        self.assertIsNone(report_states[1].descriptor_container)
+        # updated states are the containers of the mdib, new states are added
+        self.assertIs(changed['metric_2'], states.get_one('metric_2'))
+        self.assertEqual(states.get_one('metric_2').StateVersion, 1)
+        self.assertIs(states.get_one('metric_299'), report_states[-1])
+        self.assertEqual(len(self.mdib.states.objects), 300)
+        self.assertEqual(len(self.mdib.states.NODETYPE.get(report_states[0].NODETYPE)), 300)
+
+
+@unittest.skipIf(np is None, 'needs numpy')
+class TestNumpyRtBuffer(unittest.TestCase):
+    def test_ring_buffer(self):
+        rt_buffer = NumpyRtBuffer(sample_period=0.01, max_samples=10)
+        timestamps, values = rt_buffer.get_window()
+        self.assertEqual(len(values), 0)
+        rt_buffer.add(np.arange(4, dtype=np.float64), np.arange(4) * 0.01)
+        timestamps, values = rt_buffer.get_window()
+        self.assertEqual(values.tolist(), [0, 1, 2, 3])
+        self.assertFalse(values.flags.writeable)
+        # wrap around
+        for start in range(4, 32, 7):
+            rt_buffer.add(np.arange(start, start + 7, dtype=np.float64), np.arange(start, start + 7) * 0.01)
+        self.assertEqual(len(rt_buffer), 10)
+        timestamps, values = rt_buffer.get_window()
+        self.assertEqual(values.tolist(), list(range(22, 32)))
+        np.testing.assert_allclose(timestamps, np.arange(22, 32) * 0.01)
+        self.assertTrue(np.shares_memory(values, rt_buffer._values))  # a view, not a copy
+        timestamps, values = rt_buffer.get_window(0.035)
+        self.assertEqual(values.tolist(), [28, 29, 30, 31])
+        # more samples than max_samples
+        rt_buffer.add(np.arange(100, 125, dtype=np.float64), np.arange(100, 125) * 0.01)
+        timestamps, values = rt_buffer.get_window()
+        self.assertEqual(values.tolist(), list(range(115, 125)))
+
+    def test_waveform_report(self):
+        consumer = SimpleNamespace(sdc_definitions=SdcV1Definitions, log_prefix='', msg_reader=None)
+        mdib = GClientMdibContainer(consumer, max_realtime_samples=50)
+        mdib.rt_buffer_cls = NumpyRtBuffer
+        descriptor = RealTimeSampleArrayMetricDescriptorContainer('rtsa', 'parent_handle')
+        descriptor.SamplePeriod = 0.01
+        mdib.add_description_containers([descriptor])
+        mdib.add_state_containers([sc.RealTimeSampleArrayMetricStateContainer(descriptor)])
+        for i in range(3):
+            state = sc.RealTimeSampleArrayMetricStateContainer(descriptor)
+            state.StateVersion = i + 1
+            state.mk_metric_value()
+            state.MetricValue.Samples = [Decimal(v) for v in range(i * 20, i * 20 + 20)]
+            state.MetricValue.DeterminationTime = 100 + i * 0.2
+            report = SimpleNamespace(states=[state], mdib_version_group=MdibVersionGroup(i + 1, 'seq', None))
+            mdib._on_waveform_report(report, False)
+        self.assertIsInstance(mdib.rt_buffers['rtsa'], NumpyRtBuffer)
+        timestamps, values = mdib.get_window('rtsa')
+        self.assertEqual(values.tolist(), list(range(10, 60)))
+        np.testing.assert_allclose(timestamps, 100 + np.arange(10, 60) * 0.01)
+        timestamps, values = mdib.get_window('rtsa', seconds=0.095)
+        self.assertEqual(values.tolist(), list(range(50, 60)))
+        self.assertIsNone(mdib.get_window('unknown'))
+        self.assertEqual(mdib.states.descriptor_handle.get_one('rtsa').StateVersion, 3)
@@ -1,23 +1,41 @@
 import logging
+import threading
+import time
 import traceback
 import unittest
 import uuid
+from decimal import Decimal
 from math import isclose
 
+import grpc
 from org.somda.protosdc.proto.model import sdc_messages_pb2
+from org.somda.protosdc.proto.model import sdc_services_pb2_grpc
+from org.somda.protosdc.proto.model.biceps.abstractstateoneof_pb2 import AbstractStateOneOfMsg
 from org.somda.protosdc.proto.model.biceps.handleref_pb2 import HandleRefMsg
 from sdc11073 import loghelper
+from sdc11073 import observableproperties as properties
 from sdc11073.definitions_sdc import SdcV1Definitions
 from sdc11073.loghelper import basic_logging_setup
 from sdc11073.mdib.mdibbase import MdibBase
-from sdc11073.xml_types import pm_types
+from sdc11073.xml_types import pm_types, pm_qnames
 
+from pyprotosdc.actions import ReportAction
+from pyprotosdc.consumer.consumer import GSdcConsumer
+from pyprotosdc.consumer.serviceclients.mdibreportingservice import MdibReportingServiceWrapper
 from pyprotosdc.discovery.discoveryimpl import GDiscovery
-from pyprotosdc.mapping.mapping_helpers import attr_name_to_p
+from pyprotosdc.mapping.mapping_helpers import attr_name_to_p, get_p_attr
 from pyprotosdc.msgreader import MessageReader
+from pyprotosdc.provider.aioprovider import AioGSdcProvider
+from pyprotosdc.provider.fragmentcache import FragmentCache
+from pyprotosdc.provider.reporthistory import ReportHistory
+from pyprotosdc.provider.services.getservice import GetService, VersionedResponseCache
 from tests.test_grpc_client_device import SomeProvider
 
 
+class SomeAioProvider(AioGSdcProvider, SomeProvider):
+    pass
+
+
 def diff(a: pm_types.PropertyBasedPMType, b: pm_types.PropertyBasedPMType) -> dict:
     ret = {}
     for name, dummy in a.sorted_container_properties():
@@ -167,6 +185,343 @@ class TestSomeDeviceGRPC(unittest.TestCase):
         self.assertTrue(handles[0] in read_state_handles)
         self.assertTrue(handles[1] in read_state_handles)
 
+    def test_get_mdib_cache(self):
+        get_service = self.sdc_device.get_service
+        mdib = self.sdc_device.mdib
+        data = get_service.get_mdib_serialized(None, None)
+        self.assertEqual(data, get_service.get_mdib_serialized(None, None))
+        self.assertEqual(get_service.mdib_cache.builds, 1)
+        self.assertEqual(get_service.mdib_cache.hits, 1)
+        response = sdc_messages_pb2.GetMdibResponse.FromString(data)
+        self.assertEqual(response, get_service.GetMdib(None, None))
+        metric_handle = mdib.descriptions.NODETYPE.get(pm_qnames.NumericMetricDescriptor)[0].Handle
+        with mdib.metric_state_transaction() as tr:
+            state = tr.get_state(metric_handle)
+            if state.MetricValue is None:
+                state.mk_metric_value()
+            state.MetricValue.Value = Decimal(42)
+        response = sdc_messages_pb2.GetMdibResponse.FromString(get_service.get_mdib_serialized(None, None))
+        self.assertEqual(get_service.mdib_cache.builds, 2)
+        mdib_version_group_msg = get_p_attr(response.payload.mdib, 'MdibVersionGroup')
+        self.assertEqual(get_p_attr(mdib_version_group_msg, 'MdibVersion').unsigned_long, mdib.mdib_version)
+
+    def test_get_mdib_cache_single_flight(self):
+        get_service = self.sdc_device.get_service
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_service.get_mdib_serialized(None, None)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(get_service.mdib_cache.builds, 1)
+
+    def test_default_config_accepts_more_than_four_consumers(self):
+        host, port = self.sdc_device._x_addr
+        consumers = [GSdcConsumer(f'{host}:{port}') for _ in range(6)]
+        try:
+            for consumer in consumers:
+                consumer.subscribe_all()
+            for _ in range(50):
+                if len(self.sdc_device.subscriptions_manager._subscriptions.objects) == 12:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(self.sdc_device.subscriptions_manager._subscriptions.objects), 12)
+            for consumer in consumers:
+                self.assertEqual(consumer.get_service.get_mdib().mdib_version_group.sequence_id,
+                                 self.sdc_device.mdib.sequence_id)
+            received = []
+            on_report = received.append  # observables keep only weak references to the observers
+            properties.bind(consumers[-1], episodic_metric_report=on_report)
+            mdib_version = self._set_metric_value(1)
+            for _ in range(20):
+                if received:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(received[0].mdib_version_group.mdib_version, mdib_version)
+        finally:
+            for consumer in consumers:
+                consumer.channel.close()
+
+    def test_cache_refuses_stale_build(self):
+        cache = VersionedResponseCache()
+        key = ('seq', 1)
+        generation = cache.generation  # read together with key
+
+        def build():
+            cache.invalidate()  # a transaction while the response is built
+            return b'old'
+
+        self.assertEqual(cache.get(key, build, generation), b'old')
+        self.assertEqual(cache.get(key, lambda: b'new'), b'new')  # b'old' was not stored
+        self.assertEqual(cache.get(key, lambda: b'other'), b'new')
+        self.assertEqual(cache.builds, 2)
+
+    def test_get_md_description_cache(self):
+        get_service = self.sdc_device.get_service
+        mdib = self.sdc_device.mdib
+        data = get_service.get_md_description_serialized(None, None)
+        response = sdc_messages_pb2.GetMdDescriptionResponse.FromString(data)
+        self.assertEqual(response, get_service.GetMdDescription(None, None))
+        metric_handle = mdib.descriptions.NODETYPE.get(pm_qnames.NumericMetricDescriptor)[0].Handle
+        with mdib.metric_state_transaction() as tr:
+            state = tr.get_state(metric_handle)
+            if state.MetricValue is None:
+                state.mk_metric_value()
+            state.MetricValue.Value = Decimal(42)
+        # a state change does not change the description, but the mdib version in the header
+        response = sdc_messages_pb2.GetMdDescriptionResponse.FromString(
+            get_service.get_md_description_serialized(None, None))
+        self.assertEqual(get_service.md_description_cache.builds, 1)
+        self.assertEqual(response, get_service.GetMdDescription(None, None))
+        with mdib.descriptor_transaction() as tr:
+            descriptor = tr.get_descriptor(metric_handle)
+            descriptor.DeterminationPeriod = 42
+        response = sdc_messages_pb2.GetMdDescriptionResponse.FromString(
+            get_service.get_md_description_serialized(None, None))
+        self.assertEqual(get_service.md_description_cache.builds, 2)
+        self.assertEqual(response, get_service.GetMdDescription(None, None))
+
+    def test_fragment_cache(self):
+        mdib = self.sdc_device.mdib
+        fragment_cache = self.sdc_device.fragment_cache
+        uncached_service = GetService(mdib)
+        self.assertEqual(self.sdc_device.get_service.GetMdib(None, None), uncached_service.GetMdib(None, None))
+        misses = fragment_cache.misses
+        self.assertEqual(self.sdc_device.get_service.GetMdib(None, None), uncached_service.GetMdib(None, None))
+        self.assertEqual(fragment_cache.misses, misses)
+        self.assertGreater(fragment_cache.hits, 0)
+        # a changed state and descriptor are mapped again, reports and Get responses use the new version
+        subscription = self.sdc_device.subscriptions_manager.on_subscribe_request(
+            [ReportAction.EpisodicMetricReport.value])
+        metric_handle = mdib.descriptions.NODETYPE.get(pm_qnames.NumericMetricDescriptor)[0].Handle
+        with mdib.metric_state_transaction() as tr:
+            state = tr.get_state(metric_handle)
+            if state.MetricValue is None:
+                state.mk_metric_value()
+            state.MetricValue.Value = Decimal(42)
+        with mdib.descriptor_transaction() as tr:
+            descriptor = tr.get_descriptor(metric_handle)
+            descriptor.DeterminationPeriod = 42
+        report = subscription.reports.get(timeout=1)
+        p_state = report.message.report.metric.abstract_metric_report.report_part[0].metric_state[0]
+        self.assertEqual(MessageReader.read_states([p_state], None)[0].MetricValue.Value, Decimal(42))
+        self.assertEqual(self.sdc_device.get_service.GetMdib(None, None), uncached_service.GetMdib(None, None))
+        # only the changed descriptor and state are mapped again (for the report and for GetMdib)
+        self.assertLessEqual(fragment_cache.misses - misses, 4)
+
+    def test_fragment_cache_threads(self):
+        # Get requests and report threads map states while a transaction removes fragments
+        fragment_cache = FragmentCache()
+        states = [state for state in self.sdc_device.mdib.states.objects
+                  if not state.is_realtime_sample_array_metric_state]
+        handles = [state.DescriptorHandle for state in states]
+        errors = []
+        stop = threading.Event()
+
+        def map_states():
+            try:
+                while not stop.is_set():
+                    for state in states:
+                        fragment_cache.state_to_p(state, AbstractStateOneOfMsg())
+            except Exception as ex:
+                errors.append(ex)
+
+        def remove_states():
+            try:
+                while not stop.is_set():
+                    fragment_cache.remove(handles)
+                    fragment_cache.clear()
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=map_states) for _ in range(2)]
+        threads.append(threading.Thread(target=remove_states))
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        for state in states:
+            self.assertEqual(fragment_cache.state_to_p(state, AbstractStateOneOfMsg()),
+                             FragmentCache(enabled=False).state_to_p(state, AbstractStateOneOfMsg()))
+
+    def test_new_sequence_id_clears_caches(self):
+        self.sdc_device.stop_realtime_sample_loop()  # the mdib must not change between the compared GetMdib calls
+        mdib = self.sdc_device.mdib
+        fragment_cache = self.sdc_device.fragment_cache
+        get_service = self.sdc_device.get_service
+        get_service.get_mdib_serialized(None, None)
+        get_service.get_md_description_serialized(None, None)
+        generations = get_service.mdib_cache.generation, get_service.md_description_cache.generation
+        mdib.sequence_id = uuid.uuid4().urn
+        self.assertGreater(get_service.mdib_cache.generation, generations[0])
+        self.assertGreater(get_service.md_description_cache.generation, generations[1])
+        misses = fragment_cache.misses
+        response = sdc_messages_pb2.GetMdibResponse.FromString(get_service.get_mdib_serialized(None, None))
+        self.assertGreater(fragment_cache.misses, misses)  # all fragments are mapped again
+        self.assertEqual(response, GetService(mdib).GetMdib(None, None))
+        mdib_version_group_msg = get_p_attr(response.payload.mdib, 'MdibVersionGroup')
+        self.assertEqual(get_p_attr(mdib_version_group_msg, 'SequenceId'), mdib.sequence_id)
+
+    def test_waveform_batch_interval_metadata(self):
+        host, port = self.sdc_device._x_addr
+        with grpc.insecure_channel(f'{host}:{port}') as channel:
+            reporting_stub = sdc_services_pb2_grpc.MdibReportingServiceStub(channel)
+            stream = reporting_stub.EpisodicReport(sdc_messages_pb2.EpisodicReportRequest(),
+                                                   metadata=(('waveform-batch-interval-ms', '50'),))
+            for _ in range(20):
+                subscriptions = list(self.sdc_device.subscriptions_manager._subscriptions.objects)
+                if subscriptions and subscriptions[0].waveform_batch_interval:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(subscriptions[0].waveform_batch_interval, 0.05)
+            stream.cancel()
+
+    def test_malformed_metadata(self):
+        host, port = self.sdc_device._x_addr
+        with grpc.insecure_channel(f'{host}:{port}') as channel:
+            reporting_stub = sdc_services_pb2_grpc.MdibReportingServiceStub(channel)
+            malformed = [(('waveform-batch-interval-ms', value),) for value in ('abc', 'inf', 'nan', '-1', '1e300')]
+            resume = (('resume-sequence-id', self.sdc_device.mdib.sequence_id), ('resume-mdib-version', '1'))
+            malformed.append(resume[:1] + (('resume-mdib-version', 'x'),))
+            malformed.append(resume + (('resume-action-mdib-version', ReportAction.EpisodicMetricReport.value),))
+            malformed.append(resume + (('resume-action-mdib-version',
+                                        f'{ReportAction.EpisodicMetricReport.value}=x'),))
+            for metadata in malformed:
+                stream = reporting_stub.EpisodicReport(sdc_messages_pb2.EpisodicReportRequest(), metadata=metadata)
+                with self.assertRaises(grpc.RpcError) as cm:
+                    next(stream)
+                self.assertEqual(cm.exception.code(), grpc.StatusCode.INVALID_ARGUMENT, metadata)
+        self.assertEqual(len(self.sdc_device.subscriptions_manager._subscriptions.objects), 0)
+
+    def test_skip_unrequested_reports(self):
+        mdib = self.sdc_device.mdib
+        subscription = self.sdc_device.subscriptions_manager.on_subscribe_request(
+            [ReportAction.EpisodicMetricReport.value])
+        metric_handle = mdib.descriptions.NODETYPE.get(pm_qnames.NumericMetricDescriptor)[0].Handle
+        alert_handle = mdib.descriptions.NODETYPE.get(pm_qnames.AlertConditionDescriptor)[0].Handle
+        with mdib.metric_state_transaction() as tr:
+            state = tr.get_state(metric_handle)
+            if state.MetricValue is None:
+                state.mk_metric_value()
+            state.MetricValue.Value = Decimal(42)
+        with mdib.alert_state_transaction() as tr:
+            state = tr.get_state(alert_handle)
+            state.Presence = not state.Presence
+        self.assertEqual(subscription.reports.get(timeout=1).addressing.action,
+                         ReportAction.EpisodicMetricReport.value)
+        self.assertEqual(self.sdc_device.skipped_reports[ReportAction.EpisodicMetricReport], 0)
+        self.assertEqual(self.sdc_device.skipped_reports[ReportAction.EpisodicAlertReport], 1)
+        self.assertGreater(self.sdc_device.skipped_report_entries[ReportAction.EpisodicAlertReport], 0)
+
+    def test_streams_do_not_starve_unary_calls(self):
+        self.sdc_device.subscriptions_manager.max_subscriptions = 1
+        host, port = self.sdc_device._x_addr
+        with grpc.insecure_channel(f'{host}:{port}') as channel:
+            reporting_stub = sdc_services_pb2_grpc.MdibReportingServiceStub(channel)
+            get_stub = sdc_services_pb2_grpc.GetServiceStub(channel)
+            stream_1 = reporting_stub.EpisodicReport(sdc_messages_pb2.EpisodicReportRequest())
+            for _ in range(20):
+                if len(self.sdc_device.subscriptions_manager._subscriptions.objects) == 1:
+                    break
+                time.sleep(0.1)
+            stream_2 = reporting_stub.EpisodicReport(sdc_messages_pb2.EpisodicReportRequest())
+            with self.assertRaises(grpc.RpcError) as ctx:
+                next(stream_2)
+            self.assertEqual(ctx.exception.code(), grpc.StatusCode.RESOURCE_EXHAUSTED)
+            response = get_stub.GetMdib(sdc_messages_pb2.GetMdibRequest(), timeout=5)
+            self.assertIsInstance(response, sdc_messages_pb2.GetMdibResponse)
+            stream_1.cancel()  # ends the subscription on provider side
+            for _ in range(20):
+                if len(self.sdc_device.subscriptions_manager._subscriptions.objects) == 0:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(self.sdc_device.subscriptions_manager._subscriptions.objects), 0)
+
+    def _set_metric_value(self, value) -> int:
+        mdib = self.sdc_device.mdib
+        metric_handle = mdib.descriptions.NODETYPE.get(pm_qnames.NumericMetricDescriptor)[0].Handle
+        with mdib.metric_state_transaction() as tr:
+            state = tr.get_state(metric_handle)
+            if state.MetricValue is None:
+                state.mk_metric_value()
+            state.MetricValue.Value = Decimal(value)
+        return mdib.mdib_version
+
+    def test_consumer_resumes_broken_subscription(self):
+        subscriptions_manager = self.sdc_device.subscriptions_manager
+        subscriptions_manager.report_history = ReportHistory()
+        host, port = self.sdc_device._x_addr
+        with grpc.insecure_channel(f'{host}:{port}') as channel:
+            wrapper = MdibReportingServiceWrapper(channel, MessageReader(logging.getLogger('unittest')))
+            wrapper.reconnect_delay = 0.2
+            received = []
+            resumed = []
+            # observables keep only weak references to the observers
+            on_report, on_resumed = received.append, resumed.append
+            properties.bind(wrapper, episodic_report=on_report)
+            properties.bind(wrapper, episodic_report_resumed=on_resumed)
+            wrapper.EpisodicReport()
+            for _ in range(20):
+                subscriptions = list(subscriptions_manager._subscriptions.objects)
+                if subscriptions:
+                    break
+                time.sleep(0.1)
+            expected_versions = [self._set_metric_value(1)]
+            for _ in range(20):
+                if received:
+                    break
+                time.sleep(0.1)
+            # the provider ends the stream, the reports in the meantime are recorded in the history
+            subscriptions[0].end_reason = 'test'
+            subscriptions[0].close()
+            for _ in range(20):
+                if not subscriptions_manager._subscriptions.objects:
+                    break
+                time.sleep(0.05)
+            expected_versions.append(self._set_metric_value(2))
+            expected_versions.append(self._set_metric_value(3))
+            for _ in range(50):
+                metric_versions = [r.mdib_version_group.mdib_version for r in received
+                                   if r.action == ReportAction.EpisodicMetricReport]
+                if len(metric_versions) >= 3:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(resumed, [True])
+            self.assertEqual(metric_versions, expected_versions)
+
+    def test_consumer_decode_pipeline(self):
+        host, port = self.sdc_device._x_addr
+        with grpc.insecure_channel(f'{host}:{port}') as channel:
+            wrapper = MdibReportingServiceWrapper(channel, MessageReader(logging.getLogger('unittest')))
+            wrapper.decode_workers = 4
+            received = []
+            on_report = received.append  # observables keep only weak references to the observers
+            properties.bind(wrapper, episodic_report=on_report)
+            wrapper.EpisodicReport()
+            for _ in range(20):
+                if self.sdc_device.subscriptions_manager._subscriptions.objects:
+                    break
+                time.sleep(0.1)
+            expected_versions = [self._set_metric_value(i) for i in range(20)]
+            for _ in range(50):
+                metric_reports = [r for r in received if r.action == ReportAction.EpisodicMetricReport]
+                if len(metric_reports) >= len(expected_versions):
+                    break
+                time.sleep(0.1)
+            self.assertEqual([r.mdib_version_group.mdib_version for r in metric_reports], expected_versions)
+            # states are decoded by the pipeline, the mdib only sets the descriptor containers
+            self.assertEqual([int(r.states[0].MetricValue.Value) for r in metric_reports], list(range(20)))
+            stats = wrapper.get_pipeline_stats()
+            self.assertEqual(stats.received_reports, len(received))
+            self.assertEqual(stats.applied_reports, len(received))
+            self.assertEqual(stats.apply_queue_depth, 0)
+            self.assertEqual(stats.total.count, len(received))
+
     # def test_activate_valid_handle(self):
     #     reader = MessageReader(logger=logging.getLogger('unittest'))
     #     cl_mdib = MdibBase(SdcV1Definitions, loghelper.get_logger_adapter('sdc.client.mdib'))
@@ -200,3 +555,68 @@ class TestSomeDeviceGRPC(unittest.TestCase):
     #     self.assertEqual(invocation_info.invocation_error.enum_type, invocation_info.invocation_error.INV)
     #     self.assertGreater(len(invocation_info.invocation_error_message), 0)
     #
+
+
+class TestAioProvider(unittest.TestCase):
+    def setUp(self) -> None:
+        basic_logging_setup()
+        self.wsd = GDiscovery('127.0.0.1')
+        self.wsd.start()
+        self.sdc_device = SomeAioProvider.from_mdib_file(self.wsd, uuid.uuid4().urn, 'mdib_two_mds.xml')
+        self.sdc_device.start_all(startRealtimeSampleLoop=False)
+
+    def tearDown(self) -> None:
+        try:
+            self.wsd.stop()
+        except:
+            print(traceback.format_exc())
+        try:
+            self.sdc_device.stop_all()
+        except:
+            print(traceback.format_exc())
+
+    def _wait_for_subscriptions(self, count: int):
+        for _ in range(50):
+            if len(self.sdc_device.subscriptions_manager._subscriptions.objects) == count:
+                break
+            time.sleep(0.1)
+        self.assertEqual(len(self.sdc_device.subscriptions_manager._subscriptions.objects), count)
+
+    def test_episodic_report_streams(self):
+        mdib = self.sdc_device.mdib
+        metric_handle = mdib.descriptions.NODETYPE.get(pm_qnames.NumericMetricDescriptor)[0].Handle
+        host, port = self.sdc_device._x_addr
+        request = sdc_messages_pb2.EpisodicReportRequest()
+        request.filter.action_filter.action.append(ReportAction.EpisodicMetricReport.value)
+        with grpc.insecure_channel(f'{host}:{port}') as channel:
+            reporting_stub = sdc_services_pb2_grpc.MdibReportingServiceStub(channel)
+            get_stub = sdc_services_pb2_grpc.GetServiceStub(channel)
+            # more streams than threads in the server pool
+            streams = [reporting_stub.EpisodicReport(request) for _ in range(self.sdc_device._max_workers + 2)]
+            self._wait_for_subscriptions(len(streams))
+            response = get_stub.GetMdib(sdc_messages_pb2.GetMdibRequest(), timeout=5)
+            self.assertIsInstance(response, sdc_messages_pb2.GetMdibResponse)
+            with mdib.metric_state_transaction() as tr:  # committed in this thread, not in the event loop
+                state = tr.get_state(metric_handle)
+                if state.MetricValue is None:
+                    state.mk_metric_value()
+                state.MetricValue.Value = Decimal(42)
+            for stream in streams:
+                report = next(stream)
+                self.assertEqual(report.addressing.action, ReportAction.EpisodicMetricReport.value)
+            for stream in streams:
+                stream.cancel()
+            self._wait_for_subscriptions(0)
+
+    def test_malformed_metadata(self):
+        host, port = self.sdc_device._x_addr
+        with grpc.insecure_channel(f'{host}:{port}') as channel:
+            reporting_stub = sdc_services_pb2_grpc.MdibReportingServiceStub(channel)
+            for metadata in ((('waveform-batch-interval-ms', 'abc'),),
+                             (('resume-sequence-id', self.sdc_device.mdib.sequence_id),
+                              ('resume-mdib-version', '1'), ('resume-action-mdib-version', 'x'))):
+                stream = reporting_stub.EpisodicReport(sdc_messages_pb2.EpisodicReportRequest(), metadata=metadata)
+                with self.assertRaises(grpc.RpcError) as cm:
+                    next(stream)
+                self.assertEqual(cm.exception.code(), grpc.StatusCode.INVALID_ARGUMENT, metadata)
+        self._wait_for_subscriptions(0)
@@ -1,3 +1,4 @@
+import array
 import unittest
 import logging
 from math import isclose
@@ -5,6 +6,7 @@ from decimal import Decimal
 from sdc11073.xml_types import pm_types
 from sdc11073.namespaces import default_ns_helper as nsh
 from sdc11073.loghelper import basic_logging_setup
+from org.somda.protosdc.proto.model.biceps.realtimevaluetype_pb2 import RealTimeValueTypeMsg
 from pyprotosdc.mapping import pmtypesmapper, generic
 
 
@@ -145,6 +147,19 @@ class TestPmtypesMapper(unittest.TestCase):
         for obj in [s_max, s_min]:
             self.check_convert(obj)
 
+    def test_realtime_array_float_samples(self):
+        samples = array.array('d', [1.0, -2.25, 0.000001, 1234.5])
+        p = RealTimeValueTypeMsg()
+        pmtypesmapper.realtime_array_to_p(samples, p)
+        self.assertEqual([(d.value, d.scale) for d in p.decimal],
+                         [(1000000, 6), (-2250000, 6), (1, 6), (1234500000, 6)])
+        self.assertEqual(list(pmtypesmapper.realtime_array_from_p_as_floats(p)), list(samples))
+        # Decimals and floats give the same result
+        p_decimals = RealTimeValueTypeMsg()
+        pmtypesmapper.realtime_array_to_p([Decimal('1'), Decimal('-2.25')], p_decimals)
+        self.assertEqual(list(pmtypesmapper.realtime_array_from_p_as_floats(p_decimals)), [1.0, -2.25])
+        self.assertEqual(pmtypesmapper.realtime_samples_from_p(p_decimals), [Decimal('1'), Decimal('-2.25')])
+
     def test_cause_info(self):
         ci_max = pm_types.CauseInfo(pm_types.RemedyInfo([pm_types.LocalizedText('rembla')]),
                                    [pm_types.LocalizedText('caubla',
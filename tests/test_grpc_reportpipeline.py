@@ -0,0 +1,65 @@
+import threading
+import time
+import unittest
+
+from pyprotosdc.consumer.reportpipeline import ReportPipeline
+
+
+class TestReportPipeline(unittest.TestCase):
+    def test_apply_in_order(self):
+        applied = []
+        decoder_threads = set()
+
+        def decode(value):
+            decoder_threads.add(threading.current_thread().name)
+            time.sleep(0.001 * (value % 4))  # later reports are decoded first
+            return value * 10
+
+        pipeline = ReportPipeline(decode, applied.append, decode_workers=4)
+        for value in range(40):
+            pipeline.put(value)
+        pipeline.join()
+        self.assertEqual(applied, [value * 10 for value in range(40)])
+        self.assertGreater(len(decoder_threads), 1)
+        stats = pipeline.get_stats()
+        self.assertEqual(stats.received_reports, 40)
+        self.assertEqual(stats.applied_reports, 40)
+        self.assertEqual(stats.decode_queue_depth, 0)
+        self.assertEqual(stats.apply_queue_depth, 0)
+        self.assertEqual(stats.decode.count, 40)
+        self.assertGreaterEqual(stats.total.max, stats.decode.max)
+        pipeline.stop()
+
+    def test_decode_error(self):
+        applied = []
+
+        def decode(value):
+            if value == 1:
+                raise ValueError('cannot decode')
+            return value
+
+        pipeline = ReportPipeline(decode, applied.append, decode_workers=2)
+        for value in range(3):
+            pipeline.put(value)
+        pipeline.stop()  # applies the received reports
+        self.assertEqual(applied, [0, 2])
+        self.assertEqual(pipeline.get_stats().applied_reports, 2)
+
+    def test_back_pressure(self):
+        release = threading.Event()
+        applied = []
+
+        def apply(value):
+            release.wait()
+            applied.append(value)
+
+        pipeline = ReportPipeline(lambda v: v, apply, decode_workers=2, max_pending=2)
+        put_thread = threading.Thread(target=lambda: [pipeline.put(v) for v in range(5)])
+        put_thread.start()
+        time.sleep(0.2)
+        self.assertTrue(put_thread.is_alive())  # the reader is blocked
+        self.assertEqual(pipeline.get_stats().apply_queue_depth, 2)
+        release.set()
+        put_thread.join(timeout=2)
+        pipeline.stop()
+        self.assertEqual(applied, list(range(5)))
@@ -0,0 +1,140 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from sdc11073.mdib.mdibbase import MdibVersionGroup
+from sdc11073.xml_types import msg_types
+
+from pyprotosdc.provider.sco import (_OperationsExecutor,
+                                     OperationQueueFullError,
+                                     RejectionPolicy)
+
+
+class _SubscriptionsManager:
+    def __init__(self):
+        self.reports = []  # (transaction_id, invocation_state)
+        self._lock = threading.Lock()
+
+    def send_operation_invoked_report(self, operation, transaction_id, invocation_state, mdib_version_group,
+                                      operation_target=None, error=None, error_message=None):
+        with self._lock:
+            self.reports.append((transaction_id, invocation_state))
+
+
+class _Operation:
+    """Records the start and end of every execution."""
+
+    def __init__(self, handle, target, duration, log, release: threading.Event | None = None):
+        self.handle = handle
+        self.operation_target_handle = target
+        self._duration = duration
+        self._log = log
+        self._release = release
+
+    def execute_operation(self, request, operation_request):
+        self._log.append(('start', self.operation_target_handle, operation_request.argument))
+        if self._release is not None:
+            self._release.wait()
+        time.sleep(self._duration)
+        self._log.append(('end', self.operation_target_handle, operation_request.argument))
+        return SimpleNamespace(invocation_state=msg_types.InvocationState.FINISHED,
+                               operation_target_handle=self.operation_target_handle)
+
+
+class TestOperationsExecutor(unittest.TestCase):
+    def setUp(self):
+        self.subscriptions_manager = _SubscriptionsManager()
+        self.registry = SimpleNamespace(check_invocation_timeouts=lambda: None)
+        self.mdib = SimpleNamespace(mdib_version_group=MdibVersionGroup(1, 'urn:uuid:abc', None))
+        self.executor = None
+
+    def tearDown(self):
+        if self.executor is not None:
+            self.executor.stop()
+
+    def _mk_executor(self, **kwargs):
+        self.executor = _OperationsExecutor(self.registry, self.subscriptions_manager, self.mdib, '', **kwargs)
+        self.executor.start()
+        return self.executor
+
+    def _wait_until_executed(self, count):
+        for _ in range(100):
+            if self.executor.executed_operations == count:
+                return
+            time.sleep(0.02)
+        self.fail(f'only {self.executor.executed_operations} of {count} operations executed')
+
+    def test_per_target_ordering(self):
+        executor = self._mk_executor(workers_count=4, max_queue_size=100)
+        log = []
+        operations = [_Operation(f'op_{target}', target, 0.001, log) for target in ('a', 'b', 'c')]
+        transaction_id = 0
+        for i in range(10):
+            for operation in operations:
+                transaction_id += 1
+                executor.enqueue_operation(operation, None, SimpleNamespace(argument=i), transaction_id)
+        self._wait_until_executed(30)
+        for target in ('a', 'b', 'c'):
+            entries = [(kind, arg) for kind, t, arg in log if t == target]
+            # never two operations of one target at the same time, in order of the requests
+            expected = [(kind, i) for i in range(10) for kind in ('start', 'end')]
+            self.assertEqual(entries, expected)
+        self.assertEqual(len(self.subscriptions_manager.reports), 90)  # WAIT, START and FINISHED
+        stats = executor.get_stats()
+        self.assertEqual(stats.executed_operations, 30)
+        self.assertEqual(stats.queue_depth, 0)
+        self.assertGreater(stats.queue_high_water_mark, 0)
+        self.assertGreater(stats.execution_time_max, 0)
+
+    def test_independent_targets_in_parallel(self):
+        executor = self._mk_executor(workers_count=2)
+        log = []
+        release = threading.Event()
+        executor.enqueue_operation(_Operation('op_a', 'a', 0, log, release), None, SimpleNamespace(argument=1), 1)
+        executor.enqueue_operation(_Operation('op_b', 'b', 0, log, release), None, SimpleNamespace(argument=2), 2)
+        for _ in range(100):
+            if len(log) == 2:
+                break
+            time.sleep(0.01)
+        # both started, although none of them is finished
+        self.assertEqual(sorted(entry[1] for entry in log), ['a', 'b'])
+        release.set()
+        self._wait_until_executed(2)
+
+    def test_reject_policy(self):
+        executor = self._mk_executor(workers_count=1, max_queue_size=2, rejection_policy=RejectionPolicy.REJECT)
+        log = []
+        release = threading.Event()
+        operation = _Operation('op_a', 'a', 0, log, release)
+        executor.enqueue_operation(operation, None, SimpleNamespace(argument=0), 1)
+        for _ in range(100):  # wait until the worker executes the first operation, then the queue is empty
+            if log:
+                break
+            time.sleep(0.01)
+        executor.enqueue_operation(operation, None, SimpleNamespace(argument=1), 2)
+        executor.enqueue_operation(operation, None, SimpleNamespace(argument=2), 3)
+        with self.assertRaises(OperationQueueFullError):
+            executor.enqueue_operation(operation, None, SimpleNamespace(argument=3), 4)
+        self.assertEqual(executor.rejected_operations, 1)
+        release.set()
+        self._wait_until_executed(3)
+
+    def test_block_policy_times_out(self):
+        executor = self._mk_executor(workers_count=1, max_queue_size=1)
+        executor.enqueue_timeout = 0.1
+        log = []
+        release = threading.Event()
+        operation = _Operation('op_a', 'a', 0, log, release)
+        executor.enqueue_operation(operation, None, SimpleNamespace(argument=0), 1)
+        for _ in range(100):
+            if log:
+                break
+            time.sleep(0.01)
+        executor.enqueue_operation(operation, None, SimpleNamespace(argument=1), 2)
+        start = time.monotonic()
+        with self.assertRaises(OperationQueueFullError):
+            executor.enqueue_operation(operation, None, SimpleNamespace(argument=2), 3)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        release.set()
+        self._wait_until_executed(2)
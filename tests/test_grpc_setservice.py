@@ -0,0 +1,75 @@
+import random
+import threading
+import time
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from org.somda.protosdc.proto.model import sdc_messages_pb2
+from sdc11073.mdib.mdibbase import MdibVersionGroup
+from sdc11073.xml_types import msg_types
+
+from pyprotosdc.mapping.basic_mappers import decimal_from_p, decimal_to_p, enum_from_p
+from pyprotosdc.provider.services.setservice import SetService
+
+
+class _Operation:
+    handle = 'op_handle'
+
+
+class _Mdib:
+    mdib_version_group = MdibVersionGroup(1, 'urn:uuid:abc', None)
+
+
+class _Provider:
+    """Only what SetService needs. The invocation state depends on the transaction id."""
+
+    def __init__(self):
+        self.mdib = _Mdib()
+        self._transaction_id = 0
+        self._lock = threading.Lock()
+        self.requested_values = {}  # key is the transaction id
+
+    def generate_transaction_id(self) -> int:
+        with self._lock:
+            self._transaction_id += 1
+            return self._transaction_id
+
+    def get_operation_by_handle(self, op_handle):
+        return _Operation() if op_handle == _Operation.handle else None
+
+    def handle_operation_request(self, operation, request, converted_request, transaction_id):
+        self.requested_values[transaction_id] = converted_request.RequestedNumericValue
+        time.sleep(random.random() / 1000)  # let the calls interleave
+        if transaction_id % 2:
+            return msg_types.InvocationState.WAIT
+        return msg_types.InvocationState.FAILED
+
+
+class TestSetService(unittest.TestCase):
+    def test_parallel_set_value(self):
+        provider = _Provider()
+        set_service = SetService(provider)
+
+        def set_value(value):
+            request = sdc_messages_pb2.SetValueRequest()
+            request.addressing.message_id = uuid.uuid4().urn
+            request.payload.abstract_set.operation_handle_ref.string = _Operation.handle
+            decimal_to_p(Decimal(value), request.payload.requested_numeric_value)
+            return request, set_service.SetValue(request, None)
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(set_value, range(500)))
+
+        transaction_ids = set()
+        for request, response in results:
+            self.assertEqual(response.addressing.relates_id.value, request.addressing.message_id)
+            invocation_info = response.payload.abstract_set_response.invocation_info
+            transaction_id = invocation_info.transaction_id.unsigned_int
+            transaction_ids.add(transaction_id)
+            self.assertEqual(provider.requested_values[transaction_id],
+                             decimal_from_p(request.payload.requested_numeric_value))
+            expected = msg_types.InvocationState.WAIT if transaction_id % 2 else msg_types.InvocationState.FAILED
+            self.assertEqual(enum_from_p(invocation_info, 'invocation_state', msg_types.InvocationState), expected)
+        self.assertEqual(len(transaction_ids), len(results))
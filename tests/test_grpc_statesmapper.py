@@ -7,6 +7,7 @@ from sdc11073.mdib import statecontainers as sc
 from sdc11073.mdib.descriptorcontainers import AbstractDescriptorContainer
 from sdc11073.loghelper import basic_logging_setup
 from pyprotosdc.mapping import statesmapper as sm
+from pyprotosdc.mapping import generic
 
 class TestStateMappers(unittest.TestCase):
     def setUp(self) -> None:
@@ -27,6 +28,19 @@ class TestStateMappers(unittest.TestCase):
 
         self.assertIsNone(obj.diff(obj2))
         self.assertEqual(obj.DescriptorVersion, self.descr.DescriptorVersion)
+        self.check_same_as_reflective(obj, obj_p)
+
+    def check_same_as_reflective(self, obj, obj_p):
+        """Compiled mapping plans must give the same result as the reflective mapping."""
+        generic.use_mapping_plans = False
+        try:
+            obj_p_reflective = sm.generic_state_to_p(obj, None)
+            obj2_reflective = sm.generic_state_from_p(obj_p, self.descr)
+        finally:
+            generic.use_mapping_plans = True
+        self.assertEqual(obj_p.SerializeToString(deterministic=True),
+                         obj_p_reflective.SerializeToString(deterministic=True))
+        self.assertIsNone(obj.diff(obj2_reflective))
 
     def test_set_value_operation_state(self):
         st_max = sc.SetValueOperationStateContainer(self.descr)
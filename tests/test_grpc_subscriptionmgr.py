@@ -0,0 +1,612 @@
+import asyncio
+import random
+import threading
+import time
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sdc11073.loghelper import basic_logging_setup
+from sdc11073.mdib import statecontainers as sc
+from sdc11073.mdib.descriptorcontainers import AlertConditionDescriptorContainer
+from sdc11073.mdib.descriptorcontainers import NumericMetricDescriptorContainer
+from sdc11073.mdib.descriptorcontainers import RealTimeSampleArrayMetricDescriptorContainer
+from sdc11073.mdib.mdibbase import MdibVersionGroup
+from sdc11073.xml_types.msg_types import InvocationState
+from org.somda.protosdc.proto.model.sdc_messages_pb2 import EpisodicReportStream
+
+from pyprotosdc.actions import ReportAction, OperationInvokedAction
+from pyprotosdc.mapping.basic_mappers import decimal_from_p, enum_from_p
+from pyprotosdc.mapping.mapping_helpers import get_p_attr
+from pyprotosdc.msgreader import MessageReader
+from pyprotosdc.consumer.serviceclients.mdibreportingservice import map_episodic_report
+from pyprotosdc.provider.subscriptionmgr import GSubscriptionsManager, SerializedReport, OverflowPolicy
+from pyprotosdc.provider.subscriptionmgr import AioGSubscriptionsManager, GDevSubscription, ReportPriority
+from pyprotosdc.provider.services.mdibreportingservice import serialize_episodic_report
+from pyprotosdc.provider.reportdispatcher import ReportDispatcher
+from pyprotosdc.provider.reporthistory import ReportHistory, ResumePoint
+
+
+class TestSubscriptionsManager(unittest.TestCase):
+    def setUp(self) -> None:
+        basic_logging_setup()
+        self.descr = NumericMetricDescriptorContainer('metric_handle', 'parent_handle')
+        self.mdib_version_group = MdibVersionGroup(42, 'urn:uuid:abc', 1)
+
+    def _mk_metric_state(self, value):
+        state = sc.NumericMetricStateContainer(self.descr)
+        state.mk_metric_value()
+        state.MetricValue.Value = Decimal(value)
+        return state
+
+    def test_serialize_once(self):
+        mgr = GSubscriptionsManager(None)
+        subscriptions = [mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value]) for _ in range(5)]
+        mgr.send_episodic_metric_report([self._mk_metric_state(1)], self.mdib_version_group)
+        reports = [s.reports.get_nowait() for s in subscriptions]
+        for report in reports:
+            self.assertIsInstance(report, SerializedReport)
+            self.assertIs(report.data, reports[0].data)  # bytes are shared, not serialized per subscriber
+        decoded = EpisodicReportStream.FromString(serialize_episodic_report(reports[0]))
+        self.assertEqual(decoded, reports[0].message)
+        self.assertEqual(decoded.addressing.action, ReportAction.EpisodicMetricReport.value)
+
+    def test_serialize_per_subscriber(self):
+        mgr = GSubscriptionsManager(None, serialize_once=False)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        mgr.send_episodic_metric_report([self._mk_metric_state(1)], self.mdib_version_group)
+        report = subscription.reports.get_nowait()
+        self.assertIsInstance(report, EpisodicReportStream)
+        self.assertEqual(serialize_episodic_report(report), report.SerializeToString())
+
+
+class TestSubscriptionOverflow(unittest.TestCase):
+    def setUp(self) -> None:
+        basic_logging_setup()
+        self.descriptors = {handle: NumericMetricDescriptorContainer(handle, 'parent_handle')
+                            for handle in ('a', 'b', 'c')}
+        self.mdib_version_group = MdibVersionGroup(42, 'urn:uuid:abc', 1)
+
+    def _send_metrics(self, mgr, values: dict):
+        states = []
+        for handle, value in values.items():
+            state = sc.NumericMetricStateContainer(self.descriptors[handle])
+            state.mk_metric_value()
+            state.MetricValue.Value = Decimal(value)
+            states.append(state)
+        mgr.send_episodic_metric_report(states, self.mdib_version_group)
+
+    @staticmethod
+    def _metric_values(report) -> dict:
+        if isinstance(report, SerializedReport):
+            report = report.message
+        ret = {}
+        for p_state in report.report.metric.abstract_metric_report.report_part[0].metric_state:
+            numeric = p_state.numeric_metric_state
+            handle = numeric.abstract_metric_state.abstract_state.descriptor_handle_attr.string
+            ret[handle] = int(decimal_from_p(numeric.metric_value.value_attr))
+        return ret
+
+    def test_drop_oldest(self):
+        mgr = GSubscriptionsManager(None, max_queue_size=3, overflow_policy=OverflowPolicy.DROP_OLDEST)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        for i in range(5):
+            self._send_metrics(mgr, {'a': i})  # does not block
+        self.assertEqual(subscription.dropped_reports, 2)
+        self.assertEqual(subscription.queue_high_water_mark, 3)
+        values = [self._metric_values(subscription.reports.get_nowait())['a'] for _ in range(3)]
+        self.assertEqual(values, [2, 3, 4])
+        self.assertTrue(subscription.reports.empty())
+
+    def test_coalesce(self):
+        mgr = GSubscriptionsManager(None, max_queue_size=2, overflow_policy=OverflowPolicy.COALESCE)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        self._send_metrics(mgr, {'a': 1, 'c': 1})
+        self._send_metrics(mgr, {'a': 2, 'b': 2})
+        self._send_metrics(mgr, {'a': 3})
+        self.assertEqual(subscription.dropped_reports, 0)
+        self.assertEqual(subscription.coalesced_reports, 1)
+        self.assertEqual(self._metric_values(subscription.reports.get_nowait()), {'a': 1, 'c': 1})
+        self.assertEqual(self._metric_values(subscription.reports.get_nowait()), {'a': 3, 'b': 2})
+
+    def test_coalesce_in_place(self):
+        mgr = GSubscriptionsManager(None, max_queue_size=2, overflow_policy=OverflowPolicy.COALESCE)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value,
+                                                 ReportAction.EpisodicContextReport.value])
+        self.mdib_version_group = MdibVersionGroup(42, 'urn:uuid:abc', 1)
+        self._send_metrics(mgr, {'a': 1, 'c': 1})
+        mgr.send_episodic_context_report([], MdibVersionGroup(43, 'urn:uuid:abc', 1))
+        self.mdib_version_group = MdibVersionGroup(44, 'urn:uuid:abc', 1)
+        self._send_metrics(mgr, {'a': 2})
+        self.assertEqual(subscription.coalesced_reports, 1)
+        # the merged report has the position and the mdib version of the older report
+        report = subscription.reports.get_nowait()
+        self.assertEqual(self._metric_values(report), {'c': 1, 'a': 2})
+        mdib_version_group_msg = get_p_attr(report.message.report.metric.abstract_metric_report.abstract_report,
+                                            'MdibVersionGroup')
+        self.assertEqual(get_p_attr(mdib_version_group_msg, 'MdibVersion').unsigned_long, 42)
+        self.assertEqual(EpisodicReportStream.FromString(report.data), report.message)
+        self.assertEqual(subscription.reports.get_nowait().addressing.action,
+                         ReportAction.EpisodicContextReport.value)
+
+    def test_disconnect(self):
+        mgr = GSubscriptionsManager(None, max_queue_size=2, overflow_policy=OverflowPolicy.DISCONNECT)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        for i in range(4):
+            self._send_metrics(mgr, {'a': i})
+        self.assertIsNotNone(subscription.end_reason)
+        self.assertEqual(subscription.dropped_reports, 3)
+        self.assertEqual(subscription.reports.get_nowait(), 'stop')
+        self.assertTrue(subscription.reports.empty())
+
+
+class TestReportDispatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        basic_logging_setup()
+        self.descr = NumericMetricDescriptorContainer('metric_handle', 'parent_handle')
+
+    def test_ordered_delivery(self):
+        mgr = GSubscriptionsManager(None, max_queue_size=0)
+
+        def send_func(states, mdib_version_group):
+            time.sleep(random.random() * 0.005)  # mapping takes different time for each transaction
+            mgr.send_episodic_metric_report(states, mdib_version_group)
+
+        dispatcher = ReportDispatcher(send_func, workers_count=4)
+        mgr.delivery_gate = dispatcher.wait_for_turn
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        dispatcher.start()
+        try:
+            for mdib_version in range(1, 51):
+                state = sc.NumericMetricStateContainer(self.descr)
+                dispatcher.dispatch([state], MdibVersionGroup(mdib_version, 'urn:uuid:abc', 1))
+        finally:
+            dispatcher.stop()
+        versions = []
+        while not subscription.reports.empty():
+            report = subscription.reports.get_nowait().message
+            versions.append(report.report.metric.abstract_metric_report.abstract_report.mdib_version_group_attr
+                            .mdib_version_attr.unsigned_long)
+        self.assertEqual(versions, list(range(1, 51)))
+
+
+class TestCoalescingWindow(unittest.TestCase):
+    def setUp(self) -> None:
+        basic_logging_setup()
+        self.descriptors = {handle: NumericMetricDescriptorContainer(handle, 'parent_handle')
+                            for handle in ('a', 'b')}
+
+    def _mk_states(self, values: dict) -> list:
+        states = []
+        for handle, value in values.items():
+            state = sc.NumericMetricStateContainer(self.descriptors[handle])
+            state.mk_metric_value()
+            state.MetricValue.Value = Decimal(value)
+            states.append(state)
+        return states
+
+    def test_coalesce_metric_states(self):
+        mgr = GSubscriptionsManager(None, coalescing_window=0.05)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        mgr.send_episodic_metric_report(self._mk_states({'a': 1, 'b': 1}), MdibVersionGroup(1, 'urn:uuid:abc', 1))
+        mgr.send_episodic_metric_report(self._mk_states({'a': 2}), MdibVersionGroup(2, 'urn:uuid:abc', 1))
+        mgr.send_episodic_metric_report(self._mk_states({'a': 3}), MdibVersionGroup(3, 'urn:uuid:abc', 1))
+        self.assertTrue(subscription.reports.empty())
+        report = subscription.reports.get(timeout=1).message  # sent by timer
+        self.assertTrue(subscription.reports.empty())
+        abstract_metric_report = report.report.metric.abstract_metric_report
+        mdib_version = abstract_metric_report.abstract_report.mdib_version_group_attr.mdib_version_attr
+        self.assertEqual(mdib_version.unsigned_long, 3)
+        values = {}
+        for p_state in abstract_metric_report.report_part[0].metric_state:
+            numeric = p_state.numeric_metric_state
+            handle = numeric.abstract_metric_state.abstract_state.descriptor_handle_attr.string
+            values[handle] = int(decimal_from_p(numeric.metric_value.value_attr))
+        self.assertEqual(values, {'a': 3, 'b': 1})
+
+    def test_other_reports_flush_pending_states(self):
+        mgr = GSubscriptionsManager(None, coalescing_window=10)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value,
+                                                 ReportAction.EpisodicContextReport.value])
+        mgr.send_episodic_metric_report(self._mk_states({'a': 1}), MdibVersionGroup(1, 'urn:uuid:abc', 1))
+        mgr.send_episodic_context_report([], MdibVersionGroup(2, 'urn:uuid:abc', 1))
+        actions = [subscription.reports.get_nowait().addressing.action for _ in range(2)]
+        self.assertEqual(actions, [ReportAction.EpisodicMetricReport.value, ReportAction.EpisodicContextReport.value])
+
+    def test_waveforms_do_not_flush_pending_states(self):
+        mgr = GSubscriptionsManager(None, coalescing_window=0.05)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value,
+                                                 ReportAction.Waveform.value])
+        rtsa_descr = RealTimeSampleArrayMetricDescriptorContainer('rtsa_handle', 'parent_handle')
+        for i in range(20):  # a metric update and a waveform every 5 ms
+            mgr.send_episodic_metric_report(self._mk_states({'a': i}), MdibVersionGroup(2 * i + 1, 'urn:uuid:abc', 1))
+            rt_state = sc.RealTimeSampleArrayMetricStateContainer(rtsa_descr)
+            rt_state.mk_metric_value()
+            rt_state.MetricValue.Samples = [Decimal(i)]
+            mgr.send_realtime_samples_report([rt_state], MdibVersionGroup(2 * i + 2, 'urn:uuid:abc', 1))
+            time.sleep(0.005)
+        mgr.flush_coalesced_reports()
+        versions = []
+        metric_values = []
+        while not subscription.reports.empty():
+            report = subscription.reports.get_nowait().message
+            if report.addressing.action == ReportAction.Waveform.value:
+                abstract_report = report.report.waveform.abstract_report
+            else:
+                abstract_metric_report = report.report.metric.abstract_metric_report
+                abstract_report = abstract_metric_report.abstract_report
+                numeric = abstract_metric_report.report_part[0].metric_state[0].numeric_metric_state
+                metric_values.append(int(decimal_from_p(numeric.metric_value.value_attr)))
+            versions.append(abstract_report.mdib_version_group_attr.mdib_version_attr.unsigned_long)
+        self.assertEqual(len(versions) - len(metric_values), 20)  # every waveform
+        self.assertLessEqual(len(metric_values), 5)  # instead of 20 if every waveform flushed the window
+        self.assertEqual(metric_values[-1], 19)
+        self.assertEqual(versions, sorted(versions))
+
+
+class TestOperationInvokedBatching(unittest.TestCase):
+    def setUp(self) -> None:
+        self.operation = SimpleNamespace(handle='op_handle')
+        self.mdib_version_group = MdibVersionGroup(42, 'urn:uuid:abc', 1)
+
+    def _invoke(self, mgr, transaction_id, states):
+        for state in states:
+            mgr.send_operation_invoked_report(self.operation, transaction_id, state, self.mdib_version_group)
+
+    @staticmethod
+    def _parts(report):
+        return [(p.invocation_info.transaction_id.unsigned_int,
+                 enum_from_p(p.invocation_info, 'invocation_state', InvocationState))
+                for p in report.operation_invoked.report_part]
+
+    def test_no_window(self):
+        mgr = GSubscriptionsManager(None)
+        subscription = mgr.on_subscribe_request([OperationInvokedAction])
+        self._invoke(mgr, 1, [InvocationState.WAIT, InvocationState.START, InvocationState.FINISHED])
+        self.assertEqual(subscription.reports.qsize(), 3)
+
+    def test_window(self):
+        mgr = GSubscriptionsManager(None, operation_invoked_window=10)
+        subscription = mgr.on_subscribe_request([OperationInvokedAction])
+        self._invoke(mgr, 1, [InvocationState.WAIT, InvocationState.START, InvocationState.FINISHED])
+        self._invoke(mgr, 2, [InvocationState.WAIT, InvocationState.START])
+        self.assertTrue(subscription.reports.empty())
+        mgr.flush_operation_invoked_reports()
+        self.assertEqual(self._parts(subscription.reports.get_nowait()),
+                         [(1, InvocationState.WAIT), (1, InvocationState.START), (1, InvocationState.FINISHED),
+                          (2, InvocationState.WAIT), (2, InvocationState.START)])
+        self.assertTrue(subscription.reports.empty())
+
+    def test_window_elapsed(self):
+        mgr = GSubscriptionsManager(None, operation_invoked_window=0.05)
+        subscription = mgr.on_subscribe_request([OperationInvokedAction])
+        self._invoke(mgr, 1, [InvocationState.WAIT, InvocationState.START, InvocationState.FINISHED])
+        report = subscription.reports.get(timeout=1)
+        self.assertEqual(len(self._parts(report)), 3)
+
+    def test_collapse_wait_start(self):
+        mgr = GSubscriptionsManager(None, operation_invoked_window=10, collapse_wait_start=True)
+        subscription = mgr.on_subscribe_request([OperationInvokedAction])
+        self._invoke(mgr, 1, [InvocationState.WAIT, InvocationState.START, InvocationState.FAILED])
+        self._invoke(mgr, 2, [InvocationState.WAIT, InvocationState.START])
+        mgr.stop()  # flushes pending invocation states
+        self.assertEqual(self._parts(subscription.reports.get_nowait()),
+                         [(1, InvocationState.FAILED), (2, InvocationState.WAIT), (2, InvocationState.START)])
+
+
+class TestWaveformBatching(unittest.TestCase):
+    def setUp(self) -> None:
+        self.descr = RealTimeSampleArrayMetricDescriptorContainer('rtsa_handle', 'parent_handle')
+
+    def _mk_waveform_state(self, first_sample, determination_time):
+        state = sc.RealTimeSampleArrayMetricStateContainer(self.descr)
+        state.mk_metric_value()
+        state.MetricValue.Samples = [Decimal(first_sample + i) for i in range(10)]
+        state.MetricValue.DeterminationTime = determination_time
+        return state
+
+    def _send_waveforms(self, mgr, count, first_version=1):
+        for i in range(count):
+            mgr.send_realtime_samples_report([self._mk_waveform_state(i * 10, 1000.0 + i)],
+                                             MdibVersionGroup(first_version + i, 'urn:uuid:abc', 1))
+
+    @staticmethod
+    def _read(report):
+        msg = EpisodicReportStream.FromString(serialize_episodic_report(report))
+        mdib_version_group_msg = get_p_attr(msg.report.waveform.abstract_report, 'MdibVersionGroup')
+        mdib_version = get_p_attr(mdib_version_group_msg, 'MdibVersion').unsigned_long
+        states = MessageReader.read_states(msg.report.waveform.state, None)
+        return mdib_version, states
+
+    def test_batch_before_other_report(self):
+        mgr = GSubscriptionsManager(None, waveform_batch_interval=10)
+        subscription = mgr.on_subscribe_request([ReportAction.Waveform.value,
+                                                 ReportAction.EpisodicContextReport.value])
+        self._send_waveforms(mgr, 3)
+        self.assertTrue(subscription.reports.empty())
+        mgr.send_episodic_context_report([], MdibVersionGroup(4, 'urn:uuid:abc', 1))
+        mdib_version, states = self._read(subscription.reports.get_nowait())
+        self.assertEqual(mdib_version, 3)  # the newest of the batch
+        samples = [sample for state in states for sample in state.MetricValue.Samples]
+        self.assertEqual(samples, [Decimal(i) for i in range(30)])
+        self.assertEqual([state.MetricValue.DeterminationTime for state in states], [1000.0, 1001.0, 1002.0])
+        self.assertEqual(subscription.reports.get_nowait().addressing.action,
+                         ReportAction.EpisodicContextReport.value)
+
+    def test_batch_message_matches_data(self):
+        for serialize_once in (True, False):
+            mgr = GSubscriptionsManager(None, waveform_batch_interval=10, serialize_once=serialize_once)
+            subscription = mgr.on_subscribe_request([ReportAction.Waveform.value])
+            self._send_waveforms(mgr, 3)
+            subscription.flush_waveforms()
+            report = subscription.reports.get_nowait()
+            self.assertEqual(EpisodicReportStream.FromString(report.data), report.message)
+            self.assertEqual(len(report.message.report.waveform.state), 3)
+
+    def test_batch_interval_elapsed(self):
+        mgr = GSubscriptionsManager(None, waveform_batch_interval=0.05)
+        subscription = mgr.on_subscribe_request([ReportAction.Waveform.value])
+        self._send_waveforms(mgr, 5)
+        mdib_version, states = self._read(subscription.reports.get(timeout=1))
+        self.assertEqual(len(states), 5)
+        self.assertTrue(subscription.reports.empty())
+
+    def test_interval_per_subscription(self):
+        mgr = GSubscriptionsManager(None)
+        batched = mgr.on_subscribe_request([ReportAction.Waveform.value])
+        batched.waveform_batch_interval = 10
+        unbatched = mgr.on_subscribe_request([ReportAction.Waveform.value])
+        self._send_waveforms(mgr, 3)
+        self.assertEqual(unbatched.reports.qsize(), 3)
+        self.assertTrue(batched.reports.empty())
+        batched.close()  # sends the batch before the end of the stream
+        self.assertEqual(len(self._read(batched.reports.get_nowait())[1]), 3)
+        self.assertEqual(batched.reports.get_nowait(), 'stop')
+
+
+def _report(action, name=None):
+    return SimpleNamespace(addressing=SimpleNamespace(action=action), name=name)
+
+
+class TestPriorityLanes(unittest.TestCase):
+    def _mk_subscription(self, **kwargs):
+        return GDevSubscription(7200, list(ReportAction) + [OperationInvokedAction], **kwargs)
+
+    @staticmethod
+    def _names(subscription):
+        ret = []
+        while not subscription.reports.empty():
+            ret.append(subscription.reports.get_nowait().name)
+        return ret
+
+    def test_alerts_before_waveforms(self):
+        subscription = self._mk_subscription(priority_lanes=True, starvation_limit=0)
+        for i in range(5):
+            subscription.send_notification_report(_report(ReportAction.Waveform.value, f'w{i}'))
+        subscription.send_notification_report(_report(ReportAction.EpisodicMetricReport.value, 'm'))
+        subscription.send_notification_report(_report(ReportAction.EpisodicAlertReport.value, 'a'))
+        subscription.send_notification_report(_report(OperationInvokedAction, 'o'))
+        self.assertEqual(self._names(subscription), ['a', 'o', 'm', 'w0', 'w1', 'w2', 'w3', 'w4'])
+        stats = subscription.get_latency_stats()
+        self.assertEqual(len(stats[ReportPriority.HIGH].values), 2)
+        self.assertEqual(len(stats[ReportPriority.NORMAL].values), 1)
+        self.assertEqual(len(stats[ReportPriority.LOW].values), 5)
+        self.assertGreaterEqual(stats[ReportPriority.LOW].max, stats[ReportPriority.HIGH].max)
+
+    def test_fifo_without_lanes(self):
+        subscription = self._mk_subscription()
+        subscription.send_notification_report(_report(ReportAction.Waveform.value, 'w'))
+        subscription.send_notification_report(_report(ReportAction.EpisodicAlertReport.value, 'a'))
+        self.assertEqual(self._names(subscription), ['w', 'a'])
+        self.assertEqual(len(subscription.get_latency_stats()[ReportPriority.NORMAL].values), 2)
+
+    def test_starvation_limit(self):
+        subscription = self._mk_subscription(priority_lanes=True, starvation_limit=2)
+        subscription.send_notification_report(_report(ReportAction.Waveform.value, 'w'))
+        for i in range(5):
+            subscription.send_notification_report(_report(ReportAction.EpisodicAlertReport.value, f'a{i}'))
+        self.assertEqual(self._names(subscription), ['a0', 'a1', 'w', 'a2', 'a3', 'a4'])
+
+    def test_overflow_drops_waveforms_first(self):
+        subscription = self._mk_subscription(priority_lanes=True, max_queue_size=3)
+        subscription.send_notification_report(_report(ReportAction.EpisodicAlertReport.value, 'a0'))
+        subscription.send_notification_report(_report(ReportAction.Waveform.value, 'w'))
+        subscription.send_notification_report(_report(ReportAction.EpisodicAlertReport.value, 'a1'))
+        subscription.send_notification_report(_report(ReportAction.EpisodicAlertReport.value, 'a2'))
+        self.assertEqual(subscription.dropped_reports, 1)
+        subscription.close()
+        self.assertEqual(self._names_until_stop(subscription), ['a0', 'a1', 'a2'])
+
+    def test_description_modification_is_barrier(self):
+        subscription = self._mk_subscription(priority_lanes=True, starvation_limit=0)
+        subscription.send_notification_report(_report(ReportAction.Waveform.value, 'w0'))
+        subscription.send_notification_report(_report(ReportAction.EpisodicMetricReport.value, 'm0'))
+        subscription.send_notification_report(_report(ReportAction.DescriptionModificationReport.value, 'd'))
+        subscription.send_notification_report(_report(ReportAction.Waveform.value, 'w1'))
+        subscription.send_notification_report(_report(ReportAction.EpisodicMetricReport.value, 'm1'))
+        subscription.send_notification_report(_report(ReportAction.EpisodicAlertReport.value, 'a'))
+        self.assertEqual(self._names(subscription), ['m0', 'w0', 'd', 'a', 'm1', 'w1'])
+
+    def test_new_descriptor_before_its_alert_state(self):
+        mgr = GSubscriptionsManager(None, priority_lanes=True)
+        subscription = mgr.on_subscribe_request([ReportAction.DescriptionModificationReport.value,
+                                                 ReportAction.EpisodicAlertReport.value])
+        descriptor = AlertConditionDescriptorContainer('alert_condition', 'alert_system')
+        state = sc.AlertConditionStateContainer(descriptor)
+        mgr.send_descriptor_updates([], [descriptor], [], [state], MdibVersionGroup(10, 'urn:uuid:abc', 1))
+        state.Presence = True
+        mgr.send_episodic_alert_report([state], MdibVersionGroup(11, 'urn:uuid:abc', 1))
+        actions = [subscription.reports.get_nowait().addressing.action for _ in range(2)]
+        self.assertEqual(actions, [ReportAction.DescriptionModificationReport.value,
+                                   ReportAction.EpisodicAlertReport.value])
+
+    @staticmethod
+    def _names_until_stop(subscription):
+        ret = []
+        while (report := subscription.reports.get_nowait()) != 'stop':
+            ret.append(report.name)
+        return ret
+
+
+class TestSubscriptionStats(unittest.TestCase):
+    def setUp(self) -> None:
+        self.descr = NumericMetricDescriptorContainer('metric_handle', 'parent_handle')
+        self.mdib_version_group = MdibVersionGroup(42, 'urn:uuid:abc', 1)
+
+    def _send_metric(self, mgr):
+        state = sc.NumericMetricStateContainer(self.descr)
+        state.mk_metric_value()
+        state.MetricValue.Value = Decimal(1)
+        mgr.send_episodic_metric_report([state], self.mdib_version_group)
+
+    def test_delivery_stats(self):
+        mgr = GSubscriptionsManager(None)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        for _ in range(3):
+            self._send_metric(mgr)
+        stats = mgr.get_subscription_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0].queue_depth, 3)
+        self.assertEqual(stats[0].delivered_reports, 0)
+        self.assertIsNone(stats[0].roundtrip.max)
+        delivered_bytes = 0
+        for _ in range(2):
+            report = subscription.reports.get_nowait()
+            time.sleep(0.01)  # grpc sends the report
+            subscription.record_delivery(report, subscription.reports.last_enqueued)
+            delivered_bytes += len(report.data)
+        stats = mgr.get_subscription_stats()[0]
+        self.assertEqual(stats.identifier, subscription.my_identifier.text)
+        self.assertEqual(stats.filter, subscription.short_filter_names())
+        self.assertEqual(stats.queue_depth, 1)
+        self.assertEqual(stats.queue_high_water_mark, 3)
+        self.assertEqual(stats.delivered_reports, 2)
+        self.assertEqual(stats.delivered_bytes, delivered_bytes)
+        self.assertEqual(len(stats.roundtrip.values), 2)
+        self.assertGreaterEqual(stats.roundtrip.min, 0.01)
+        self.assertEqual(len(stats.latency_by_priority[ReportPriority.NORMAL].values), 2)
+
+
+class TestReportStates(unittest.TestCase):
+    def test_decode_on_demand(self):
+        descriptors = [NumericMetricDescriptorContainer(f'metric_{i}', 'parent_handle') for i in range(3)]
+        mgr = GSubscriptionsManager(None)
+        subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        states = []
+        for i, descr in enumerate(descriptors):
+            state = sc.NumericMetricStateContainer(descr)
+            state.mk_metric_value()
+            state.MetricValue.Value = Decimal(i)
+            states.append(state)
+        mgr.send_episodic_metric_report(states, MdibVersionGroup(42, 'urn:uuid:abc', 1))
+        report = subscription.reports.get_nowait()
+        report_data = map_episodic_report(report.message, MessageReader(None))
+        report_states = report_data.states
+        self.assertEqual(len(report_states), 3)
+        self.assertEqual(report_states.descriptor_handles(), ['metric_0', 'metric_1', 'metric_2'])
+        self.assertEqual(report_states.decoded_count, 0)
+        metric_1 = report_states.get('metric_1')
+        self.assertEqual(len(metric_1), 1)
+        self.assertEqual(metric_1[0].MetricValue.Value, Decimal(1))
+        self.assertEqual(report_states.decoded_count, 1)
+        self.assertIs(report_states[1], metric_1[0])  # cached
+        self.assertIs(report_data.states, report_states)
+        report_data.decode_states()
+        self.assertEqual(report_states.decoded_count, 3)
+        self.assertEqual([s.DescriptorHandle for s in report_states], ['metric_0', 'metric_1', 'metric_2'])
+
+
+class TestReportHistory(unittest.TestCase):
+    metric = ReportAction.EpisodicMetricReport.value
+    alert = ReportAction.EpisodicAlertReport.value
+
+    def _append(self, history, mdib_version, action):
+        report = SerializedReport(EpisodicReportStream(), data=str(mdib_version).encode() * 10)
+        history.append(MdibVersionGroup(mdib_version, 'urn:uuid:abc', None), action, report)
+        return report
+
+    def test_reports_since_per_action(self):
+        history = ReportHistory()
+        reports = {(v, a): self._append(history, v, a) for v, a in ((1, self.metric), (2, self.alert),
+                                                                    (3, self.metric), (3, self.alert))}
+        # the alert of version 3 was not received, e.g. because it was queued behind the metric
+        resume_point = ResumePoint('urn:uuid:abc', 0, {self.metric: 3, self.alert: 2})
+        self.assertEqual(history.reports_since(resume_point, [self.metric, self.alert]), [reports[(3, self.alert)]])
+        # actions without received report start at the base mdib version
+        resume_point = ResumePoint('urn:uuid:abc', 1, {self.metric: 3})
+        self.assertEqual(history.reports_since(resume_point, [self.metric, self.alert]),
+                         [reports[(2, self.alert)], reports[(3, self.alert)]])
+        self.assertIsNone(history.reports_since(ResumePoint('urn:uuid:other', 0), [self.metric]))
+
+    def test_removed_reports(self):
+        history = ReportHistory(max_reports=2)
+        for mdib_version in range(1, 5):
+            self._append(history, mdib_version, self.metric)
+        self.assertEqual(len(history), 2)
+        self.assertIsNone(history.reports_since(ResumePoint('urn:uuid:abc', 1), [self.metric]))
+        self.assertEqual(len(history.reports_since(ResumePoint('urn:uuid:abc', 2), [self.metric])), 2)
+        history.skip(MdibVersionGroup(5, 'urn:uuid:abc', None), self.alert)
+        self.assertIsNone(history.reports_since(ResumePoint('urn:uuid:abc', 3), [self.metric, self.alert]))
+        self.assertEqual(history.reports_since(ResumePoint('urn:uuid:abc', 3), [self.metric]),
+                         history.reports_since(ResumePoint('urn:uuid:abc', 3, {self.alert: 5}),
+                                               [self.metric, self.alert]))
+
+    def test_resume_subscription(self):
+        mgr = GSubscriptionsManager(None, report_history=ReportHistory())
+        descr = NumericMetricDescriptorContainer('metric_handle', 'parent_handle')
+        state = sc.NumericMetricStateContainer(descr)
+        subscription = mgr.on_subscribe_request([self.metric])
+        self.assertEqual(subscription.base_mdib_version, -1)
+        mgr.send_episodic_metric_report([state], MdibVersionGroup(1, 'urn:uuid:abc', None))
+        subscription.reports.get_nowait()
+        mgr.remove_subscription(subscription)
+        self.assertEqual(mgr.requested_actions(), {self.metric})  # still recorded for a resume
+        mgr.send_episodic_metric_report([state], MdibVersionGroup(2, 'urn:uuid:abc', None))
+        resumed = mgr.on_subscribe_request([self.metric], ResumePoint('urn:uuid:abc', -1, {self.metric: 1}))
+        self.assertEqual(len(resumed.resumed_reports), 1)
+        self.assertEqual(resumed.base_mdib_version, 1)
+        self.assertTrue(resumed.reports.empty())
+
+    def test_unrecorded_action(self):
+        mgr = GSubscriptionsManager(None, report_history=ReportHistory())
+        descr = NumericMetricDescriptorContainer('metric_handle', 'parent_handle')
+        mgr.send_episodic_metric_report([sc.NumericMetricStateContainer(descr)],
+                                        MdibVersionGroup(1, 'urn:uuid:abc', None))
+        self.assertEqual(len(mgr.report_history), 0)  # nobody subscribed
+        self.assertEqual(mgr.requested_actions(), set())
+        subscription = mgr.on_subscribe_request([self.metric], ResumePoint('urn:uuid:abc', 0))
+        self.assertIsNone(subscription.resumed_reports)
+
+
+class TestActionIndex(unittest.TestCase):
+    def test_subscriptions_for_action(self):
+        mgr = GSubscriptionsManager(None)
+        metric_subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+        all_subscription = mgr.on_subscribe_request(list(ReportAction))
+        self.assertEqual(set(mgr._getSubscriptionsForAction(ReportAction.EpisodicMetricReport)),
+                         {metric_subscription, all_subscription})
+        self.assertEqual(mgr._getSubscriptionsForAction(ReportAction.EpisodicAlertReport), [all_subscription])
+        self.assertEqual(mgr._getSubscriptionsForAction(OperationInvokedAction), [])
+        mgr.remove_subscription(all_subscription)
+        self.assertEqual(mgr._getSubscriptionsForAction(ReportAction.EpisodicMetricReport), [metric_subscription])
+        self.assertEqual(mgr._getSubscriptionsForAction(ReportAction.EpisodicAlertReport), [])
+
+
+class TestAioSubscriptions(unittest.TestCase):
+    def test_reports_from_other_thread(self):
+        async def receive():
+            mgr = AioGSubscriptionsManager(None)
+            subscription = mgr.on_subscribe_request([ReportAction.EpisodicMetricReport.value])
+            # like a mdib transaction that is committed in another thread
+            sender = threading.Thread(target=mgr.send_episodic_metric_report,
+                                      args=([], MdibVersionGroup(1, 'urn:uuid:abc', 1)))
+            sender.start()
+            report = await asyncio.wait_for(subscription.reports.get_async(), timeout=2)
+            sender.join()
+            threading.Thread(target=mgr.stop).start()
+            stop = await asyncio.wait_for(subscription.reports.get_async(), timeout=2)
+            return report, stop
+
+        report, stop = asyncio.run(receive())
+        self.assertEqual(report.addressing.action, ReportAction.EpisodicMetricReport.value)
+        self.assertEqual(stop, 'stop')